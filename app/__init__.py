@@ -1,45 +1,79 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from config import Config
+from config import get_config
 from datetime import datetime
+from importlib import import_module
+from app.cache import Cache
+from app.routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+cache = Cache()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Пожалуйста, войдите для доступа к этой странице.'
 
-def create_app(config_class=Config):
+def create_app(config_class=None):
     app = Flask(__name__)
-    app.config.from_object(config_class)
+    app.config.from_object(config_class or get_config())
+    
+    # Реплики регистрируются как binds до инициализации db
+    from app.routing import router
+    router.init_app(app)
     
     db.init_app(app)
     login_manager.init_app(app)
+    cache.init_app(app)
+    
+    from app.hashing import hasher
+    hasher.init_app(app)
+    
+    from app.events import events
+    events.init_app(app)
+    
+    from app.scheduler import scheduler
+    scheduler.init_app(app)
+    
+    from app.heartbeats import heartbeats
+    heartbeats.init_app(app)
+    
+    from app.ipindex import ipindex
+    ipindex.init_app(app)
+    
+    from app.invalidation import bus
+    bus.init_app(app)
+    
+    from app.catalog import catalog
+    catalog.init_app(app)
+    
+    from app.fragments import fragments
+    fragments.init_app(app)
+    
+    from app.webhooks import webhooks
+    webhooks.init_app(app)
+    
+    from app.audit import audit
+    audit.init_app(app)
+    
+    from app.assets import assets
+    assets.init_app(app)
+    
+    from app.negotiation import negotiation
+    negotiation.init_app(app)
+    
+    # Регистрация blueprints: набор зависит от профиля узла
+    prefixes = {'auth': None, 'main': None, 'api': '/api/v1', 'admin': '/admin'}
+    for name in app.config.get('BLUEPRINTS', tuple(prefixes)):
+        module = import_module(f'app.routes.{name}')
+        app.register_blueprint(module.bp, url_prefix=prefixes[name])
+    
+    # Фоновые задачи и CLI-команды
+    from app import jobs  # noqa: F401
+    from app.cli import register_commands
+    register_commands(app)
     
-    # Регистрация blueprints
-    from app.routes.auth import bp as auth_bp
-    from app.routes.main import bp as main_bp
-    from app.routes.api import bp as api_bp
-    from app.routes.admin import bp as admin_bp
-    
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(main_bp)
-    app.register_blueprint(api_bp, url_prefix='/api/v1')
-    app.register_blueprint(admin_bp, url_prefix='/admin')
-    
-    with app.app_context():
-        db.create_all()
-        # Создаем первого администратора если его нет
-        from app.models import User
-        if User.query.first() is None:
-            admin = User(
-                username='admin',
-                email='admin@example.com',
-                is_admin=True
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
+    # Схема и первый администратор создаются командой flask init-db:
+    # фабрика не обращается к БД, воркеры стартуют без DDL
     
     @app.template_filter('timeago')
     def timeago_filter(dt):
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import request, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import send_file
+from werkzeug.wrappers import Request
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: будут только gzip-варианты
+    brotli = None
+
+MANIFEST = 'manifest.json'
+# Сжимать имеет смысл только текстовые форматы
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class Assets:
+    """Статика с отпечатками содержимого в именах.
+
+    flask assets build копирует файлы static/ в ASSETS_DIST_DIR под
+    именами вида style.<hash>.css, рядом кладет .gz/.br и manifest.json.
+    asset_url() в шаблонах отдает адрес по манифесту, а такие файлы
+    отдаются WSGI-слоем до Flask с Cache-Control: immutable - браузер не
+    перепроверяет их до смены содержимого. Без сборки asset_url() ведет
+    на обычный static.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.files = frozenset()
+        self.dist_dir = None
+        self.prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('ASSETS_URL_PREFIX', '/assets')
+        app.config.setdefault('ASSETS_MAX_AGE', 31536000)
+        app.extensions['assets'] = self
+        self.dist_dir = app.config['ASSETS_DIST_DIR']
+        self.prefix = app.config['ASSETS_URL_PREFIX'].rstrip('/')
+        self.set_manifest(self.load_manifest())
+        app.wsgi_app = AssetsMiddleware(app.wsgi_app, self, self.prefix, app.config['ASSETS_MAX_AGE'])
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def set_manifest(self, manifest):
+        self.manifest = manifest
+        self.files = frozenset(manifest.values())
+
+    def url(self, filename):
+        fingerprinted = self.manifest.get(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename)
+        return f"{request.script_root}{self.prefix}/{fingerprinted}"
+
+    def build(self, static_dir):
+        """Собрать dist: файлы с хэшем в имени, сжатые варианты и манифест"""
+        if os.path.isdir(self.dist_dir):
+            shutil.rmtree(self.dist_dir)
+        manifest = {}
+        for root, dirs, files in os.walk(static_dir):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.dist_dir]
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                relative = os.path.relpath(source, static_dir).replace(os.sep, '/')
+                with open(source, 'rb') as f:
+                    data = f.read()
+                stem, ext = os.path.splitext(relative)
+                fingerprinted = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+                target = os.path.join(self.dist_dir, fingerprinted)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(data)
+                if ext in COMPRESSIBLE:
+                    with open(target + '.gz', 'wb') as f:
+                        f.write(gzip.compress(data, 9, mtime=0))
+                    if brotli is not None:
+                        with open(target + '.br', 'wb') as f:
+                            f.write(brotli.compress(data, quality=11))
+                manifest[relative] = fingerprinted
+        with open(os.path.join(self.dist_dir, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        self.set_manifest(manifest)
+        return manifest
+
+
+class AssetsMiddleware:
+    """Отдача собранной статики до Flask: без сессии, cookie и хуков запроса"""
+
+    def __init__(self, wsgi_app, assets, prefix, max_age):
+        self.wsgi_app = wsgi_app
+        self.assets = assets
+        self.prefix = prefix.rstrip('/') + '/'
+        self.max_age = max_age
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix):
+            return self.wsgi_app(environ, start_response)
+        return self.serve(environ, path[len(self.prefix):])(environ, start_response)
+
+    def serve(self, environ, filename):
+        if filename not in self.assets.files:
+            return NotFound()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = Request(environ).accept_encodings
+        encoding, served = None, filename
+        for name, suffix in ENCODINGS:
+            if accepted[name] and os.path.exists(os.path.join(self.assets.dist_dir, filename + suffix)):
+                encoding, served = name, filename + suffix
+                break
+        response = send_file(os.path.join(self.assets.dist_dir, served), environ,
+                             mimetype=mimetype, max_age=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        return response
+
+
+assets = Assets()
@@ -0,0 +1,149 @@
+import atexit
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from flask_login import current_user
+
+
+class AuditBuffer:
+    """Журнал аудита с буферизованной записью в audit_log.
+
+    record() только добавляет запись в кольцевой буфер в памяти: действие
+    администратора не ждет INSERT. Буфер сбрасывается одним пакетным
+    INSERT фоновым потоком раз в AUDIT_FLUSH_INTERVAL секунд, при
+    заполнении на AUDIT_BUFFER_SIZE записей (сброс в вызывающем потоке,
+    записи не перезаписываются) и при остановке процесса.
+    Записи журнала только добавляются: изменение и удаление запрещают
+    слушатели ORM, а в SQLite и PostgreSQL еще и триггеры БД (install(),
+    вызывается из flask init-db), так что запрет действует и для Core
+    update()/delete() и для прямого SQL.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 2)
+        app.config.setdefault('AUDIT_BUFFER_SIZE', 1000)
+        app.extensions['audit'] = self
+        self._app = app
+        self._entries = deque(maxlen=app.config['AUDIT_BUFFER_SIZE'])
+        atexit.register(self.flush)
+
+    def record(self, action, target_type, target_id=None, **details):
+        """Записать действие текущего пользователя над объектом target_type #target_id"""
+        actor_id = actor = ip = None
+        if has_request_context():
+            ip = request.remote_addr
+            if current_user.is_authenticated:
+                actor_id, actor = current_user.id, current_user.username
+        entry = {
+            'created_at': datetime.utcnow(), 'actor_id': actor_id, 'actor': actor, 'ip': ip,
+            'action': action, 'target_type': target_type, 'target_id': target_id,
+            'details': json.dumps(details, ensure_ascii=False, default=str) if details else None,
+        }
+        with self._lock:
+            full = len(self._entries) == self._entries.maxlen
+            if not full:
+                self._entries.append(entry)
+            self._ensure_started()
+        if full:
+            # Буфер заполнен: сбрасываем в текущем потоке, чтобы не затереть записи
+            self.flush()
+            with self._lock:
+                if len(self._entries) == self._entries.maxlen:
+                    # БД недоступна и буфер снова полон: самая старая запись
+                    # вытесняется, ее содержимое остается хотя бы в логе
+                    self._app.logger.error('Буфер аудита переполнен, запись потеряна: %s',
+                                           json.dumps(self._entries[0], ensure_ascii=False, default=str))
+                self._entries.append(entry)
+        elif len(self._entries) >= self._entries.maxlen // 2:
+            self._wakeup.set()
+
+    def install(self):
+        """Триггеры БД, запрещающие UPDATE и DELETE в audit_log (идемпотентно)"""
+        from sqlalchemy import text
+        from app import db
+
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            statements = [
+                f"CREATE TRIGGER IF NOT EXISTS audit_log_no_{op.lower()} BEFORE {op} ON audit_log "
+                f"BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+                for op in ('UPDATE', 'DELETE')
+            ]
+        elif engine.dialect.name == 'postgresql':
+            statements = [
+                "CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger AS $$ "
+                "BEGIN RAISE EXCEPTION 'audit_log is append-only'; END $$ LANGUAGE plpgsql",
+                "DROP TRIGGER IF EXISTS audit_log_append_only ON audit_log",
+                "CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log "
+                "FOR EACH ROW EXECUTE FUNCTION audit_log_append_only()",
+                "DROP TRIGGER IF EXISTS audit_log_no_truncate ON audit_log",
+                "CREATE TRIGGER audit_log_no_truncate BEFORE TRUNCATE ON audit_log "
+                "FOR EACH STATEMENT EXECUTE FUNCTION audit_log_append_only()",
+            ]
+        else:
+            return
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def flush(self):
+        """Записать накопленные записи одним пакетным INSERT"""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._entries)
+                self._entries.clear()
+            if not rows:
+                return 0
+
+            from sqlalchemy import insert
+            from app import db
+            from app.models import AuditLog
+
+            with self._app.app_context():
+                try:
+                    db.session.execute(insert(AuditLog), rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Записи возвращаются в начало буфера, сколько поместится
+                    with self._lock:
+                        keep = rows[:max(0, self._entries.maxlen - len(self._entries))]
+                        self._entries.extendleft(reversed(keep))
+                    self._app.logger.exception('Не удалось записать %d записей аудита, потеряно %d',
+                                               len(rows), len(rows) - len(keep))
+                    return 0
+                finally:
+                    db.session.remove()
+            return len(rows)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='audit-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['AUDIT_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+
+
+audit = AuditBuffer()
@@ -0,0 +1,366 @@
+import pickle
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+MISSING = object()
+# Ответ add, когда демон кэша недоступен: блокировку никто не держит
+UNAVAILABLE = object()
+
+_HEADER = struct.Struct('!I')
+
+
+class MemoryBackend:
+    """LRU-кэш в памяти процесса с TTL на запись"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            if entry is None:
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Записать, только если ключа нет (для блокировок single-flight)"""
+        with self._lock:
+            if self._alive(key, time.monotonic()) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def incr(self, key, delta=1, ttl=None):
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            value = (entry[1] if entry is not None else 0) + delta
+            self._store(key, value, ttl)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def delete_if(self, key, value):
+        """Удалить ключ, только если в нем все еще value (снятие своей блокировки)"""
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            if entry is None or entry[1] != value:
+                return False
+            del self._data[key]
+            return True
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            keys = [key for key in self._data if key.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SocketBackend:
+    """Клиент общего демона кэша (app/cache_server.py) через Unix-сокет.
+
+    Одно соединение на поток. При недоступности демона кэш работает
+    как промах (fail-open), чтобы не ронять запросы.
+    """
+
+    def __init__(self, path, timeout=1.0, logger=None):
+        self.path = path
+        self.timeout = timeout
+        self.logger = logger
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, op, *args, default=None):
+        try:
+            conn = self._connection()
+            send_message(conn, (op, args))
+            return recv_message(conn)
+        except (OSError, EOFError, pickle.PickleError) as e:
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+                self._local.conn = None
+            if self.logger:
+                self.logger.warning('Демон кэша недоступен (%s): %s', self.path, e)
+            return default
+
+    def get(self, key):
+        value = self._call('get', key)
+        return MISSING if value is None else value[0]
+
+    def get_many(self, keys):
+        values = self._call('get_many', keys)
+        if values is None:
+            return [MISSING] * len(keys)
+        return [MISSING if value is None else value[0] for value in values]
+
+    def set(self, key, value, ttl=None):
+        self._call('set', key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        added = self._call('add', key, value, ttl, default=UNAVAILABLE)
+        return added if added is UNAVAILABLE else bool(added)
+
+    def incr(self, key, delta=1, ttl=None):
+        return self._call('incr', key, delta, ttl)
+
+    def delete(self, key):
+        return bool(self._call('delete', key, default=False))
+
+    def delete_if(self, key, value):
+        return bool(self._call('delete_if', key, value, default=False))
+
+    def delete_prefix(self, prefix):
+        return self._call('delete_prefix', prefix, default=0)
+
+    def clear(self):
+        self._call('clear')
+
+    def server_stats(self):
+        """Метрики демона по всем воркерам или None, если демон недоступен"""
+        return self._call('stats')
+
+
+def send_message(conn, obj):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    conn.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(conn):
+    header = _recv_exact(conn, _HEADER.size)
+    return pickle.loads(_recv_exact(conn, _HEADER.unpack(header)[0]))
+
+
+def _recv_exact(conn, size):
+    chunks = []
+    while size:
+        chunk = conn.recv(size)
+        if not chunk:
+            raise EOFError('соединение закрыто')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class Namespace:
+    """Пространство имен кэша: префикс ключей, TTL по умолчанию и метрики"""
+
+    def __init__(self, cache, name, ttl=None):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def key(self, key):
+        return f"{self.name}:{key}"
+
+    def _ttl(self, ttl):
+        if ttl is not None:
+            return ttl
+        return self.ttl if self.ttl is not None else self.cache.default_ttl
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, key, default=None):
+        value = self.cache.backend.get(self.key(key))
+        self._count(value is not MISSING)
+        return default if value is MISSING else value
+
+    def get_many(self, keys):
+        values = self.cache.backend.get_many([self.key(key) for key in keys])
+        result = {}
+        for key, value in zip(keys, values):
+            self._count(value is not MISSING)
+            if value is not MISSING:
+                result[key] = value
+        return result
+
+    def set(self, key, value, ttl=None):
+        self.cache.backend.set(self.key(key), value, self._ttl(ttl))
+
+    def incr(self, key, delta=1, ttl=None):
+        return self.cache.backend.incr(self.key(key), delta, self._ttl(ttl))
+
+    def delete(self, key):
+        return self.cache.backend.delete(self.key(key))
+
+    def clear(self):
+        return self.cache.backend.delete_prefix(f"{self.name}:")
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Значение из кэша или однократный пересчет (single-flight).
+
+        Внутри процесса пересчет выполняет один поток на ключ; между
+        процессами очередность задает блокировка add() в общем бэкенде.
+        """
+        full_key = self.key(key)
+        value = self.cache.backend.get(full_key)
+        if value is not MISSING:
+            self._count(True)
+            return value
+        self._count(False)
+
+        with self._key_lock(full_key) as lock:
+            with lock:
+                value = self.cache.backend.get(full_key)
+                if value is not MISSING:
+                    return value
+                return self._compute_shared(full_key, compute, ttl)
+
+    def _compute_shared(self, full_key, compute, ttl):
+        backend = self.cache.backend
+        lock_key = f"lock:{full_key}"
+        lock_timeout = self.cache.lock_timeout
+        # Уникальный токен: снимаем только свою блокировку, а не взятую
+        # другим процессом после истечения нашей по таймауту
+        token = uuid.uuid4().hex
+        acquired = backend.add(lock_key, token, lock_timeout)
+        if acquired is False:
+            # Пересчет уже идет в другом процессе: ждем результат, пока
+            # блокировку держат; освободилась без значения - считаем сами
+            deadline = time.monotonic() + lock_timeout
+            while acquired is False and time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = backend.get(full_key)
+                if value is not MISSING:
+                    return value
+                acquired = backend.add(lock_key, token, lock_timeout)
+        if acquired is UNAVAILABLE:
+            # Демон недоступен (fail-open): считаем сразу, без кэша
+            return compute()
+        try:
+            value = compute()
+            backend.set(full_key, value, self._ttl(ttl))
+            return value
+        finally:
+            backend.delete_if(lock_key, token)
+
+    def _key_lock(self, full_key):
+        return _KeyLock(self, full_key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class _KeyLock:
+    """Блокировка на ключ со счетчиком ссылок, чтобы словарь не рос"""
+
+    def __init__(self, namespace, key):
+        self.namespace = namespace
+        self.key = key
+
+    def __enter__(self):
+        with self.namespace._locks_guard:
+            entry = self.namespace._locks.setdefault(self.key, [threading.Lock(), 0])
+            entry[1] += 1
+        return entry[0]
+
+    def __exit__(self, *exc):
+        with self.namespace._locks_guard:
+            entry = self.namespace._locks[self.key]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.namespace._locks[self.key]
+
+
+class Cache:
+    """Кэш приложения с подключаемым бэкендом.
+
+    CACHE_BACKEND = 'memory' (LRU в процессе) или 'socket' (общий демон
+    на Unix-сокете, запускается командой flask cache serve).
+    """
+
+    def __init__(self, app=None):
+        self.backend = MemoryBackend()
+        self.default_ttl = 300
+        self.lock_timeout = 10
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('CACHE_LOCK_TIMEOUT', 10)
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.lock_timeout = app.config['CACHE_LOCK_TIMEOUT']
+
+        backend = app.config['CACHE_BACKEND']
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif backend == 'socket':
+            self.backend = SocketBackend(app.config['CACHE_SOCKET_PATH'], logger=app.logger)
+        else:
+            raise ValueError(f"Неизвестный CACHE_BACKEND: {backend}")
+        app.extensions['cache'] = self
+
+    def namespace(self, name, ttl=None):
+        with self._lock:
+            namespace = self._namespaces.get(name)
+            if namespace is None:
+                namespace = self._namespaces[name] = Namespace(self, name, ttl)
+            return namespace
+
+    def stats(self):
+        with self._lock:
+            return {name: namespace.stats() for name, namespace in sorted(self._namespaces.items())}
@@ -0,0 +1,89 @@
+"""Демон общего кэша на Unix-сокете для SocketBackend.
+
+Один процесс на хост обслуживает все воркеры gunicorn, поэтому данные
+в кэше не дублируются и согласованы между воркерами.
+
+    flask cache serve
+    python -m app.cache_server --socket /tmp/licensepro-cache.sock
+"""
+import argparse
+import os
+import socketserver
+import stat
+import threading
+
+from app.cache import MemoryBackend, MISSING, send_message, recv_message
+
+
+class CacheRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        backend = self.server.backend
+        while True:
+            try:
+                op, args = recv_message(self.request)
+            except (EOFError, OSError):
+                return
+            if op == 'get':
+                value = backend.get(*args)
+                self.server.count(args[0], value is not MISSING)
+                result = None if value is MISSING else (value,)
+            elif op == 'get_many':
+                values = backend.get_many(*args)
+                for key, value in zip(args[0], values):
+                    self.server.count(key, value is not MISSING)
+                result = [None if value is MISSING else (value,) for value in values]
+            elif op in ('set', 'add', 'incr', 'delete', 'delete_if', 'delete_prefix', 'clear'):
+                result = getattr(backend, op)(*args)
+            elif op == 'stats':
+                result = self.server.stats()
+            else:
+                result = None
+            send_message(self.request, result)
+
+
+class CacheServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, max_entries=100000):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        self.backend = MemoryBackend(max_entries)
+        # Попадания и промахи всех воркеров по пространствам имен
+        self.counters = {}
+        self._counters_lock = threading.Lock()
+        super().__init__(path, CacheRequestHandler)
+        # Доступ только владельцу: в сокет передаются pickle-данные
+        os.chmod(path, 0o600)
+
+    def count(self, key, hit):
+        name = str(key).split(':', 1)[0]
+        with self._counters_lock:
+            counter = self.counters.setdefault(name, [0, 0])
+            counter[0 if hit else 1] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            namespaces = {name: {'hits': hits, 'misses': misses}
+                          for name, (hits, misses) in sorted(self.counters.items())}
+        return {'entries': len(self.backend), 'namespaces': namespaces}
+
+
+def serve(path, max_entries=100000):
+    with CacheServer(path, max_entries) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Демон общего кэша LicensePro')
+    parser.add_argument('--socket', default=os.environ.get('CACHE_SOCKET_PATH', '/tmp/licensepro-cache.sock'))
+    parser.add_argument('--max-entries', type=int, default=int(os.environ.get('CACHE_MAX_ENTRIES', 100000)))
+    args = parser.parse_args()
+    print(f"Кэш слушает {args.socket}")
+    serve(args.socket, args.max_entries)
+
+
+if __name__ == '__main__':
+    main()
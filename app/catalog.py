@@ -0,0 +1,141 @@
+import threading
+import time
+import zlib
+from collections import namedtuple
+from sqlalchemy import select
+from app import db
+
+PRODUCT_FIELDS = ('id', 'name', 'description', 'is_active', 'created_at')
+TARIFF_FIELDS = ('id', 'product_id', 'name', 'description', 'price', 'period_days',
+                 'max_devices', 'device_inactivity_days', 'key_prefix', 'is_active')
+
+# Неизменяемые записи снимка; имена полей совпадают с моделями,
+# поэтому шаблоны работают с ними так же, как с Product/Tariff
+ProductInfo = namedtuple('ProductInfo', PRODUCT_FIELDS)
+TariffInfo = namedtuple('TariffInfo', TARIFF_FIELDS + ('product',))
+
+# Не чаще раза в столько секунд снимок перечитывается из-за id, которого в нем нет
+MISS_RELOAD_INTERVAL = 1.0
+
+
+class CatalogSnapshot:
+    """Снимок продуктов и тарифов; после создания не изменяется"""
+
+    def __init__(self, version, products, tariffs):
+        self.version = version
+        # Штамп содержимого: одинаков во всех воркерах для одних и тех же данных
+        self.stamp = zlib.crc32(repr((products, tariffs)).encode())
+        self.loaded_at = time.time()
+        self.products = {product.id: product for product in products}
+        self.tariffs = {tariff.id: tariff for tariff in tariffs}
+        by_product = {}
+        for tariff in tariffs:
+            by_product.setdefault(tariff.product_id, []).append(tariff)
+        self._by_product = {key: tuple(value) for key, value in by_product.items()}
+
+    def product(self, product_id):
+        return self.products.get(product_id)
+
+    def tariff(self, tariff_id):
+        return self.tariffs.get(tariff_id)
+
+    def active_products(self):
+        return [product for product in self.products.values() if product.is_active]
+
+    def all_tariffs(self):
+        return list(self.tariffs.values())
+
+    def tariffs_for(self, product_id, active_only=True):
+        tariffs = self._by_product.get(product_id, ())
+        return [tariff for tariff in tariffs if tariff.is_active or not active_only]
+
+
+class Catalog:
+    """Каталог продуктов и тарифов в памяти воркера.
+
+    Снимок загружается при первом обращении в воркере (после fork он
+    сбрасывается, см. app/server.py) и заменяется целиком: изменения Product/Tariff приходят через шину
+    инвалидации, после чего следующее обращение загружает новую версию.
+    Читатели всегда видят согласованный снимок.
+    """
+
+    def __init__(self, app=None):
+        self._snapshot = None
+        self._version = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.invalidation import bus
+        app.extensions['catalog'] = self
+        bus.on('product', self.invalidate)
+        bus.on('tariff', self.invalidate)
+
+    def tariff(self, tariff_id):
+        """Тариф по id; если его нет в снимке, снимок перечитывается"""
+        return self._lookup('tariff', tariff_id)
+
+    def product(self, product_id):
+        """Продукт по id; если его нет в снимке, снимок перечитывается"""
+        return self._lookup('product', product_id)
+
+    def _lookup(self, kind, ident):
+        snapshot = self.snapshot
+        found = getattr(snapshot, kind)(ident)
+        # Объект мог появиться после сборки снимка, а сообщение шины еще
+        # не дошло: перечитываем, но не чаще раза в MISS_RELOAD_INTERVAL
+        if found is None and ident is not None and time.time() - snapshot.loaded_at >= MISS_RELOAD_INTERVAL:
+            if self._snapshot is snapshot:
+                self.invalidate()
+            found = getattr(self.snapshot, kind)(ident)
+        return found
+
+    @property
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.load()
+        return snapshot
+
+    def load(self):
+        """Загрузить новый снимок двумя запросами и атомарно подменить текущий.
+
+        Читается всегда основная БД, а не сессия запроса: снимок с
+        отстающей реплики жил бы до следующей инвалидации.
+        """
+        from app.models import Product, Tariff
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            with db.engine.connect() as conn:
+                products = [
+                    ProductInfo(*row)
+                    for row in conn.execute(
+                        select(*(getattr(Product, field) for field in PRODUCT_FIELDS)).order_by(Product.id)
+                    )
+                ]
+                by_id = {product.id: product for product in products}
+                tariffs = [
+                    TariffInfo(*row, product=by_id.get(row.product_id))
+                    for row in conn.execute(
+                        select(*(getattr(Tariff, field) for field in TARIFF_FIELDS)).order_by(Tariff.id)
+                    )
+                ]
+            self._version += 1
+            self.loads += 1
+            snapshot = CatalogSnapshot(self._version, products, tariffs)
+            # Каталог изменился во время загрузки: снимок отдаем, но не сохраняем
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self, ids=None):
+        self._generation += 1
+        self._snapshot = None
+
+
+catalog = Catalog()
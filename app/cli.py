@@ -0,0 +1,273 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from app.scheduler import scheduler
+
+scheduler_cli = AppGroup('scheduler', help='Фоновые задачи')
+cache_cli = AppGroup('cache', help='Общий кэш')
+assets_cli = AppGroup('assets', help='Статические файлы')
+webhooks_cli = AppGroup('webhooks', help='Вебхуки для интеграторов')
+search_cli = AppGroup('search', help='Поиск в админке')
+
+
+# Колонки, добавленные к уже существующим таблицам: create_all их не
+# создает. (таблица, колонка, определение для ALTER TABLE ... ADD COLUMN)
+SCHEMA_UPGRADES = (
+    ('license', 'expired_at', 'TIMESTAMP'),
+    ('license', 'expiry_notified_at', 'TIMESTAMP'),
+    ('tariff', 'device_inactivity_days', 'INTEGER NOT NULL DEFAULT 0'),
+    ('user', 'session_version', 'INTEGER NOT NULL DEFAULT 0'),
+)
+# Денежные колонки, бывшие Float: в PostgreSQL переводятся в NUMERIC(12, 2).
+# SQLite тип колонки не меняет, а значения читаются как Decimal с округлением
+MONEY_COLUMNS = (
+    ('user', 'balance'),
+    ('tariff', 'price'),
+    ('balance_history', 'amount'),
+    ('balance_history', 'balance_after'),
+)
+# Индексы существующих таблиц, которые create_all тоже не создает
+UPGRADE_INDEXES = ('ix_license_active_valid_until', 'ix_device_license_last_seen',
+                   'uq_device_heartbeat_device_ts')
+
+
+def upgrade_schema():
+    """Добавить недостающие колонки и индексы существующих таблиц (идемпотентно)"""
+    from sqlalchemy import Float, inspect, text
+    from app import db
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table, column, ddl in SCHEMA_UPGRADES:
+            if column not in {info['name'] for info in inspector.get_columns(table)}:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+                added.append(f'{table}.{column}')
+        if db.engine.dialect.name == 'postgresql':
+            for table, column in MONEY_COLUMNS:
+                info = {info['name']: info for info in inspector.get_columns(table)}[column]
+                if not isinstance(info['type'], Float):
+                    continue
+                conn.execute(text(
+                    f'ALTER TABLE "{table}" ALTER COLUMN {column} TYPE NUMERIC(12, 2) '
+                    f'USING round({column}::numeric, 2)'
+                ))
+                if info['nullable'] and not db.metadata.tables[table].c[column].nullable:
+                    conn.execute(text(f'UPDATE "{table}" SET {column} = 0 WHERE {column} IS NULL'))
+                    conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN {column} SET NOT NULL'))
+                added.append(f'{table}.{column} NUMERIC(12, 2)')
+        heartbeat_indexes = {info['name'] for info in inspector.get_indexes('device_heartbeat')}
+        if 'uq_device_heartbeat_device_ts' not in heartbeat_indexes:
+            # Уникальный индекс не создастся поверх повторов одного окна
+            conn.execute(text(
+                'DELETE FROM device_heartbeat WHERE id NOT IN '
+                '(SELECT min(id) FROM device_heartbeat GROUP BY device_id, ts)'
+            ))
+        for table in db.metadata.tables.values():
+            for index in table.indexes:
+                if index.name in UPGRADE_INDEXES:
+                    index.create(conn, checkfirst=True)
+    return added
+
+
+def init_db(create_admin=True):
+    """Создать недостающие таблицы, колонки и первого администратора (идемпотентно)"""
+    from app import db, search
+    from app.audit import audit
+    from app.models import User
+    db.create_all()
+    upgrade_schema()
+    search.install()
+    audit.install()
+    if create_admin and User.query.first() is None:
+        admin = User(
+            username='admin',
+            email='admin@example.com',
+            is_admin=True
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        return admin
+    return None
+
+
+@click.command('init-db')
+@click.option('--no-admin', is_flag=True, help='Не создавать администратора по умолчанию')
+@with_appcontext
+def init_db_command(no_admin):
+    """Создать схему БД и администратора admin/admin123, если пользователей нет"""
+    admin = init_db(create_admin=not no_admin)
+    click.echo('Схема БД готова')
+    if admin is not None:
+        click.echo('Создан администратор admin (пароль admin123 - смените его)')
+
+
+@click.command('create-admin')
+@click.argument('username')
+@click.argument('email')
+@click.password_option()
+@with_appcontext
+def create_admin_command(username, email, password):
+    """Создать администратора или выдать права существующему пользователю"""
+    from app import db
+    from app.models import User
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, email=email)
+        db.session.add(user)
+    user.is_admin = True
+    user.set_password(password)
+    db.session.commit()
+    click.echo(f"Администратор {username} готов")
+
+
+@scheduler_cli.command('run')
+def scheduler_run():
+    """Запустить планировщик в текущем процессе"""
+    click.echo(f"Задачи: {', '.join(scheduler.jobs)}")
+    scheduler.run_forever()
+
+
+@scheduler_cli.command('run-once')
+@click.argument('name')
+def scheduler_run_once(name):
+    """Выполнить одну задачу и выйти"""
+    if name not in scheduler.jobs:
+        raise click.BadParameter(f"Неизвестная задача. Доступны: {', '.join(scheduler.jobs)}")
+    click.echo(f"{name}: {scheduler.run_job(name)}")
+
+
+@cache_cli.command('serve')
+@with_appcontext
+def cache_serve():
+    """Запустить демон общего кэша на Unix-сокете"""
+    from app.cache_server import serve
+    path = current_app.config['CACHE_SOCKET_PATH']
+    click.echo(f"Кэш слушает {path}")
+    serve(path, current_app.config['CACHE_MAX_ENTRIES'])
+
+
+@cache_cli.command('stats')
+def cache_stats():
+    """Показать метрики попаданий кэша.
+
+    С CACHE_BACKEND=socket метрики берутся из демона и охватывают все
+    воркеры. С memory у каждого воркера свой кэш и свои счетчики, а
+    команда видит только собственный процесс CLI.
+    """
+    from app import cache
+    from app.cache import SocketBackend
+    if isinstance(cache.backend, SocketBackend):
+        stats = cache.backend.server_stats()
+        if stats is None:
+            raise click.ClickException('Демон кэша недоступен')
+        click.echo(f"Записей в демоне: {stats['entries']}")
+        for name, counter in stats['namespaces'].items():
+            total = counter['hits'] + counter['misses']
+            rate = counter['hits'] / total if total else 0.0
+            click.echo(f"{name}: {counter['hits']} попаданий, {counter['misses']} промахов ({rate:.1%})")
+        return
+    click.echo('CACHE_BACKEND=memory: счетчики только этого процесса, не воркеров сервера')
+    for name, stats in cache.stats().items():
+        click.echo(f"{name}: {stats['hits']} попаданий, {stats['misses']} промахов ({stats['hit_rate']:.1%})")
+
+
+@assets_cli.command('build')
+@with_appcontext
+def assets_build():
+    """Собрать статику с отпечатками и сжатыми вариантами"""
+    from app.assets import assets, brotli
+    manifest = assets.build(current_app.static_folder)
+    click.echo(f"Собрано файлов: {len(manifest)} -> {assets.dist_dir}")
+    if brotli is None:
+        click.echo('brotli не установлен: собраны только gzip-варианты')
+
+
+@search_cli.command('rebuild')
+@with_appcontext
+def search_rebuild():
+    """Перестроить индекс поиска (SQLite FTS5) из таблиц"""
+    from app import search
+    search.install()
+    click.echo(f"Записей в индексе: {search.rebuild()}")
+
+
+@webhooks_cli.command('add')
+@click.argument('url')
+@click.option('--user', 'username', help='Только лицензии пользователя (по умолчанию - все)')
+@click.option('--events', default='*', help='События через запятую или *')
+@with_appcontext
+def webhooks_add(url, username, events):
+    """Добавить адрес доставки и показать его секрет подписи"""
+    from app import db
+    from app.models import User, WebhookEndpoint
+    from app.webhooks import EVENTS
+    unknown = set(events.split(',')) - set(EVENTS) - {'*'}
+    if unknown:
+        raise click.BadParameter(f"Неизвестные события: {', '.join(sorted(unknown))}. Доступны: {', '.join(EVENTS)}")
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.BadParameter(f"Пользователь {username} не найден")
+        user_id = user.id
+    endpoint = WebhookEndpoint(url=url, user_id=user_id, events=events)
+    db.session.add(endpoint)
+    db.session.commit()
+    click.echo(f"Адрес #{endpoint.id} добавлен, секрет подписи: {endpoint.secret}")
+
+
+@webhooks_cli.command('deliver')
+@with_appcontext
+def webhooks_deliver():
+    """Выполнить один проход доставки"""
+    from app.webhooks import webhooks
+    click.echo(f"Доставлено: {webhooks.deliver_pending()}")
+
+
+@webhooks_cli.command('dead')
+@click.option('--limit', default=20)
+@with_appcontext
+def webhooks_dead(limit):
+    """Показать недоставленные события (dead-letter)"""
+    from app.models import WebhookDelivery
+    rows = WebhookDelivery.query.filter_by(status='dead').order_by(WebhookDelivery.id.desc()).limit(limit)
+    for row in rows:
+        click.echo(f"#{row.id} адрес {row.endpoint_id} {row.event} попыток {row.attempts}: {row.last_error}")
+
+
+@webhooks_cli.command('retry')
+@click.option('--endpoint', 'endpoint_id', type=int, help='Только для адреса')
+@with_appcontext
+def webhooks_retry(endpoint_id):
+    """Вернуть события из dead-letter в очередь"""
+    from app.webhooks import webhooks
+    click.echo(f"Возвращено в очередь: {webhooks.requeue_dead(endpoint_id)}")
+
+
+@webhooks_cli.command('receiver')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8765)
+@click.option('--secret', help='Проверять подпись этим секретом')
+@click.option('--fail-rate', default=0.0, help='Доля ответов 503 для проверки повторов')
+def webhooks_receiver(host, port, secret, fail_rate):
+    """Локальный приемник вебхуков для отладки интеграции"""
+    from app.webhooks import make_receiver
+    server = make_receiver(host, port, secret, fail_rate, out=click.echo)
+    click.echo(f"Приемник слушает http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(create_admin_command)
+    app.cli.add_command(scheduler_cli)
+    app.cli.add_command(cache_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(search_cli)
@@ -0,0 +1,229 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class EventPublisher:
+    """Общий для воркера издатель событий для SSE.
+
+    Один фоновый поток опрашивает БД (новые уведомления и изменения
+    last_seen устройств) и раздает готовые события подписчикам по user_id,
+    поэтому стоимость не зависит от числа открытых вкладок.
+
+    Уведомления идут с id: равным Notification.id. Транзакции фиксируются
+    не по порядку id, поэтому каждый опрос перечитывает последние
+    EVENTS_BACKFILL_OVERLAP id и пропускает уже отправленные, а при
+    переподключении с Last-Event-ID поток дослает уведомления из того же
+    окна (клиент отбрасывает повторы по id). Активность устройств так же
+    перечитывается за последние EVENTS_DEVICE_OVERLAP секунд last_seen с
+    пропуском уже отправленных пар (устройство, last_seen).
+
+    Каждое соединение занимает поток воркера gthread на все время жизни,
+    поэтому их число на воркер ограничено EVENTS_MAX_STREAMS (по умолчанию
+    половина SERVER_THREADS): остальные получают retry и переподключаются
+    позже, не вытесняя обычные запросы.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_notification_id = None
+        self._sent_notifications = set()
+        self._device_cursor = None
+        self._sent_devices = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_POLL_INTERVAL', 2.0)
+        app.config.setdefault('EVENTS_QUEUE_SIZE', 100)
+        app.config.setdefault('EVENTS_KEEPALIVE', 15)
+        app.config.setdefault('EVENTS_BACKFILL_OVERLAP', 100)
+        app.config.setdefault('EVENTS_DEVICE_OVERLAP', 30)
+        app.config.setdefault('EVENTS_MAX_STREAMS', 0)
+        app.config.setdefault('EVENTS_BUSY_RETRY', 30)
+        app.extensions['events'] = self
+        self._app = app
+
+    def max_streams(self):
+        limit = self._app.config['EVENTS_MAX_STREAMS']
+        if limit:
+            return limit
+        return max(1, self._app.config.get('SERVER_THREADS', 4) // 2)
+
+    def subscribe(self, user_id):
+        """Подписать соединение на события пользователя; None - лимит потоков исчерпан"""
+        q = queue.Queue(maxsize=self._app.config['EVENTS_QUEUE_SIZE'])
+        with self._lock:
+            if sum(len(queues) for queues in self._subscribers.values()) >= self.max_streams():
+                return None
+            self._subscribers.setdefault(user_id, set()).add(q)
+            self._ensure_started()
+        return q
+
+    def backfill(self, user_id, q, last_event_id):
+        """Дослать в очередь уведомления после Last-Event-ID с окном перекрытия"""
+        from app import db
+        from app.models import Notification
+
+        try:
+            last_event_id = int(last_event_id)
+        except (TypeError, ValueError):
+            return 0
+        table = Notification.__table__
+        # С основной БД: на реплике последних уведомлений может еще не быть
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(table.c.id, table.c.title, table.c.message, table.c.created_at)
+                .where(table.c.user_id == user_id,
+                       table.c.id > last_event_id - self._app.config['EVENTS_BACKFILL_OVERLAP'])
+                .order_by(table.c.id)
+                .limit(self._app.config['EVENTS_QUEUE_SIZE'])
+            ).all()
+        for row in rows:
+            _put(q, _format('notification', _notification_data(row), row.id))
+        return len(rows)
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, user_id, event, data, event_id=None):
+        """Отправить событие всем соединениям пользователя"""
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        if not queues:
+            return
+        payload = _format(event, data, event_id)
+        for q in queues:
+            _put(q, payload)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='sse-publisher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self._app.config['EVENTS_POLL_INTERVAL']
+        while True:
+            if self.subscriber_count():
+                try:
+                    with self._app.app_context():
+                        self.poll()
+                except Exception:
+                    self._app.logger.exception('Ошибка опроса событий')
+            time.sleep(interval)
+
+    def poll(self):
+        """Один проход по ленте изменений для всех подписчиков"""
+        from app import db
+        from app.models import Notification, Device, License
+
+        overlap = self._app.config['EVENTS_BACKFILL_OVERLAP']
+        if self._last_notification_id is None:
+            self._last_notification_id = db.session.query(
+                db.func.coalesce(db.func.max(Notification.id), 0)
+            ).scalar()
+            self._sent_notifications = {
+                ident for ident, in db.session.query(Notification.id).filter(
+                    Notification.id > self._last_notification_id - overlap
+                )
+            }
+            self._device_cursor = datetime.utcnow()
+            return
+
+        with self._lock:
+            user_ids = set(self._subscribers)
+
+        # Окно перекрытия: id, зафиксированные позже больших id, не теряются
+        notifications = Notification.query.filter(
+            Notification.id > self._last_notification_id - overlap
+        ).order_by(Notification.id).limit(500 + overlap).all()
+        for notification in notifications:
+            if notification.id in self._sent_notifications:
+                continue
+            self._sent_notifications.add(notification.id)
+            self._last_notification_id = max(self._last_notification_id, notification.id)
+            if notification.user_id in user_ids:
+                self.publish(notification.user_id, 'notification', _notification_data(notification),
+                             notification.id)
+        floor = self._last_notification_id - overlap
+        self._sent_notifications = {ident for ident in self._sent_notifications if ident > floor}
+
+        # last_seen проставляется до коммита: строка может появиться, когда
+        # курсор уже ушел дальше, поэтому окно перекрывается с прошлым
+        cursor = datetime.utcnow()
+        since = self._device_cursor - timedelta(seconds=self._app.config['EVENTS_DEVICE_OVERLAP'])
+        devices = db.session.query(
+            Device.id, Device.license_id, Device.name, Device.ip_address,
+            Device.last_seen, Device.created_at, License.user_id
+        ).join(License, Device.license_id == License.id).filter(
+            Device.last_seen > since,
+            Device.last_seen <= cursor
+        ).all()
+        announced = {ident for ident, _ in self._sent_devices}
+        for device in devices:
+            if (device.id, device.last_seen) in self._sent_devices:
+                continue
+            self._sent_devices.add((device.id, device.last_seen))
+            if device.user_id in user_ids:
+                self.publish(device.user_id, 'device', {
+                    'id': device.id,
+                    'license_id': device.license_id,
+                    'name': device.name,
+                    'ip_address': device.ip_address,
+                    'last_seen': _isoformat(device.last_seen),
+                    'is_new': device.created_at > since and device.id not in announced
+                })
+        self._device_cursor = cursor
+        floor = cursor - timedelta(seconds=self._app.config['EVENTS_DEVICE_OVERLAP'])
+        self._sent_devices = {sent for sent in self._sent_devices if sent[1] > floor}
+        db.session.remove()
+
+
+def _notification_data(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'created_at': _isoformat(notification.created_at)
+    }
+
+
+def _format(event, data, event_id=None):
+    # Событие без id: браузер сохраняет прежний Last-Event-ID
+    payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event_id is not None:
+        payload = f"id: {event_id}\n" + payload
+    return payload
+
+
+def _put(q, payload):
+    try:
+        q.put_nowait(payload)
+    except queue.Full:
+        # Медленный клиент: выбрасываем самое старое событие
+        try:
+            q.get_nowait()
+            q.put_nowait(payload)
+        except (queue.Empty, queue.Full):
+            pass
+
+
+def _isoformat(dt):
+    return dt.isoformat() + 'Z' if dt else None
+
+
+events = EventPublisher()
@@ -51,5 +51,6 @@ class TariffForm(FlaskForm):
     price = FloatField('Цена', validators=[DataRequired()])
     period_days = IntegerField('Период (дней, 0=бессрочно)', default=30)
     max_devices = IntegerField('Максимум устройств', default=1)
+    device_inactivity_days = IntegerField('Освобождать неактивные устройства (дней, 0=никогда)', default=0)
     key_prefix = StringField('Префикс ключа', validators=[DataRequired(), Length(min=2, max=10)])
     submit = SubmitField('Создать тариф')
\ No newline at end of file
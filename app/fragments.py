@@ -0,0 +1,127 @@
+import secrets
+from flask import current_app
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from app import cache
+from app.cache import MISSING
+from app.invalidation import bus
+
+
+class FragmentCache:
+    """Кэш отрендеренных фрагментов шаблонов.
+
+    {% fragment 'имя', часть_ключа... %}...{% endfragment %}
+
+    Ключ фрагмента: пользователь, его штамп версии, штамп каталога и
+    переданные части. Штамп пользователя меняется при любом изменении его
+    лицензий, устройств и уведомлений (через шину инвалидации, сущность
+    'fragment'), поэтому старые фрагменты просто перестают читаться.
+    Данные для фрагментов передаются в шаблон через Lazy: при попадании
+    в кэш запросы не выполняются. Метрики - в пространствах fragment.<имя>.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+        app.extensions['fragments'] = self
+        app.jinja_env.add_extension(FragmentExtension)
+        app.jinja_env.globals['fragment_version'] = self.version
+
+        if not getattr(FragmentCache, '_events_registered', False):
+            event.listen(Session, 'after_flush', _after_flush)
+            FragmentCache._events_registered = True
+
+    def version(self, user_id):
+        """Штамп версии данных пользователя"""
+        return cache.namespace('fragment').get_or_set(
+            user_id, lambda: secrets.token_hex(4), ttl=current_app.config['FRAGMENT_CACHE_TTL']
+        )
+
+    def touch(self, session, user_ids):
+        """Сменить штамп пользователей после commit (для bulk-операций)"""
+        bus.mark(session, 'fragment', user_ids)
+
+    def render(self, name, parts, caller):
+        from app.catalog import catalog
+        if current_user.is_authenticated:
+            owner = [current_user.id, self.version(current_user.id)]
+        else:
+            owner = ['-']
+        key = ':'.join(str(part) for part in owner + [catalog.snapshot.stamp] + list(parts))
+        namespace = cache.namespace(f'fragment.{name}')
+        html = namespace.get_or_set(key, lambda: str(caller()), ttl=current_app.config['FRAGMENT_CACHE_TTL'])
+        return Markup(html)
+
+
+class FragmentExtension(Extension):
+    tags = {'fragment'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endfragment',), drop_needle=True)
+        call = self.call_method('_render', [args[0], nodes.List(args[1:])])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, caller):
+        return fragments.render(name, parts, caller)
+
+
+class Lazy:
+    """Результат запроса, вычисляемый при первом обращении (внутри фрагмента)"""
+
+    def __init__(self, func):
+        self._func = func
+        self._value = MISSING
+
+    def get(self):
+        if self._value is MISSING:
+            self._value = self._func()
+        return self._value
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def __len__(self):
+        return len(self.get())
+
+    def __bool__(self):
+        return bool(self.get())
+
+    def __getitem__(self, index):
+        return self.get()[index]
+
+
+def _after_flush(session, flush_context):
+    from app.models import License, Device, Notification
+    users = set()
+    licenses = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (License, Notification)):
+            users.add(obj.user_id)
+        elif isinstance(obj, Device):
+            license = session.identity_map.get(identity_key(License, obj.license_id))
+            if license is not None:
+                users.add(license.user_id)
+            else:
+                licenses.add(obj.license_id)
+    if licenses:
+        users.update(session.connection().execute(
+            select(License.user_id).where(License.id.in_(licenses))
+        ).scalars())
+    users.discard(None)
+    if users:
+        fragments.touch(session, users)
+
+
+fragments = FragmentCache()
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import jsonify, render_template_string, request
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingOverloaded(Exception):
+    """Очередь хэширования заполнена или ответ не пришел вовремя"""
+
+
+class PasswordHasher:
+    """Хэширование паролей вне потока запроса.
+
+    Параметры задаются PASSWORD_HASH_METHOD в формате werkzeug
+    (например, scrypt:32768:8:1 или pbkdf2:sha256:600000); хэши со
+    старыми параметрами пересчитываются при входе (needs_rehash).
+    Вычисления идут в пуле из PASSWORD_HASH_WORKERS процессов (0 - в
+    текущем потоке); одновременно не больше PASSWORD_HASH_QUEUE задач,
+    сверх этого запрос сразу получает 503.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        self.completed = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 5)
+        app.extensions['hasher'] = self
+        self._app = app
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+        self._method_prefix = None
+        app.register_error_handler(HashingOverloaded, _overloaded_response)
+
+    @property
+    def method(self):
+        return self._app.config['PASSWORD_HASH_METHOD']
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Хэш получен с параметрами, отличными от PASSWORD_HASH_METHOD"""
+        if self._method_prefix is None:
+            # Каноническая запись параметров (werkzeug дописывает значения по умолчанию)
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return not pwhash or pwhash.split('$', 1)[0] != self._method_prefix
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingOverloaded('Очередь хэширования паролей заполнена')
+        try:
+            pool = self._get_pool()
+            future = pool.submit(func, *args) if pool is not None else None
+        except BaseException:
+            self._slots.release()
+            raise
+        if future is None:
+            try:
+                result = func(*args)
+            finally:
+                self._slots.release()
+            self.completed += 1
+            return result
+        # Слот освобождается, когда задача действительно завершилась
+        # (или отменена), а не когда запрос перестал ее ждать: иначе
+        # при таймаутах очередь пула растет без ограничения
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(self._app.config['PASSWORD_HASH_TIMEOUT'])
+        except TimeoutError:
+            future.cancel()
+            self.rejected += 1
+            raise HashingOverloaded('Хэширование пароля не уложилось в таймаут')
+        self.completed += 1
+        return result
+
+    def _get_pool(self):
+        workers = self._app.config['PASSWORD_HASH_WORKERS']
+        if not workers:
+            return None
+        # Пул создается в том процессе, который хэширует (воркер после fork)
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def stats(self):
+        return {'completed': self.completed, 'rejected': self.rejected}
+
+
+_OVERLOADED_PAGE = """<!doctype html>
+<title>Сервис перегружен</title>
+<p>Слишком много одновременных входов. Повторите попытку через несколько секунд.</p>
+"""
+
+
+def _overloaded_response(error):
+    if request.is_json or request.path.startswith('/api/'):
+        response = jsonify({"error": "Сервис перегружен, повторите попытку"})
+    else:
+        response = render_template_string(_OVERLOADED_PAGE)
+    return response, 503, {'Retry-After': '1'}
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,124 @@
+import atexit
+import threading
+import time
+
+
+class HeartbeatBuffer:
+    """Буфер пульса устройств с пакетной записью в device_heartbeat.
+
+    Каждое устройство дает не больше одной точки на окно
+    HEARTBEAT_RESOLUTION секунд: повторные проверки в том же окне
+    схлопываются в памяти, уже записанное окно устройства не пишется
+    повторно, а точки того же окна из других воркеров отбрасывает
+    уникальный индекс (device_id, ts). Буфер сбрасывается фоновым потоком раз в
+    HEARTBEAT_FLUSH_INTERVAL секунд или при заполнении; размер ограничен
+    HEARTBEAT_BUFFER_SIZE записями.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._points = {}
+        self._flushed = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HEARTBEAT_RESOLUTION', 300)
+        app.config.setdefault('HEARTBEAT_FLUSH_INTERVAL', 10)
+        app.config.setdefault('HEARTBEAT_BUFFER_SIZE', 10000)
+        app.extensions['heartbeats'] = self
+        self._app = app
+        atexit.register(self.flush)
+
+    def record(self, device_id, license_id, product_id, tariff_id, ts=None):
+        """Отметить активность устройства (без обращения к БД)"""
+        resolution = self._app.config['HEARTBEAT_RESOLUTION']
+        ts = int(ts if ts is not None else time.time())
+        bucket = ts - ts % resolution
+        with self._lock:
+            if self._flushed.get(device_id) == bucket:
+                return
+            self._points[(device_id, bucket)] = (license_id, product_id, tariff_id)
+            size = len(self._points)
+            self._ensure_started()
+        limit = self._app.config['HEARTBEAT_BUFFER_SIZE']
+        if size >= 2 * limit:
+            # Поток записи не успевает: сбрасываем в текущем потоке
+            self.flush()
+        elif size >= limit:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._points)
+
+    def flush(self):
+        """Записать накопленные точки одним пакетным INSERT"""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                points, self._points = self._points, {}
+            if not points:
+                return 0
+
+            from app import db
+
+            rows = [
+                {'device_id': device_id, 'ts': bucket, 'license_id': license_id,
+                 'product_id': product_id, 'tariff_id': tariff_id}
+                for (device_id, bucket), (license_id, product_id, tariff_id) in points.items()
+            ]
+            with self._app.app_context():
+                try:
+                    _insert(db.session, rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception('Не удалось записать %d точек пульса', len(rows))
+                    return 0
+                finally:
+                    db.session.remove()
+            with self._lock:
+                # Запоминаем последнее записанное окно; прошедшие окна забываем
+                current = max(bucket for _, bucket in points)
+                self._flushed = {device_id: bucket for device_id, bucket in self._flushed.items()
+                                 if bucket >= current}
+                for device_id, bucket in points:
+                    if bucket >= self._flushed.get(device_id, bucket):
+                        self._flushed[device_id] = bucket
+            return len(rows)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['HEARTBEAT_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+
+
+def _insert(session, rows):
+    """INSERT ... ON CONFLICT (device_id, ts) DO NOTHING"""
+    from sqlalchemy import insert as plain_insert
+    from app.models import DeviceHeartbeat
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        session.execute(plain_insert(DeviceHeartbeat), rows)
+        return
+    session.execute(insert(DeviceHeartbeat).on_conflict_do_nothing(index_elements=['device_id', 'ts']), rows)
+
+
+heartbeats = HeartbeatBuffer()
@@ -0,0 +1,350 @@
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Сущности, изменения которых рассылаются воркерам, и их короткие коды
+ENTITIES = {
+    'License': 'license',
+    'Product': 'product',
+    'Device': 'device',
+    'Tariff': 'tariff',
+    'User': 'user',
+}
+CODES = {
+    'license': 'l',
+    'product': 'p',
+    'device': 'd',
+    'tariff': 't',
+    'user': 'u',
+    # Штампы версий фрагментов шаблонов (id пользователей)
+    'fragment': 'f',
+}
+ALL = '*'
+
+# Лимит полезной нагрузки NOTIFY в Postgres - 8000 байт
+MAX_MESSAGE = 7900
+CHANNEL = 'licensepro_invalidate'
+
+
+class InvalidationBus:
+    """Шина инвалидации кэша между воркерами.
+
+    Изменения License/Device/Product/Tariff/User собираются в after_flush и
+    рассылаются после commit: локально сразу, другим воркерам - через
+    Postgres LISTEN/NOTIFY или Unix-сокеты (для SQLite). Всплески
+    изменений за INVALIDATION_COALESCE_MS схлопываются в одно сообщение;
+    при слишком большом числе id сущность сбрасывается целиком ('*').
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._handlers = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._transport = None
+        self._sender = None
+        self._listener = None
+        self.origin = uuid.uuid4().hex[:8]
+        self.sent = 0
+        self.received = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INVALIDATION_TRANSPORT', 'auto')
+        app.config.setdefault('INVALIDATION_SOCKET_DIR', '/tmp/licensepro-invalidation')
+        app.config.setdefault('INVALIDATION_COALESCE_MS', 50)
+        app.config.setdefault('INVALIDATION_MAX_IDS', 500)
+        app.extensions['invalidation'] = self
+        self._app = app
+
+        if not getattr(InvalidationBus, '_events_registered', False):
+            event.listen(Session, 'after_flush', _after_flush)
+            event.listen(Session, 'after_commit', _after_commit)
+            event.listen(Session, 'after_rollback', _after_rollback)
+            InvalidationBus._events_registered = True
+
+        if not self._handlers:
+            # По умолчанию: значения сущности лежат в пространстве кэша
+            # с тем же именем под ключом id
+            from app import cache
+            for entity in CODES:
+                self.on(entity, _cache_handler(cache.namespace(entity)))
+
+        app.before_request(self.ensure_started)
+
+    # Подписка и публикация
+
+    def on(self, entity, handler):
+        """Зарегистрировать обработчик handler(ids); ids = множество id или ALL"""
+        self._handlers.setdefault(entity, []).append(handler)
+
+    def mark(self, session, entity, ids):
+        """Отметить изменение, сделанное в обход ORM (bulk UPDATE/DELETE)"""
+        pending = session.info.setdefault('invalidate', {})
+        pending.setdefault(entity, set()).update(ids)
+
+    def publish(self, changes):
+        """Применить изменения локально и поставить в очередь на рассылку"""
+        self.dispatch(changes)
+        limit = self._app.config['INVALIDATION_MAX_IDS']
+        with self._lock:
+            for entity, ids in changes.items():
+                current = self._pending.get(entity)
+                if current is ALL or ids is ALL:
+                    self._pending[entity] = ALL
+                else:
+                    current = self._pending.setdefault(entity, set())
+                    current.update(ids)
+                    if len(current) > limit:
+                        self._pending[entity] = ALL
+        self.ensure_started()
+        self._wakeup.set()
+
+    def dispatch(self, changes):
+        for entity, ids in changes.items():
+            for handler in self._handlers.get(entity, ()):
+                try:
+                    handler(ids)
+                except Exception:
+                    self._app.logger.exception('Ошибка обработчика инвалидации %s', entity)
+
+    # Фоновые потоки
+
+    def after_fork(self):
+        """Сбросить состояние, унаследованное воркером от мастер-процесса"""
+        self.origin = uuid.uuid4().hex[:8]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._transport = self._sender = self._listener = None
+
+    def ensure_started(self):
+        if self._sender is not None and self._sender.is_alive():
+            return
+        with self._lock:
+            if self._sender is not None and self._sender.is_alive():
+                return
+            self._transport = self._make_transport()
+            self._sender = threading.Thread(target=self._send_loop, name='invalidation-send', daemon=True)
+            self._listener = threading.Thread(target=self._listen_loop, name='invalidation-listen', daemon=True)
+            self._sender.start()
+            self._listener.start()
+
+    def _make_transport(self):
+        kind = self._app.config['INVALIDATION_TRANSPORT']
+        uri = self._app.config['SQLALCHEMY_DATABASE_URI']
+        if kind == 'auto':
+            kind = 'postgres' if uri.startswith('postgresql') else 'socket'
+        if kind == 'postgres':
+            return PostgresTransport(self._app)
+        if kind == 'socket':
+            return SocketTransport(self._app.config['INVALIDATION_SOCKET_DIR'])
+        return NullTransport()
+
+    def _send_loop(self):
+        window = self._app.config['INVALIDATION_COALESCE_MS'] / 1000.0
+        while True:
+            self._wakeup.wait()
+            # Окно схлопывания: собираем всплеск изменений в одно сообщение
+            time.sleep(window)
+            self._wakeup.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for message in encode(self.origin, pending):
+                try:
+                    self._transport.send(message)
+                    self.sent += 1
+                except Exception:
+                    self._app.logger.exception('Не удалось разослать инвалидацию')
+
+    def _listen_loop(self):
+        while True:
+            try:
+                for message in self._transport.listen():
+                    origin, changes = decode(message)
+                    if origin != self.origin and changes:
+                        self.received += 1
+                        self.dispatch(changes)
+            except Exception:
+                self._app.logger.exception('Слушатель инвалидаций остановился, перезапуск')
+                time.sleep(1)
+
+
+def encode(origin, changes):
+    """Компактные сообщения вида 'origin|l:1,2;t:*' не длиннее MAX_MESSAGE"""
+    messages = []
+    parts = []
+    size = len(origin) + 1
+
+    def flush():
+        nonlocal parts, size
+        if parts:
+            messages.append(f"{origin}|{';'.join(parts)}")
+        parts, size = [], len(origin) + 1
+
+    for entity, ids in changes.items():
+        code = CODES[entity]
+        if ids is ALL:
+            chunks = [ALL]
+        else:
+            chunks, chunk, length = [], [], 0
+            for item in sorted(ids):
+                item = str(item)
+                if length + len(item) + 1 > MAX_MESSAGE - 64:
+                    chunks.append(','.join(chunk))
+                    chunk, length = [], 0
+                chunk.append(item)
+                length += len(item) + 1
+            if chunk:
+                chunks.append(','.join(chunk))
+        for chunk in chunks:
+            part = f"{code}:{chunk}"
+            if size + len(part) + 1 > MAX_MESSAGE:
+                flush()
+            parts.append(part)
+            size += len(part) + 1
+    flush()
+    return messages
+
+
+def decode(message):
+    entities = {code: entity for entity, code in CODES.items()}
+    origin, _, body = message.partition('|')
+    changes = {}
+    for part in filter(None, body.split(';')):
+        code, _, ids = part.partition(':')
+        entity = entities.get(code)
+        if entity is None:
+            continue
+        if ids == ALL:
+            changes[entity] = ALL
+        elif changes.get(entity) is not ALL:
+            changes.setdefault(entity, set()).update(int(x) for x in ids.split(',') if x)
+    return origin, changes
+
+
+class NullTransport:
+    """Один процесс: рассылка не нужна"""
+
+    def send(self, message):
+        pass
+
+    def listen(self):
+        threading.Event().wait()
+        return iter(())
+
+
+class SocketTransport:
+    """Рассылка датаграммами по Unix-сокетам воркеров одного хоста"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send(self, message):
+        data = message.encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith('.sock'):
+                continue
+            try:
+                self.out.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Воркер завершился, сокет остался
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                pass
+
+    def listen(self):
+        while True:
+            data = self.sock.recv(65536)
+            yield data.decode()
+
+
+class PostgresTransport:
+    """Рассылка через Postgres LISTEN/NOTIFY на выделенных соединениях"""
+
+    def __init__(self, app):
+        self.app = app
+        self._send_conn = None
+
+    def _connect(self):
+        from app import db
+        with self.app.app_context():
+            conn = db.engine.raw_connection()
+        conn.driver_connection.autocommit = True
+        return conn
+
+    def send(self, message):
+        if self._send_conn is None:
+            self._send_conn = self._connect()
+        try:
+            cursor = self._send_conn.cursor()
+            cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, message))
+            cursor.close()
+        except Exception:
+            self._send_conn.invalidate()
+            self._send_conn = None
+            raise
+
+    def listen(self):
+        conn = self._connect()
+        raw = conn.driver_connection
+        cursor = raw.cursor()
+        cursor.execute(f'LISTEN {CHANNEL}')
+        try:
+            while True:
+                if select.select([raw], [], [], 30) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    yield raw.notifies.pop(0).payload
+        finally:
+            conn.invalidate()
+
+
+def _cache_handler(namespace):
+    def handler(ids):
+        if ids is ALL:
+            namespace.clear()
+        else:
+            for item in ids:
+                namespace.delete(item)
+    return handler
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.setdefault('invalidate', {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        entity = ENTITIES.get(type(obj).__name__)
+        if entity is not None and obj.id is not None:
+            pending.setdefault(entity, set()).add(obj.id)
+
+
+def _after_commit(session):
+    changes = session.info.pop('invalidate', None)
+    if changes and bus._app is not None:
+        bus.publish(changes)
+
+
+def _after_rollback(session):
+    session.info.pop('invalidate', None)
+
+
+bus = InvalidationBus()
@@ -0,0 +1,130 @@
+import atexit
+import threading
+from datetime import datetime
+
+
+class IpIndexBuffer:
+    """Индекс IP-адресов лицензий (license_ip) с пакетной записью.
+
+    Каждая пара (лицензия, IP) - одна строка с первым и последним
+    появлением и числом обращений. Проверки и регистрации только
+    обновляют счетчики в памяти; фоновый поток раз в
+    IP_INDEX_FLUSH_INTERVAL секунд (или при заполнении буфера на
+    IP_INDEX_BUFFER_SIZE пар) записывает их одним UPSERT. По этому
+    индексу задача detect_ip_sharing ищет передачу ключей, не читая device.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._pairs = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IP_INDEX_FLUSH_INTERVAL', 10)
+        app.config.setdefault('IP_INDEX_BUFFER_SIZE', 10000)
+        app.extensions['ipindex'] = self
+        self._app = app
+        atexit.register(self.flush)
+
+    def record(self, license_id, ip, seen_at=None):
+        """Отметить обращение лицензии с адреса ip (без обращения к БД)"""
+        if not ip:
+            return
+        seen_at = seen_at or datetime.utcnow()
+        with self._lock:
+            pair = self._pairs.get((license_id, ip))
+            if pair is None:
+                self._pairs[(license_id, ip)] = [seen_at, seen_at, 1]
+            else:
+                pair[1] = seen_at
+                pair[2] += 1
+            size = len(self._pairs)
+            self._ensure_started()
+        limit = self._app.config['IP_INDEX_BUFFER_SIZE']
+        if size >= 2 * limit:
+            # Поток записи не успевает: сбрасываем в текущем потоке
+            self.flush()
+        elif size >= limit:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pairs)
+
+    def flush(self):
+        """Записать накопленные пары одним UPSERT"""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                pairs, self._pairs = self._pairs, {}
+            if not pairs:
+                return 0
+
+            from app import db
+
+            rows = [
+                {'license_id': license_id, 'ip': ip, 'first_seen': first_seen,
+                 'last_seen': last_seen, 'hits': hits}
+                for (license_id, ip), (first_seen, last_seen, hits) in pairs.items()
+            ]
+            with self._app.app_context():
+                try:
+                    _upsert(db.session, rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception('Не удалось записать %d адресов лицензий', len(rows))
+                    return 0
+                finally:
+                    db.session.remove()
+            return len(rows)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ip-index-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['IP_INDEX_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+
+
+def _upsert(session, rows):
+    """INSERT ... ON CONFLICT (license_id, ip): продлить last_seen и добавить hits"""
+    from app.models import LicenseIp
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # Без ON CONFLICT: построчно
+        for row in rows:
+            pair = LicenseIp.query.filter_by(license_id=row['license_id'], ip=row['ip']).first()
+            if pair is None:
+                session.add(LicenseIp(**row))
+            else:
+                pair.last_seen = max(pair.last_seen, row['last_seen'])
+                pair.hits += row['hits']
+        return
+
+    statement = insert(LicenseIp)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=['license_id', 'ip'],
+        set_={
+            'last_seen': statement.excluded.last_seen,
+            'hits': LicenseIp.hits + statement.excluded.hits,
+        }
+    ), rows)
+
+
+ipindex = IpIndexBuffer()
@@ -0,0 +1,252 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, insert, delete, select, func, literal, case
+from app import db
+from app.models import (License, LicenseTransition, Notification, Tariff, Device,
+                        DeviceHeartbeat, ActivityRollup, LicenseIp, SharingFlag)
+from app.scheduler import scheduler
+from app.invalidation import bus
+from app.fragments import fragments
+from app.webhooks import webhooks
+from app.catalog import catalog
+from app.ipindex import ipindex
+
+
+@scheduler.job('expire_licenses', 'EXPIRY_SCHEDULER_INTERVAL')
+def expire_licenses():
+    """Перевод просроченных активных лицензий в состояние expired пакетами"""
+    batch_size = current_app.config['EXPIRY_BATCH_SIZE']
+    now = datetime.utcnow()
+    total = 0
+    while True:
+        # Выборка идет по частичному индексу ix_license_active_valid_until
+        ids = [row.id for row in db.session.query(License.id).filter(
+            License.is_active == True,
+            License.expired_at.is_(None),
+            License.valid_until < now
+        ).limit(batch_size)]
+        if not ids:
+            break
+
+        # Условие повторяется в UPDATE: лицензию могли продлить между запросами
+        expired = db.session.execute(
+            update(License)
+            .where(License.id.in_(ids), License.expired_at.is_(None), License.valid_until < now)
+            .values(expired_at=now)
+            .returning(License.id, License.user_id),
+            execution_options={'synchronize_session': False}
+        ).all()
+        if expired:
+            bus.mark(db.session, 'license', [row.id for row in expired])
+            fragments.touch(db.session, {row.user_id for row in expired})
+            db.session.execute(insert(LicenseTransition), [
+                {'license_id': row.id, 'from_state': 'active', 'to_state': 'expired',
+                 'reason': 'valid_until', 'created_at': now}
+                for row in expired
+            ])
+        db.session.commit()
+        total += len(expired)
+    return total
+
+
+@scheduler.job('notify_expiring', 'EXPIRY_SCHEDULER_INTERVAL')
+def notify_expiring():
+    """Пакетные уведомления «лицензия истекает через N дней»"""
+    batch_size = current_app.config['EXPIRY_BATCH_SIZE']
+    days = current_app.config['EXPIRY_NOTIFY_DAYS']
+    now = datetime.utcnow()
+    total = 0
+    while True:
+        rows = db.session.query(
+            License.id, License.user_id, License.name, License.valid_until
+        ).filter(
+            License.is_active == True,
+            License.expired_at.is_(None),
+            License.valid_until < now + timedelta(days=days),
+            License.valid_until >= now,
+            License.expiry_notified_at.is_(None)
+        ).limit(batch_size).all()
+        if not rows:
+            break
+
+        db.session.execute(insert(Notification), [
+            {'user_id': row.user_id, 'title': 'Лицензия скоро истечет',
+             'message': f'Лицензия "{row.name}" истекает {row.valid_until.strftime("%Y-%m-%d %H:%M")}. '
+                        f'Продлите ее, чтобы не прерывать работу.',
+             'is_read': False, 'created_at': now}
+            for row in rows
+        ])
+        db.session.execute(
+            update(License)
+            .where(License.id.in_([row.id for row in rows]))
+            .values(expiry_notified_at=now),
+            execution_options={'synchronize_session': False}
+        )
+        fragments.touch(db.session, {row.user_id for row in rows})
+        db.session.commit()
+        total += len(rows)
+    return total
+
+
+@scheduler.job('reap_stale_devices', 'DEVICE_REAPER_INTERVAL')
+def reap_stale_devices():
+    """Освобождение слотов устройств, не выходивших на связь дольше окна тарифа"""
+    batch_size = current_app.config['DEVICE_REAPER_BATCH_SIZE']
+    now = datetime.utcnow()
+    released = {}
+    tariffs = db.session.query(Tariff.id, Tariff.device_inactivity_days).filter(
+        Tariff.device_inactivity_days > 0
+    ).all()
+    for tariff_id, days in tariffs:
+        cutoff = now - timedelta(days=days)
+        while True:
+            # Индекс ix_device_license_last_seen: лицензии тарифа + диапазон last_seen
+            rows = db.session.query(
+                Device.id, Device.license_id, License.user_id, License.name
+            ).join(License, Device.license_id == License.id).filter(
+                License.tariff_id == tariff_id,
+                Device.last_seen < cutoff
+            ).limit(batch_size).all()
+            if not rows:
+                break
+
+            # Устройство могло выйти на связь после выборки: условие повторяется
+            deleted = set(db.session.execute(
+                delete(Device)
+                .where(Device.id.in_([row.id for row in rows]), Device.last_seen < cutoff)
+                .returning(Device.id),
+                execution_options={'synchronize_session': False}
+            ).scalars())
+            bus.mark(db.session, 'device', deleted)
+            fragments.touch(db.session, {row.user_id for row in rows if row.id in deleted})
+            db.session.commit()
+            for row in rows:
+                if row.id in deleted:
+                    entry = released.setdefault(row.license_id, [row.user_id, row.name, days, 0])
+                    entry[3] += 1
+
+    # Одно сводное уведомление на лицензию
+    if released:
+        db.session.execute(insert(Notification), [
+            {'user_id': user_id, 'title': 'Устройства освобождены',
+             'message': f'У лицензии {name} освобождено устройств: {count} '
+                        f'(не выходили на связь более {days} дн)',
+             'is_read': False, 'created_at': now}
+            for user_id, name, days, count in released.values()
+        ])
+        fragments.touch(db.session, {entry[0] for entry in released.values()})
+        db.session.commit()
+    return sum(entry[3] for entry in released.values())
+
+
+ROLLUP_PERIODS = (('hour', 3600), ('day', 86400))
+
+
+@scheduler.job('rollup_heartbeats', 'HEARTBEAT_ROLLUP_INTERVAL')
+def rollup_heartbeats():
+    """Свертка сырых точек пульса в почасовые и суточные счетчики + ретеншн"""
+    config = current_app.config
+    now = int(time.time())
+    total = 0
+    for period, size in ROLLUP_PERIODS:
+        # Последний (возможно, неполный) интервал пересчитывается заново
+        start = db.session.query(func.max(ActivityRollup.bucket)).filter(
+            ActivityRollup.period == period
+        ).scalar()
+        if start is None:
+            start = db.session.query(func.min(DeviceHeartbeat.ts)).scalar()
+        if start is None:
+            continue
+        start -= start % size
+
+        bucket = (DeviceHeartbeat.ts - DeviceHeartbeat.ts % size).label('bucket')
+        db.session.execute(delete(ActivityRollup).where(
+            ActivityRollup.period == period,
+            ActivityRollup.bucket >= start
+        ))
+        result = db.session.execute(insert(ActivityRollup).from_select(
+            ['period', 'bucket', 'license_id', 'product_id', 'tariff_id', 'active_devices'],
+            select(
+                literal(period), bucket, DeviceHeartbeat.license_id,
+                DeviceHeartbeat.product_id, DeviceHeartbeat.tariff_id,
+                func.count(DeviceHeartbeat.device_id.distinct())
+            ).where(DeviceHeartbeat.ts >= start).group_by(
+                bucket, DeviceHeartbeat.license_id,
+                DeviceHeartbeat.product_id, DeviceHeartbeat.tariff_id
+            )
+        ))
+        total += result.rowcount
+
+    # Ограниченное хранение: сырые точки и почасовые свертки
+    db.session.execute(delete(DeviceHeartbeat).where(
+        DeviceHeartbeat.ts < now - config['HEARTBEAT_RAW_RETENTION_HOURS'] * 3600
+    ))
+    db.session.execute(delete(ActivityRollup).where(
+        ActivityRollup.period == 'hour',
+        ActivityRollup.bucket < now - config['HEARTBEAT_HOURLY_RETENTION_DAYS'] * 86400
+    ))
+    db.session.commit()
+    return total
+
+
+@scheduler.job('deliver_webhooks', 'WEBHOOK_INTERVAL')
+def deliver_webhooks():
+    """Доставка вебхуков из outbox, пока есть готовые события"""
+    total = 0
+    while True:
+        delivered = webhooks.deliver_pending()
+        total += delivered
+        if delivered < current_app.config['WEBHOOK_CLAIM_SIZE']:
+            break
+    webhooks.prune()
+    return total
+
+
+@scheduler.job('detect_ip_sharing', 'IP_SHARING_INTERVAL')
+def detect_ip_sharing():
+    """Пересчет лицензий с адресами сверх порогов тарифа по индексу license_ip"""
+    config = current_app.config
+    now = datetime.utcnow()
+    since = now - timedelta(hours=config['IP_SHARING_WINDOW_HOURS'])
+    per_device_ips = config['IP_SHARING_IPS_PER_DEVICE']
+    per_device_churn = config['IP_SHARING_CHURN_PER_DEVICE']
+    ipindex.flush()
+
+    # Индекс ix_license_ip_last_seen: читаются только адреса из окна.
+    # Лицензии, у которых адресов не больше минимального порога, отсекает HAVING
+    # Тарифы без лимита устройств (max_devices = 0) не проверяются
+    tariffs = [tariff for tariff in catalog.snapshot.all_tariffs() if tariff.max_devices > 0]
+    floor = min((tariff.max_devices for tariff in tariffs), default=1) * min(per_device_ips, per_device_churn)
+    new_ips = func.sum(case((LicenseIp.first_seen >= since, 1), else_=0))
+    candidates = db.session.query(
+        LicenseIp.license_id, func.count(LicenseIp.id), new_ips
+    ).filter(
+        LicenseIp.last_seen >= since
+    ).group_by(LicenseIp.license_id).having(func.count(LicenseIp.id) > floor).all()
+
+    license_ids = [row[0] for row in candidates]
+    tariff_of = {}
+    for start in range(0, len(license_ids), 500):
+        chunk = license_ids[start:start + 500]
+        tariff_of.update(db.session.query(License.id, License.tariff_id).filter(License.id.in_(chunk)).all())
+
+    flags = []
+    for license_id, distinct_ips, new in candidates:
+        tariff = catalog.tariff(tariff_of.get(license_id))
+        if tariff is None or tariff.max_devices <= 0:
+            continue
+        ip_limit = tariff.max_devices * per_device_ips
+        churn_limit = tariff.max_devices * per_device_churn
+        if distinct_ips > ip_limit or new > churn_limit:
+            flags.append({'license_id': license_id, 'distinct_ips': distinct_ips, 'new_ips': int(new),
+                          'ip_limit': ip_limit, 'churn_limit': churn_limit, 'detected_at': now})
+
+    db.session.execute(delete(SharingFlag))
+    if flags:
+        db.session.execute(insert(SharingFlag), flags)
+    db.session.execute(delete(LicenseIp).where(
+        LicenseIp.last_seen < now - timedelta(days=config['IP_INDEX_RETENTION_DAYS'])
+    ))
+    db.session.commit()
+    return len(flags)
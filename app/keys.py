@@ -0,0 +1,90 @@
+import secrets
+import string
+
+ALPHABET = string.ascii_uppercase + string.digits
+_BASE = len(ALPHABET)
+_VALUES = {char: value for value, char in enumerate(ALPHABET)}
+
+# Байты >= 252 отбрасываются, чтобы b % 36 было равномерным
+_LIMIT = 256 - 256 % _BASE
+_TABLE = bytes(ord(ALPHABET[b % _BASE]) if b < _LIMIT else 0 for b in range(256))
+_REJECT = bytes(range(_LIMIT, 256))
+
+
+def checksum_char(text):
+    """Контрольный символ Luhn mod 36 (символы вне алфавита пропускаются)"""
+    factor = 2
+    total = 0
+    for char in reversed(text.upper()):
+        value = _VALUES.get(char)
+        if value is None:
+            continue
+        addend = factor * value
+        factor = 1 if factor == 2 else 2
+        total += addend // _BASE + addend % _BASE
+    return ALPHABET[(_BASE - total % _BASE) % _BASE]
+
+
+def verify_checksum(key):
+    """Офлайн-проверка ключа с контрольным символом (без обращения к API)"""
+    if not key or len(key) < 2:
+        return False
+    return checksum_char(key[:-1]) == key[-1].upper()
+
+
+class KeyGenerator:
+    """Пакетный генератор ключей: энтропия берется одним вызовом на весь пакет"""
+
+    def __init__(self, length=20, checksum=False):
+        self.length = length
+        self.checksum = checksum
+
+    def random_parts(self, count):
+        need = count * self.length
+        encoded = b''
+        while len(encoded) < need:
+            # Запас ~2% покрывает отброшенные байты
+            raw = secrets.token_bytes(need - len(encoded) + need // 32 + 8)
+            encoded += raw.translate(_TABLE, _REJECT)
+        text = encoded[:need].decode('ascii')
+        return [text[i:i + self.length] for i in range(0, need, self.length)]
+
+    def generate(self, prefix, count=1):
+        keys = []
+        for part in self.random_parts(count):
+            key = f"{prefix}-{part}"
+            if self.checksum:
+                key += checksum_char(key)
+            keys.append(key)
+        return keys
+
+
+def generator_from_config(config):
+    return KeyGenerator(
+        length=config.get('LICENSE_KEY_LENGTH', 20),
+        checksum=config.get('LICENSE_KEY_CHECKSUM', False)
+    )
+
+
+def generate_unique_keys(prefix, count=1, spare=4, attempts=5):
+    """Ключи, которых гарантированно нет в license.key на момент проверки.
+
+    Кандидаты генерируются с запасом и проверяются одним запросом по
+    уникальному индексу; при коллизии пакет догенерируется.
+    """
+    from flask import current_app
+    from app import db
+    from app.models import License
+
+    generator = generator_from_config(current_app.config)
+    result = {}
+    for _ in range(attempts):
+        candidates = [key for key in generator.generate(prefix, count - len(result) + spare)
+                      if key not in result]
+        taken = {
+            row.key for row in db.session.query(License.key).filter(License.key.in_(candidates))
+        }
+        result.update((key, None) for key in candidates if key not in taken)
+        if len(result) >= count:
+            return list(result)[:count]
+    raise RuntimeError('Не удалось сгенерировать уникальный ключ лицензии')
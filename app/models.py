@@ -1,55 +1,84 @@
 from datetime import datetime, timedelta
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import update, insert
+from sqlalchemy.orm.attributes import set_committed_value
+import json
 import secrets
-import string
-from app import db, login_manager
+import time
+from app import db, login_manager, cache
+from app.utils import to_money
+from app.keys import generate_unique_keys
+from app.invalidation import bus
+from app.catalog import catalog
+from app.webhooks import webhooks
+from app.hashing import hasher
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(db.Numeric(12, 2), default=0, nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Увеличивается при смене пароля: сессии со старой версией недействительны
+    session_version = db.Column(db.Integer, default=0, nullable=False)
     
     # Связи
     licenses = db.relationship('License', backref='owner', lazy=True)
     balance_history = db.relationship('BalanceHistory', backref='user', lazy=True)
     notifications = db.relationship('Notification', backref='user', lazy=True)
     
+    def get_id(self):
+        return f"{self.id}.{self.session_version or 0}"
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
     
     def can_afford(self, amount):
-        return self.balance >= amount
+        return self.balance >= to_money(amount)
     
     def charge(self, amount, description=""):
-        if self.can_afford(amount):
-            self.balance -= amount
-            history = BalanceHistory(
-                user_id=self.id,
-                amount=-amount,
-                description=description,
-                balance_after=self.balance
-            )
-            db.session.add(history)
-            return True
-        return False
+        """Атомарное списание: условный UPDATE ... RETURNING без чтения баланса"""
+        amount = to_money(amount)
+        new_balance = db.session.execute(
+            update(User)
+            .where(User.id == self.id, User.balance >= amount)
+            .values(balance=User.balance - amount)
+            .returning(User.balance),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if new_balance is None:
+            return False
+        self._record_balance_change(-amount, description, new_balance)
+        return True
     
     def deposit(self, amount, description=""):
-        self.balance += amount
-        history = BalanceHistory(
+        """Атомарное пополнение баланса"""
+        amount = to_money(amount)
+        new_balance = db.session.execute(
+            update(User)
+            .where(User.id == self.id)
+            .values(balance=User.balance + amount)
+            .returning(User.balance),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        self._record_balance_change(amount, description, new_balance)
+    
+    def _record_balance_change(self, amount, description, new_balance):
+        # Запись истории идет в той же транзакции сразу после UPDATE
+        set_committed_value(self, 'balance', to_money(new_balance))
+        bus.mark(db.session, 'user', [self.id])
+        db.session.execute(insert(BalanceHistory).values(
             user_id=self.id,
             amount=amount,
             description=description,
-            balance_after=self.balance
-        )
-        db.session.add(history)
+            balance_after=new_balance
+        ))
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,9 +96,10 @@ class Tariff(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(12, 2), nullable=False)
     period_days = db.Column(db.Integer, nullable=False)  # 0 = бессрочно
     max_devices = db.Column(db.Integer, nullable=False)
+    device_inactivity_days = db.Column(db.Integer, nullable=False, default=0)  # 0 = не освобождать
     key_prefix = db.Column(db.String(10), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     
@@ -87,24 +117,51 @@ class License(db.Model):
     valid_until = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     blacklisted_ips = db.Column(db.Text, default="")  # CSV список IP
+    expired_at = db.Column(db.DateTime)  # Проставляется планировщиком при истечении
+    expiry_notified_at = db.Column(db.DateTime)
     
     # Связи
     devices = db.relationship('Device', backref='license', lazy=True)
     
+    @property
+    def tariff_info(self):
+        """Тариф из снимка каталога (без запроса к БД)"""
+        return catalog.tariff(self.tariff_id)
+    
+    @property
+    def product_info(self):
+        """Продукт из снимка каталога (без запроса к БД)"""
+        return catalog.product(self.product_id)
+    
     @classmethod
     def generate_key(cls, prefix):
-        alphabet = string.ascii_uppercase + string.digits
-        random_part = ''.join(secrets.choice(alphabet) for _ in range(20))
-        return f"{prefix}-{random_part}"
+        """Новый ключ, отсутствующий в БД (длина и контрольный символ из конфига)"""
+        return generate_unique_keys(prefix)[0]
     
     def is_valid(self):
         if not self.is_active:
             return False
+        if self.expired_at:
+            return False
+        # Страховка на интервал между проходами планировщика
         if self.valid_until and self.valid_until < datetime.utcnow():
             return False
         return True
     
+    def clear_expiry(self, reason=""):
+        """Сбросить сохраненное состояние истечения после продления"""
+        if self.expired_at:
+            db.session.add(LicenseTransition(
+                license_id=self.id,
+                from_state='expired',
+                to_state='active',
+                reason=reason
+            ))
+        self.expired_at = None
+        self.expiry_notified_at = None
+    
     def add_time(self, days):
+        self.clear_expiry('extend')
         if self.valid_until:
             if self.valid_until < datetime.utcnow():
                 self.valid_until = datetime.utcnow() + timedelta(days=days)
@@ -121,12 +178,16 @@ class License(db.Model):
         if ip not in ips:
             ips.append(ip)
             self.blacklisted_ips = ','.join(ips)
+            webhooks.emit(db.session, 'license.blacklist_changed', self, action='added', ip=ip,
+                          blacklisted_ips=ips)
     
     def remove_blacklisted_ip(self, ip):
         ips = self.get_blacklisted_ips()
         if ip in ips:
             ips.remove(ip)
             self.blacklisted_ips = ','.join(ips)
+            webhooks.emit(db.session, 'license.blacklist_changed', self, action='removed', ip=ip,
+                          blacklisted_ips=ips)
             
     def notify_new_device(self, device_name, ip_address):
         """Создать уведомление о новом устройстве"""
@@ -139,13 +200,29 @@ class License(db.Model):
         db.session.add(notification)
         db.session.flush()
 
+# Частичный индекс: планировщик истечения читает только активные неистекшие
+db.Index(
+    'ix_license_active_valid_until',
+    License.valid_until,
+    postgresql_where=db.and_(License.is_active == True, License.expired_at.is_(None)),
+    sqlite_where=db.and_(License.is_active == True, License.expired_at.is_(None))
+)
+
+class LicenseTransition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    license_id = db.Column(db.Integer, db.ForeignKey('license.id'), nullable=False, index=True)
+    from_state = db.Column(db.String(20), nullable=False)
+    to_state = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Device(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     license_id = db.Column(db.Integer, db.ForeignKey('license.id'), nullable=False)
     installation_id = db.Column(db.String(64), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     ip_address = db.Column(db.String(45))
-    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
@@ -153,12 +230,95 @@ class Device(db.Model):
     def generate_installation_id(cls):
         return secrets.token_hex(16)
 
+# Поиск устаревших устройств лицензии: license_id + диапазон last_seen
+db.Index('ix_device_license_last_seen', Device.license_id, Device.last_seen)
+
+class DeviceHeartbeat(db.Model):
+    """Сырые точки активности: одна строка на устройство за окно HEARTBEAT_RESOLUTION"""
+    id = db.Column(db.Integer, primary_key=True)
+    ts = db.Column(db.Integer, nullable=False, index=True)  # Unix-время начала окна
+    device_id = db.Column(db.Integer, nullable=False)
+    license_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    tariff_id = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        # Точку окна пишут несколько воркеров: повторы отбрасывает ON CONFLICT
+        db.Index('uq_device_heartbeat_device_ts', 'device_id', 'ts', unique=True),
+    )
+
+class ActivityRollup(db.Model):
+    """Число активных устройств лицензии за час (period='hour') или сутки ('day')"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)  # Unix-время начала часа/суток (UTC)
+    license_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    tariff_id = db.Column(db.Integer, nullable=False)
+    active_devices = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_activity_rollup_period_bucket', 'period', 'bucket'),
+        db.Index('ix_activity_rollup_license', 'license_id', 'period', 'bucket'),
+    )
+    
+    @property
+    def started_at(self):
+        return datetime.utcfromtimestamp(self.bucket)
+    
+    @classmethod
+    def series(cls, period, buckets, **filters):
+        """Ряд [(начало интервала, активных устройств)] за последние buckets интервалов"""
+        size = 3600 if period == 'hour' else 86400
+        now = int(time.time())
+        last = now - now % size
+        first = last - (buckets - 1) * size
+        query = db.session.query(cls.bucket, db.func.sum(cls.active_devices)).filter(
+            cls.period == period,
+            cls.bucket >= first
+        )
+        for name, value in filters.items():
+            query = query.filter(getattr(cls, name) == value)
+        values = dict(query.group_by(cls.bucket).all())
+        return [
+            (datetime.utcfromtimestamp(bucket), int(values.get(bucket) or 0))
+            for bucket in range(first, last + 1, size)
+        ]
+
+class LicenseIp(db.Model):
+    """Адреса, с которых обращалась лицензия (пишется пакетами через app.ipindex)"""
+    id = db.Column(db.Integer, primary_key=True)
+    license_id = db.Column(db.Integer, nullable=False)
+    ip = db.Column(db.String(45), nullable=False)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=1)
+    
+    __table_args__ = (
+        db.UniqueConstraint('license_id', 'ip', name='uq_license_ip'),
+        # Лицензии одного адреса и окно активности для detect_ip_sharing
+        db.Index('ix_license_ip_ip', 'ip', 'license_id'),
+        db.Index('ix_license_ip_last_seen', 'last_seen'),
+    )
+
+class SharingFlag(db.Model):
+    """Лицензия, превысившая пороги адресов тарифа (пересчитывается detect_ip_sharing)"""
+    id = db.Column(db.Integer, primary_key=True)
+    license_id = db.Column(db.Integer, db.ForeignKey('license.id'), nullable=False, unique=True)
+    distinct_ips = db.Column(db.Integer, nullable=False)
+    new_ips = db.Column(db.Integer, nullable=False)
+    ip_limit = db.Column(db.Integer, nullable=False)
+    churn_limit = db.Column(db.Integer, nullable=False)
+    detected_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    license = db.relationship('License')
+
 class BalanceHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
     description = db.Column(db.String(200))
-    balance_after = db.Column(db.Float, nullable=False)
+    balance_after = db.Column(db.Numeric(12, 2), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Notification(db.Model):
@@ -169,6 +329,125 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class WebhookEndpoint(db.Model):
+    """Адрес интегратора для событий по лицензиям пользователя (user_id пуст - все)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False, default=lambda: secrets.token_hex(32))
+    events = db.Column(db.String(500), nullable=False, default='*')  # через запятую или *
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def accepts(self, event):
+        return self.events == '*' or event in self.events.split(',')
+
+class WebhookDelivery(db.Model):
+    """Исходящее событие для одного адреса (outbox): pending, delivered или dead"""
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint_id = db.Column(db.Integer, db.ForeignKey('webhook_endpoint.id'), nullable=False)
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Выборка воркера: готовые к отправке события по времени
+        db.Index('ix_webhook_delivery_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_webhook_delivery_endpoint', 'endpoint_id', 'status'),
+    )
+
+class AuditLog(db.Model):
+    """Журнал действий (только добавление; пишется пакетами через app.audit)"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    actor_id = db.Column(db.Integer)  # без внешнего ключа: журнал переживает пользователя
+    actor = db.Column(db.String(64))
+    ip = db.Column(db.String(45))
+    action = db.Column(db.String(50), nullable=False)
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer)
+    details = db.Column(db.Text)  # JSON
+    
+    __table_args__ = (
+        # Постраничный просмотр по курсору id: фильтр по автору или объекту
+        db.Index('ix_audit_log_actor', 'actor_id', 'id'),
+        db.Index('ix_audit_log_target', 'target_type', 'target_id', 'id'),
+    )
+    
+    @property
+    def details_dict(self):
+        return json.loads(self.details) if self.details else {}
+
+@db.event.listens_for(AuditLog, 'before_update')
+@db.event.listens_for(AuditLog, 'before_delete')
+def _audit_log_append_only(mapper, connection, target):
+    raise RuntimeError('Журнал аудита только дополняется')
+
+# Поля пользователя, которые хранятся в кэше и доступны без запроса к БД
+IDENTITY_FIELDS = ('id', 'username', 'email', 'is_admin', 'balance', 'session_version')
+
+
+class CurrentUser(UserMixin):
+    """current_user из кэша идентичности.
+
+    Поля IDENTITY_FIELDS читаются из кэша; остальные атрибуты, методы
+    и любые присваивания передаются модели User, которая загружается
+    из БД только при первом таком обращении.
+    """
+
+    def __init__(self, identity):
+        self.__dict__['_identity'] = identity
+        self.__dict__['_model'] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.__dict__['_model'] = db.session.get(User, self._identity['id'])
+        return self._model
+
+    def get_id(self):
+        return f"{self._identity['id']}.{self._identity['session_version']}"
+
+    def __getattr__(self, name):
+        identity = self.__dict__['_identity']
+        if name in identity and self._model is None:
+            return identity[name]
+        return getattr(self.model, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.model, name, value)
+
+
+def _load_identity(user_id):
+    # Всегда из основной БД: с реплики в кэш на USER_CACHE_TTL попали бы
+    # старые is_admin и session_version, и отзыв прав не сработал бы сразу
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            db.select(*(getattr(User, field) for field in IDENTITY_FIELDS)).where(User.id == user_id)
+        ).first()
+    return dict(row._mapping) if row is not None else None
+
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
\ No newline at end of file
+    # Идентификатор сессии: "<id>.<session_version>"; старые сессии - просто "<id>"
+    user_id, _, version = str(id).partition('.')
+    try:
+        user_id, version = int(user_id), int(version or 0)
+    except ValueError:
+        # Поврежденная или чужая cookie: сессия считается анонимной
+        return None
+    # Пространство 'user' очищается шиной инвалидации при любом изменении User
+    identity = cache.namespace('user').get_or_set(
+        user_id,
+        lambda: _load_identity(user_id),
+        ttl=current_app.config['USER_CACHE_TTL']
+    )
+    if identity is None or identity['session_version'] != version:
+        return None
+    return CurrentUser(identity)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import gzip
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+# Устаревшее, но распространенное имя типа MessagePack
+MIMETYPE_ALIASES = {'application/x-msgpack': MSGPACK}
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """jsonify() для API: формат ответа выбирается по заголовку Accept.
+
+    Без Accept или с application/json ответ остается JSON; MessagePack
+    и CBOR доступны, если установлены msgpack / cbor2. Вне API-blueprints
+    поведение не меняется.
+    """
+
+    def response(self, *args, **kwargs):
+        mimetype = negotiation.binary_mimetype()
+        if mimetype is None:
+            response = super().response(*args, **kwargs)
+        else:
+            data = self._prepare_response_obj(args, kwargs)
+            response = Response(negotiation.encode(data, mimetype, self.default), mimetype=mimetype)
+        if negotiation.applies():
+            response.vary.add('Accept')
+        return response
+
+
+class Negotiation:
+    """Согласование формата и сжатия ответов API.
+
+    Формат: JSON, MessagePack или CBOR по Accept (jsonify через
+    NegotiatingJSONProvider). Сжатие: brotli или gzip по Accept-Encoding
+    для ответов от API_COMPRESS_MIN_SIZE байт; мелкие ответы дешевле
+    отдать как есть. HTML-страницы не сжимаются на уровне приложения:
+    в них есть CSRF-токены (атака BREACH).
+    """
+
+    def __init__(self, app=None):
+        self.blueprints = ()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('API_BLUEPRINTS', ('api',))
+        app.config.setdefault('API_COMPRESS_MIN_SIZE', 512)
+        app.config.setdefault('API_GZIP_LEVEL', 6)
+        app.config.setdefault('API_BROTLI_QUALITY', 5)
+        app.extensions['negotiation'] = self
+        self.blueprints = tuple(app.config['API_BLUEPRINTS'])
+        self.min_size = app.config['API_COMPRESS_MIN_SIZE']
+        self.gzip_level = app.config['API_GZIP_LEVEL']
+        self.brotli_quality = app.config['API_BROTLI_QUALITY']
+        app.json = NegotiatingJSONProvider(app)
+        app.after_request(self.compress)
+
+    def applies(self):
+        return request.blueprint in self.blueprints
+
+    @property
+    def formats(self):
+        formats = [JSON]
+        if msgpack is not None:
+            formats += [MSGPACK, 'application/x-msgpack']
+        if cbor2 is not None:
+            formats.append(CBOR)
+        return formats
+
+    def binary_mimetype(self):
+        """Бинарный тип ответа или None, если клиенту нужен JSON"""
+        if not self.applies():
+            return None
+        best = request.accept_mimetypes.best_match(self.formats, default=JSON)
+        best = MIMETYPE_ALIASES.get(best, best)
+        return None if best == JSON else best
+
+    def encode(self, data, mimetype, default):
+        if mimetype == MSGPACK:
+            return msgpack.packb(data, default=default, use_bin_type=True)
+        return cbor2.dumps(data, default=lambda encoder, value: encoder.encode(default(value)))
+
+    def choose_encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, response):
+        if not self.applies():
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or request.method == 'HEAD'):
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=self.brotli_quality)
+        else:
+            data = gzip.compress(data, self.gzip_level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # Сжатое тело отличается побайтно: сильный ETag становится слабым
+            response.set_etag(etag, weak=True)
+        return response
+
+
+negotiation = Negotiation()
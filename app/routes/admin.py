@@ -1,9 +1,16 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
-from datetime import datetime
-from app import db
+from datetime import datetime, timedelta
+from app import db, cache
 from flask import Blueprint
-from app.models import User, Product, Tariff, License, Device, BalanceHistory, Notification
+from app.models import User, Product, Tariff, License, Device, BalanceHistory, Notification, ActivityRollup, AuditLog, LicenseIp, SharingFlag
+from app.utils import to_money
+from app import services
+from app.services import ServiceError
+from app.routing import router
+from app.catalog import catalog
+from app.audit import audit
+from app import search
 bp = Blueprint('admin', __name__)
 @bp.before_request
 def restrict_to_admins():
@@ -43,6 +50,7 @@ def toggle_user_admin(user_id):
     
     user.is_admin = not user.is_admin
     db.session.commit()
+    audit.record('user.toggle_admin', 'user', user.id, is_admin=user.is_admin)
     
     status = "назначен администратором" if user.is_admin else "лишен прав администратора"
     flash(f'Пользователь {user.username} {status}', 'success')
@@ -51,41 +59,20 @@ def toggle_user_admin(user_id):
 @bp.route('/user/<int:user_id>/balance', methods=['POST'])
 @login_required
 def update_user_balance(user_id):
-    user = User.query.get_or_404(user_id)
-    amount = float(request.form.get('amount', 0))
+    amount = to_money(request.form.get('amount', 0))
     description = request.form.get('description', '')
     
-    if amount > 0:
-        user.deposit(amount, description)
-        db.session.commit()
-        
-        # Уведомление пользователю
-        notification = Notification(
-            user_id=user.id,
-            title='Пополнение баланса',
-            message=f'Ваш баланс пополнен на {amount} ₽. {description}'
-        )
-        db.session.add(notification)
-        db.session.commit()
-        
-        flash(f'Баланс пользователя {user.username} пополнен на {amount} ₽', 'success')
-    elif amount < 0:
-        if user.can_afford(abs(amount)):
-            user.charge(abs(amount), description)
-            db.session.commit()
-            
-            notification = Notification(
-                user_id=user.id,
-                title='Списание с баланса',
-                message=f'С вашего баланса списано {abs(amount)} ₽. {description}'
-            )
-            db.session.add(notification)
-            db.session.commit()
-            
-            flash(f'С баланса пользователя {user.username} списано {abs(amount)} ₽', 'success')
-        else:
-            flash('Недостаточно средств на балансе пользователя', 'danger')
+    try:
+        result = services.update_user_balance(user_id, amount, description)
+    except ServiceError as e:
+        if e.code == 'not_found':
+            abort(404)
+        flash(e.message, 'danger')
+        return redirect(url_for('admin.admin_users'))
     
+    if result.message:
+        audit.record('user.balance', 'user', user_id, amount=amount, description=description)
+        flash(result.message, 'success')
     return redirect(url_for('admin.admin_users'))
 
 @bp.route('/products')
@@ -107,6 +94,7 @@ def create_product():
     product = Product(name=name, description=description)
     db.session.add(product)
     db.session.commit()
+    audit.record('product.create', 'product', product.id, name=name)
     
     flash(f'Продукт "{name}" создан успешно', 'success')
     return redirect(url_for('admin.admin_products'))
@@ -117,6 +105,7 @@ def toggle_product(product_id):
     product = Product.query.get_or_404(product_id)
     product.is_active = not product.is_active
     db.session.commit()
+    audit.record('product.toggle', 'product', product.id, is_active=product.is_active)
     
     status = "активирован" if product.is_active else "деактивирован"
     flash(f'Продукт "{product.name}" {status}', 'success')
@@ -125,8 +114,9 @@ def toggle_product(product_id):
 @bp.route('/tariffs')
 @login_required
 def admin_tariffs():
-    tariffs = Tariff.query.join(Product).all()
-    products = Product.query.filter_by(is_active=True).all()
+    snapshot = catalog.snapshot
+    tariffs = snapshot.all_tariffs()
+    products = snapshot.active_products()
     return render_template('admin/tariffs.html', tariffs=tariffs, products=products)
 
 @bp.route('/tariff/create', methods=['POST'])
@@ -135,9 +125,10 @@ def create_tariff():
     product_id = request.form.get('product_id')
     name = request.form.get('name')
     description = request.form.get('description')
-    price = float(request.form.get('price', 0))
+    price = to_money(request.form.get('price', 0))
     period_days = int(request.form.get('period_days', 0))
     max_devices = int(request.form.get('max_devices', 1))
+    device_inactivity_days = int(request.form.get('device_inactivity_days') or 0)
     key_prefix = request.form.get('key_prefix', '')
     
     if not all([product_id, name, key_prefix]):
@@ -151,11 +142,13 @@ def create_tariff():
         price=price,
         period_days=period_days,
         max_devices=max_devices,
+        device_inactivity_days=max(device_inactivity_days, 0),
         key_prefix=key_prefix.upper()
     )
     
     db.session.add(tariff)
     db.session.commit()
+    audit.record('tariff.create', 'tariff', tariff.id, name=name, product_id=product_id, price=price)
     
     flash(f'Тариф "{name}" создан успешно', 'success')
     return redirect(url_for('admin.admin_tariffs'))
@@ -172,6 +165,7 @@ def admin_toggle_license(license_id):
     license = License.query.get_or_404(license_id)
     license.is_active = not license.is_active
     db.session.commit()
+    audit.record('license.toggle', 'license', license.id, is_active=license.is_active)
     
     status = "активирована" if license.is_active else "деактивирована"
     flash(f'Лицензия {license.key} {status}', 'success')
@@ -186,6 +180,7 @@ def add_to_blacklist(license_id):
     if ip:
         license.add_blacklisted_ip(ip)
         db.session.commit()
+        audit.record('license.blacklist_add', 'license', license.id, ip=ip)
         flash(f'IP {ip} добавлен в черный список', 'success')
     
     return redirect(url_for('main.license_detail', license_id=license.id))
@@ -199,6 +194,7 @@ def remove_from_blacklist(license_id):
     if ip:
         license.remove_blacklisted_ip(ip)
         db.session.commit()
+        audit.record('license.blacklist_remove', 'license', license.id, ip=ip)
         flash(f'IP {ip} удален из черного списка', 'success')
     
     return redirect(url_for('main.license_detail', license_id=license.id))
@@ -212,6 +208,79 @@ def admin_notifications():
     
     return render_template('admin/notifications.html', notifications=notifications)
 
+@bp.route('/search')
+@login_required
+def admin_search():
+    """Поиск по ключам, логинам, email, IP и installation_id"""
+    query = request.args.get('q', '').strip()
+    results = search.search(query) if query else None
+    return render_template('admin/search.html', query=query, results=results,
+                           min_length=search.MIN_QUERY_LENGTH)
+
+@bp.route('/sharing')
+@login_required
+def admin_sharing():
+    """Подозрение на передачу ключей: отметки detect_ip_sharing и общие адреса"""
+    from sqlalchemy import func
+    from sqlalchemy.orm import joinedload
+    
+    config = current_app.config
+    since = datetime.utcnow() - timedelta(hours=config['IP_SHARING_WINDOW_HOURS'])
+    flags = SharingFlag.query.options(joinedload(SharingFlag.license)).order_by(
+        (SharingFlag.distinct_ips * 1.0 / func.nullif(SharingFlag.ip_limit, 0)).desc().nulls_last()
+    ).limit(100).all()
+    
+    # Адреса, с которых в окне обращались много разных лицензий
+    licenses_count = func.count(LicenseIp.license_id.distinct())
+    shared_ips = db.session.query(LicenseIp.ip, licenses_count).filter(
+        LicenseIp.last_seen >= since
+    ).group_by(LicenseIp.ip).having(
+        licenses_count > config['IP_SHARING_LICENSES_PER_IP']
+    ).order_by(licenses_count.desc()).limit(50).all()
+    
+    # Адреса выбранной лицензии (уникальный индекс license_id, ip)
+    license = None
+    addresses = []
+    license_id = request.args.get('license_id', type=int)
+    if license_id:
+        license = License.query.get_or_404(license_id)
+        addresses = LicenseIp.query.filter_by(license_id=license_id).order_by(
+            LicenseIp.last_seen.desc()
+        ).limit(200).all()
+    
+    return render_template('admin/sharing.html', flags=flags, shared_ips=shared_ips,
+                           license=license, addresses=addresses, since=since,
+                           window_hours=config['IP_SHARING_WINDOW_HOURS'])
+
+@bp.route('/audit')
+@login_required
+def admin_audit():
+    """Журнал аудита: новые записи сверху, курсор ?before=<id>"""
+    # Свежие записи еще могут лежать в буфере этого процесса
+    audit.flush()
+    
+    filters = {
+        'actor_id': request.args.get('actor_id', type=int),
+        'action': request.args.get('action') or None,
+        'target_type': request.args.get('target_type') or None,
+        'target_id': request.args.get('target_id', type=int),
+    }
+    query = AuditLog.query
+    for column, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(AuditLog, column) == value)
+    
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(AuditLog.id < before)
+    
+    per_page = 50
+    entries = query.order_by(AuditLog.id.desc()).limit(per_page + 1).all()
+    next_cursor = entries[per_page - 1].id if len(entries) > per_page else None
+    
+    return render_template('admin/audit.html', entries=entries[:per_page], filters=filters,
+                           next_cursor=next_cursor)
+
 @bp.route('/statistics')
 @login_required
 def admin_statistics():
@@ -223,8 +292,9 @@ def admin_statistics():
         scalar() or 0
     
     active_licenses_count = License.query.filter_by(is_active=True).count()
+    # Состояние истечения хранится в expired_at (планировщик expire_licenses)
     expired_licenses = License.query.filter(
-        License.valid_until < datetime.utcnow(),
+        License.expired_at.isnot(None),
         License.is_active == True
     ).count()
     
@@ -237,8 +307,26 @@ def admin_statistics():
       join(Tariff, License.tariff_id == Tariff.id).\
       group_by(Product.id).all()
     
+    # Активность устройств из сверток (задача rollup_heartbeats)
+    last_day = db.session.query(func.max(ActivityRollup.bucket)).filter(
+        ActivityRollup.period == 'day'
+    ).scalar()
+    product_activity = db.session.query(
+        Product.name,
+        Tariff.name,
+        func.sum(ActivityRollup.active_devices)
+    ).join(Product, ActivityRollup.product_id == Product.id).\
+      join(Tariff, ActivityRollup.tariff_id == Tariff.id).\
+      filter(ActivityRollup.period == 'day', ActivityRollup.bucket == last_day).\
+      group_by(Product.name, Tariff.name).all() if last_day is not None else []
+    
     return render_template('admin/statistics.html',
                          revenue=revenue,
                          active_licenses_count=active_licenses_count,
                          expired_licenses=expired_licenses,
-                         product_stats=product_stats)
\ No newline at end of file
+                         product_stats=product_stats,
+                         hourly_activity=ActivityRollup.series('hour', 48),
+                         daily_activity=ActivityRollup.series('day', 30),
+                         product_activity=product_activity,
+                         cache_stats=cache.stats(),
+                         db_stats=router.stats() if router.replicas else None)
\ No newline at end of file
@@ -1,10 +1,47 @@
-from flask import jsonify, request
-from datetime import datetime
+from flask import current_app, jsonify, request
+from datetime import datetime, timedelta
+from sqlalchemy import and_, select
 from app import db
 from app.models import Product, License, Device, Notification, User
+from app.heartbeats import heartbeats
+from app.ipindex import ipindex
+from app.fragments import Lazy
+from app.webhooks import webhooks
+from app.audit import audit
+from app.routing import read_only, router
 from flask import Blueprint
 bp = Blueprint('api', __name__)
 
+
+def requested_fields(data=None):
+    """Поля ответа из ?fields=a,b.c или {"fields": [...]}; None - все поля"""
+    fields = request.args.get('fields') or (data or {}).get('fields')
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return {str(field).strip() for field in fields if str(field).strip()}
+
+
+def sparse(spec, fields, always=(), prefix=''):
+    """Собрать ответ по спецификации, вызывая функции только для нужных полей.
+
+    Имя объекта (license) выбирает его целиком, путь (license.valid_until) -
+    одно поле; вложенные объекты без выбранных полей в ответ не попадают.
+    """
+    result = {}
+    for name, value in spec.items():
+        path = prefix + name
+        selected = fields is None or path in fields or path in always
+        if isinstance(value, dict):
+            nested = sparse(value, None if selected else fields, always, path + '.')
+            if selected or nested:
+                result[name] = nested
+        elif selected:
+            result[name] = value() if callable(value) else value
+    return result
+
+
 @bp.route('/device/<int:product_id>/<key>/register', methods=['POST'])
 def device_register(product_id, key):
     """
@@ -50,6 +87,8 @@ def device_register(product_id, key):
         existing_device.last_seen = datetime.utcnow()
         existing_device.name = hostname
         db.session.commit()
+        heartbeats.record(existing_device.id, license.id, license.product_id, license.tariff_id)
+        ipindex.record(license.id, ip_address)
         
         return jsonify({
             "installation_id": existing_device.installation_id,
@@ -57,8 +96,14 @@ def device_register(product_id, key):
             "message": "Устройство уже зарегистрировано. Возвращен существующий ID."
         }), 200
     
+    tariff = license.tariff_info
+    if tariff is None:
+        return jsonify({"error": "Тариф лицензии не найден"}), 409
+    
     # Если устройство с таким IP не найдено, проверяем лимит
-    if current_devices >= license.tariff.max_devices:
+    if current_devices >= tariff.max_devices:
+        # Попытки сверх лимита с новых адресов - тоже признак передачи ключа
+        ipindex.record(license.id, ip_address)
         return jsonify({"error": "Достигнут лимит устройств"}), 403
     
     # Создаем новое устройство
@@ -74,8 +119,12 @@ def device_register(product_id, key):
     
     # Создаем уведомление о новом устройстве
     license.notify_new_device(device.name, device.ip_address)
+    webhooks.emit(db.session, 'device.registered', license, device=device)
     
     db.session.commit()
+    heartbeats.record(device.id, license.id, license.product_id, license.tariff_id)
+    ipindex.record(license.id, ip_address)
+    audit.record('device.register', 'license', license.id, device_id=device.id, name=device.name)
     
     return jsonify({
         "installation_id": device.installation_id,
@@ -84,10 +133,12 @@ def device_register(product_id, key):
     }), 200
 
 @bp.route('/license/<int:product_id>/<key>', methods=['POST'])
+@read_only
 def license_check(product_id, key):
     """
     Проверка лицензии
-    Возвращает статус лицензии
+    Возвращает статус лицензии; fields (в query или теле) ограничивает
+    ответ, например fields=valid,license.valid_until
     """
     data = request.get_json(silent=True) or {}
     installation_id = data.get('installation_id')
@@ -95,21 +146,21 @@ def license_check(product_id, key):
     if not installation_id:
         return jsonify({"error": "installation_id обязателен"}), 400
     
-    # Поиск лицензии
-    license = License.query.filter_by(
-        product_id=product_id,
-        key=key
-    ).first()
+    # Лицензия и устройство одним запросом по уникальным индексам
+    query = select(License, Device).outerjoin(
+        Device, and_(Device.license_id == License.id, Device.installation_id == installation_id)
+    ).where(License.product_id == product_id, License.key == key)
+    row = db.session.execute(query).first()
+    if (not row or not row[1]) and router.use_replica(db.session):
+        # Только что созданных лицензии или устройства на реплике может
+        # еще не быть, а 404 клиент считает окончательным ответом
+        router.use_primary(db.session)
+        row = db.session.execute(query.execution_options(populate_existing=True)).first()
     
-    if not license:
+    if not row:
         return jsonify({"error": "Лицензия не найдена"}), 404
     
-    # Поиск устройства
-    device = Device.query.filter_by(
-        license_id=license.id,
-        installation_id=installation_id
-    ).first()
-    
+    license, device = row
     if not device:
         return jsonify({"error": "Устройство не найдено"}), 404
     
@@ -133,34 +184,40 @@ def license_check(product_id, key):
             "error": "IP адрес заблокирован"
         }), 403
     
-    # Обновляем время последней активности
-    device.last_seen = datetime.utcnow()
-    device.ip_address = ip_address
-    db.session.commit()
-    user = User.query.filter_by(id=license.user_id).first()
+    # Обновляем время последней активности: частые проверки с того же
+    # адреса не пишут в БД, активность все равно попадает в пульс
+    now = datetime.utcnow()
+    resolution = timedelta(seconds=current_app.config['DEVICE_LAST_SEEN_RESOLUTION'])
+    if device.ip_address != ip_address or not device.last_seen or now - device.last_seen >= resolution:
+        device.last_seen = now
+        device.ip_address = ip_address
+        db.session.commit()
+    heartbeats.record(device.id, license.id, license.product_id, license.tariff_id)
+    ipindex.record(license.id, ip_address)
     
-    # Возвращаем информацию о лицензии
-    return jsonify({
+    # Возвращаем информацию о лицензии: вычисляются только запрошенные поля
+    return jsonify(sparse({
         "valid": True,
         "license": {
-            "name": license.name,
-            "product_id": license.product_id,
-            "valid_until": license.valid_until.isoformat() if license.valid_until else None,
-            "max_devices": license.tariff.max_devices,
-            "current_devices": Device.query.filter_by(license_id=license.id).count(),
-            "owner": user.username
+            "name": lambda: license.name,
+            "product_id": lambda: license.product_id,
+            "valid_until": lambda: license.valid_until.isoformat() if license.valid_until else None,
+            "max_devices": lambda: getattr(license.tariff_info, 'max_devices', None),
+            "current_devices": lambda: Device.query.filter_by(license_id=license.id).count(),
+            "owner": lambda: db.session.scalar(select(User.username).where(User.id == license.user_id))
         },
         "device": {
-            "id": device.id,
-            "name": device.name,
-            "last_seen": device.last_seen.isoformat()
+            "id": lambda: device.id,
+            "name": lambda: device.name,
+            "last_seen": lambda: device.last_seen.isoformat()
         }
-    }), 200
+    }, requested_fields(data), always=('valid',))), 200
 
 @bp.route('/license/<int:product_id>/<key>/status', methods=['GET'])
 def license_status(product_id, key):
     """
-    Получение статуса лицензии (без проверки устройства)
+    Получение статуса лицензии (без проверки устройства);
+    поддерживает fields, как и проверка лицензии
     """
     license = License.query.filter_by(
         product_id=product_id,
@@ -170,23 +227,26 @@ def license_status(product_id, key):
     if not license:
         return jsonify({"error": "Лицензия не найдена"}), 404
     
-    devices = Device.query.filter_by(license_id=license.id).all()
+    devices = Lazy(lambda: Device.query.filter_by(license_id=license.id).all())
+    tariff = license.tariff_info
+    if tariff is None:
+        return jsonify({"error": "Тариф лицензии не найден"}), 409
     
-    return jsonify({
+    response = jsonify(sparse({
         "license": {
             "key": license.key,
             "name": license.name,
             "is_active": license.is_active,
             "valid_until": license.valid_until.isoformat() if license.valid_until else None,
             "created_at": license.created_at.isoformat(),
-            "product": license.product.name
+            "product": tariff.product.name if tariff.product else None
         },
         "tariff": {
-            "name": license.tariff.name,
-            "max_devices": license.tariff.max_devices,
-            "period_days": license.tariff.period_days
+            "name": tariff.name,
+            "max_devices": tariff.max_devices,
+            "period_days": tariff.period_days
         },
-        "devices": [
+        "devices": lambda: [
             {
                 "id": device.id,
                 "name": device.name,
@@ -197,6 +257,9 @@ def license_status(product_id, key):
             }
             for device in devices
         ],
-        "device_count": len(devices),
-        "is_valid": license.is_valid()
-    }), 200
\ No newline at end of file
+        "device_count": lambda: len(devices),
+        "is_valid": license.is_valid
+    }, requested_fields()))
+    # Клиенты опрашивают статус с If-None-Match: без изменений - 304 без тела
+    response.add_etag()
+    return response.make_conditional(request)
\ No newline at end of file
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, current_user, login_required
 from app import db
 from app.models import User, Notification
 from app.forms import LoginForm, RegistrationForm
+from app.hashing import hasher
 from flask import Blueprint
 bp = Blueprint('auth', __name__)
 
@@ -18,6 +19,11 @@ def login():
             flash('Неверное имя пользователя или пароль', 'danger')
             return redirect(url_for('auth.login'))
         
+        # Параметры хэширования изменились: пересчитываем, пока пароль известен
+        if hasher.needs_rehash(user.password_hash):
+            user.set_password(form.password.data)
+            db.session.commit()
+        
         login_user(user, remember=form.remember_me.data)
         flash('Вход выполнен успешно!', 'success')
         return redirect(url_for('main.index'))
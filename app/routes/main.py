@@ -1,10 +1,19 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
-from flask_login import login_required, current_user
-from datetime import datetime, timedelta
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, current_app, abort
+from flask_login import login_required, current_user, login_user
+from datetime import datetime
 from app import db
-from app.models import Product, License, Tariff, Device, BalanceHistory, Notification
+from app.models import License, Device, BalanceHistory, Notification, ActivityRollup
 from app.forms import LicenseForm, DeviceForm, ProfileForm
+from app.events import events
+from app.catalog import catalog
+from app.webhooks import webhooks
+from app.audit import audit
+from app.fragments import Lazy
+from app import services
+from app.services import ServiceError
 from flask import Blueprint
+import queue
+import time
 import re 
 
 bp = Blueprint('main', __name__)
@@ -18,14 +27,15 @@ def index():
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    products = Product.query.filter_by(is_active=True).all()
-    licenses = License.query.filter_by(user_id=current_user.id).all()
+    products = catalog.snapshot.active_products()
+    # Запросы выполняются только при промахе кэша фрагментов
+    licenses = Lazy(License.query.filter_by(user_id=current_user.id).all)
     
     # Получаем непрочитанные уведомления
-    notifications = Notification.query.filter_by(
+    notifications = Lazy(Notification.query.filter_by(
         user_id=current_user.id,
         is_read=False
-    ).order_by(Notification.created_at.desc()).limit(5).all()
+    ).order_by(Notification.created_at.desc()).limit(5).all)
     
     return render_template('dashboard/products.html', 
                          products=products, 
@@ -35,12 +45,15 @@ def dashboard():
 @bp.route('/product/<int:product_id>')
 @login_required
 def product_detail(product_id):
-    product = Product.query.get_or_404(product_id)
-    tariffs = Tariff.query.filter_by(product_id=product_id, is_active=True).all()
-    licenses = License.query.filter_by(
+    snapshot = catalog.snapshot
+    product = snapshot.product(product_id)
+    if product is None:
+        abort(404)
+    tariffs = snapshot.tariffs_for(product_id)
+    licenses = Lazy(License.query.filter_by(
         user_id=current_user.id,
         product_id=product_id
-    ).all()
+    ).all)
     
     return render_template('dashboard/product.html', 
                          product=product, 
@@ -58,42 +71,15 @@ def create_license():
         flash('Заполните все поля', 'danger')
         return redirect(request.referrer)
     
-    product = Product.query.get_or_404(product_id)
-    tariff = Tariff.query.get_or_404(tariff_id)
-    
-    if not current_user.can_afford(tariff.price):
-        flash('Недостаточно средств на балансе', 'danger')
+    try:
+        result = services.purchase_license(current_user, product_id, tariff_id, name)
+    except ServiceError as e:
+        if e.code == 'not_found':
+            abort(404)
+        flash(e.message, 'danger')
         return redirect(request.referrer)
     
-    # Создаем лицензию
-    license = License(
-        key=License.generate_key(tariff.key_prefix),
-        product_id=product.id,
-        tariff_id=tariff.id,
-        user_id=current_user.id,
-        name=name,
-        valid_until=datetime.utcnow() if tariff.period_days <= 0 else 
-                   datetime.utcnow() + timedelta(days=tariff.period_days)
-    )
-    
-    # Списание средств
-    if current_user.charge(tariff.price, f"Покупка лицензии {license.key}"):
-        db.session.add(license)
-        db.session.commit()
-        
-        # Уведомление
-        notification = Notification(
-            user_id=current_user.id,
-            title='Лицензия создана',
-            message=f'Лицензия "{name}" успешно создана. Ключ: {license.key}'
-        )
-        db.session.add(notification)
-        db.session.commit()
-        
-        flash(f'Лицензия создана успешно! Ключ: {license.key}', 'success')
-    else:
-        flash('Ошибка при списании средств', 'danger')
-    
+    flash(result.message, 'success')
     return redirect(url_for('main.product_detail', product_id=product_id))
 
 @bp.route('/license/<int:license_id>')
@@ -106,47 +92,28 @@ def license_detail(license_id):
         flash('Доступ запрещен', 'danger')
         return redirect(url_for('main.dashboard'))
     
-    devices = Device.query.filter_by(license_id=license_id).all()
+    devices = Lazy(Device.query.filter_by(license_id=license_id).all)
+    
+    # Свертки активности обновляются раз в HEARTBEAT_ROLLUP_INTERVAL
+    activity_bucket = int(time.time()) // current_app.config['HEARTBEAT_ROLLUP_INTERVAL']
     
     return render_template('dashboard/license.html', 
                          license=license,
                          devices=devices,
+                         hourly_activity=Lazy(lambda: ActivityRollup.series('hour', 48, license_id=license.id)),
+                         daily_activity=Lazy(lambda: ActivityRollup.series('day', 30, license_id=license.id)),
+                         activity_bucket=activity_bucket,
                          now=datetime.utcnow())
 
 @bp.route('/license/<int:license_id>/extend', methods=['POST'])
 @login_required
 def extend_license(license_id):
-    license = License.query.get_or_404(license_id)
-    
-    if license.user_id != current_user.id:
-        flash('Доступ запрещен', 'danger')
-        return redirect(url_for('main.dashboard'))
-    
-    tariff = Tariff.query.get_or_404(license.tariff_id)
-    
-    if not current_user.can_afford(tariff.price):
-        flash('Недостаточно средств на балансе', 'danger')
-        return redirect(url_for('main.license_detail', license_id=license_id))
-    
-    # Продление лицензии
-    if current_user.charge(tariff.price, f"Продление лицензии {license.key}"):
-        if tariff.period_days > 0:
-            license.add_time(tariff.period_days)
-        
-        db.session.commit()
-        
-        notification = Notification(
-            user_id=current_user.id,
-            title='Лицензия продлена',
-            message=f'Лицензия "{license.name}" успешно продлена'
-        )
-        db.session.add(notification)
-        db.session.commit()
-        
-        flash('Лицензия успешно продлена!', 'success')
-    else:
-        flash('Ошибка при списании средств', 'danger')
+    try:
+        result = services.extend_license(current_user, license_id)
+    except ServiceError as e:
+        return _service_error_redirect(e, license_id)
     
+    flash(result.message, 'success')
     return redirect(url_for('main.license_detail', license_id=license_id))
 
 @bp.route('/license/<int:license_id>/add_device', methods=['POST'])
@@ -165,7 +132,11 @@ def add_device(license_id):
     
     # Проверка максимального количества устройств
     current_devices = Device.query.filter_by(license_id=license_id).count()
-    if current_devices >= license.tariff.max_devices:
+    tariff = license.tariff_info
+    if tariff is None:
+        flash('Тариф лицензии не найден', 'danger')
+        return redirect(url_for('main.license_detail', license_id=license_id))
+    if current_devices >= tariff.max_devices:
         flash('Достигнут лимит устройств для этой лицензии', 'danger')
         return redirect(url_for('main.license_detail', license_id=license_id))
     
@@ -177,6 +148,7 @@ def add_device(license_id):
     )
     
     db.session.add(device)
+    webhooks.emit(db.session, 'device.registered', license, device=device)
     db.session.commit()
     
     flash('Устройство добавлено успешно!', 'success')
@@ -192,6 +164,7 @@ def delete_device(license_id, device_id):
         flash('Доступ запрещен', 'danger')
         return redirect(url_for('main.dashboard'))
     
+    webhooks.emit(db.session, 'device.removed', license, device=device)
     db.session.delete(device)
     db.session.commit()
     
@@ -241,8 +214,12 @@ def profile():
         new_password = request.form.get('new_password')
         if new_password:
             current_user.set_password(new_password)
+            # Остальные сессии пользователя перестают действовать
+            current_user.session_version = current_user.model.session_version + 1
         
         db.session.commit()
+        if new_password:
+            login_user(current_user.model)
         flash('Профиль обновлен успешно!', 'success')
         return redirect(url_for('main.profile'))
     
@@ -268,6 +245,40 @@ def mark_notification_read(notification_id):
     
     return redirect(request.referrer or url_for('main.dashboard'))
 
+@bp.route('/events')
+@login_required
+def events_stream():
+    """SSE-поток новых уведомлений и активности устройств пользователя"""
+    user_id = current_user.id
+    keepalive = current_app.config['EVENTS_KEEPALIVE']
+    subscription = events.subscribe(user_id)
+    if subscription is None:
+        # Лимит потоков воркера: браузер переподключится через EVENTS_BUSY_RETRY
+        retry = current_app.config['EVENTS_BUSY_RETRY'] * 1000
+        return Response(f'retry: {retry}\n\n', mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+    try:
+        events.backfill(user_id, subscription, request.headers.get('Last-Event-ID'))
+    except Exception:
+        events.unsubscribe(user_id, subscription)
+        raise
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    yield subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            events.unsubscribe(user_id, subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @bp.route('/balance/deposit')
 @login_required
 def deposit_balance():
@@ -295,6 +306,7 @@ def add_blacklisted_ip(license_id):
         if ip_pattern.match(ip):
             license.add_blacklisted_ip(ip)
             db.session.commit()
+            audit.record('license.blacklist_add', 'license', license.id, ip=ip)
             flash(f'IP {ip} добавлен в черный список', 'success')
         else:
             flash('Неверный формат IP адреса', 'danger')
@@ -315,6 +327,7 @@ def remove_blacklisted_ip(license_id):
     if ip:
         license.remove_blacklisted_ip(ip)
         db.session.commit()
+        audit.record('license.blacklist_remove', 'license', license.id, ip=ip)
         flash(f'IP {ip} удален из черного списка', 'success')
     
     return redirect(url_for('main.license_detail', license_id=license_id))
@@ -323,92 +336,37 @@ def remove_blacklisted_ip(license_id):
 @login_required
 def reset_license_key(license_id):
     """Сбросить ключ лицензии (генерация нового)"""
-    license = License.query.get_or_404(license_id)
+    try:
+        result = services.reset_license_key(current_user, license_id)
+    except ServiceError as e:
+        return _service_error_redirect(e, license_id)
     
-    if license.user_id != current_user.id and not current_user.is_admin:
-        flash('Доступ запрещен', 'danger')
-        return redirect(url_for('main.dashboard'))
-    
-    # Генерируем новый ключ с тем же префиксом
-    old_key = license.key
-    prefix = license.key.split('-')[0]
-    license.key = License.generate_key(prefix)
-    
-    db.session.commit()
-    
-    # Уведомление
-    notification = Notification(
-        user_id=license.user_id,
-        title='Ключ лицензии сброшен',
-        message=f'Ключ лицензии "{license.name}" был сброшен. Старый ключ: {old_key}, новый ключ: {license.key}'
-    )
-    db.session.add(notification)
-    db.session.commit()
-    
-    flash(f'Ключ лицензии сброшен! Новый ключ: {license.key}', 'success')
+    audit.record('license.reset_key', 'license', license_id)
+    flash(result.message, 'success')
     return redirect(url_for('main.license_detail', license_id=license_id))
 
 @bp.route('/license/<int:license_id>/change_tariff', methods=['POST'])
 @login_required
 def change_license_tariff(license_id):
     """Сменить тариф лицензии"""
-    license = License.query.get_or_404(license_id)
-    
-    if license.user_id != current_user.id:
-        flash('Доступ запрещен', 'danger')
-        return redirect(url_for('main.dashboard'))
-    
     new_tariff_id = request.form.get('tariff_id')
     if not new_tariff_id:
         flash('Выберите тариф', 'danger')
         return redirect(url_for('main.license_detail', license_id=license_id))
     
-    new_tariff = Tariff.query.get_or_404(new_tariff_id)
-    
-    # Проверяем, нужна ли доплата
-    price_difference = new_tariff.price - license.tariff.price
-    
-    if price_difference > 0 and not current_user.can_afford(price_difference):
-        flash('Недостаточно средств для смены тарифа', 'danger')
-        return redirect(url_for('main.license_detail', license_id=license_id))
-    
-    # Если новый тариф имеет меньше устройств, проверяем
-    if new_tariff.max_devices < len(license.devices):
-        flash(f'Новый тариф поддерживает только {new_tariff.max_devices} устройств, а у вас {len(license.devices)}. Удалите лишние устройства.', 'danger')
-        return redirect(url_for('main.license_detail', license_id=license_id))
-    
-    # Списание средств если нужно
-    if price_difference > 0:
-        if not current_user.charge(price_difference, f"Смена тарифа лицензии {license.key}"):
-            flash('Ошибка при списании средств', 'danger')
-            return redirect(url_for('main.license_detail', license_id=license_id))
-    
-    # Меняем тариф
-    old_tariff_name = license.tariff.name
-    license.tariff_id = new_tariff.id
-    
-    # Если новый тариф имеет другой период, обновляем дату окончания
-    if new_tariff.period_days > 0:
-        if license.valid_until and license.valid_until > datetime.utcnow():
-            # Продлеваем с текущей даты окончания
-            license.valid_until = license.valid_until + timedelta(days=new_tariff.period_days)
-        else:
-            # Начинаем с текущего времени
-            license.valid_until = datetime.utcnow() + timedelta(days=new_tariff.period_days)
-    else:
-        # Бессрочный тариф
-        license.valid_until = None
-    
-    db.session.commit()
+    try:
+        result = services.change_license_tariff(current_user, license_id, new_tariff_id)
+    except ServiceError as e:
+        return _service_error_redirect(e, license_id)
     
-    # Уведомление
-    notification = Notification(
-        user_id=current_user.id,
-        title='Тариф лицензии изменен',
-        message=f'Тариф лицензии "{license.name}" изменен с "{old_tariff_name}" на "{new_tariff.name}"'
-    )
-    db.session.add(notification)
-    db.session.commit()
-    
-    flash(f'Тариф лицензии изменен на "{new_tariff.name}"', 'success')
+    flash(result.message, 'success')
+    return redirect(url_for('main.license_detail', license_id=license_id))
+
+def _service_error_redirect(error, license_id):
+    """Единая обработка ошибок сервисного слоя для страниц лицензии"""
+    if error.code == 'not_found':
+        abort(404)
+    flash(error.message, 'danger')
+    if error.code == 'forbidden':
+        return redirect(url_for('main.dashboard'))
     return redirect(url_for('main.license_detail', license_id=license_id))
\ No newline at end of file
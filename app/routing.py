@@ -0,0 +1,180 @@
+import random
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_PREFIX = 'replica_'
+
+# Отставание реплики Postgres в секундах; 0 - реплика догнала основную БД
+# (или это не реплика вовсе)
+PG_LAG_QUERY = text(
+    "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+)
+
+
+class ReplicaRouter:
+    """Маршрутизация чтений на реплики.
+
+    Реплики задаются SQLALCHEMY_REPLICA_URIS и становятся binds
+    replica_0, replica_1... GET-запросы и представления с @read_only
+    читают с реплик; запись, чтения после записи в той же сессии и
+    запросы вне HTTP (задачи, CLI) идут в основную БД. После записи
+    браузерная сессия REPLICA_READ_YOUR_WRITES секунд читает из основной
+    БД. Реплики с отставанием больше REPLICA_MAX_LAG или недоступные
+    исключаются до следующей проверки.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self.replicas = []
+        self._health = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reads = {'primary': 0}
+        self.fallbacks = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Вызывается до db.init_app: реплики регистрируются как binds"""
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_MAX_LAG', 5)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('REPLICA_READ_YOUR_WRITES', 10)
+        app.extensions['replicas'] = self
+        self._app = app
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.replicas = []
+        for index, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            if uri.startswith('postgres://'):
+                uri = uri.replace('postgres://', 'postgresql://', 1)
+            key = f"{REPLICA_PREFIX}{index}"
+            binds[key] = uri
+            self.replicas.append(key)
+            self.reads[key] = 0
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+        if self.replicas:
+            app.after_request(self._remember_writes)
+
+    # Выбор БД
+
+    def use_replica(self, session):
+        if not self.replicas or session.info.get('wrote') or session.info.get('primary'):
+            return False
+        if not has_request_context():
+            return False
+        if not (g.get('_read_only') or request.method in ('GET', 'HEAD')):
+            return False
+        return flask_session.get('_ryw_until', 0) < time.time()
+
+    def pick(self, engines):
+        """Случайная здоровая реплика или None (чтение уйдет в основную БД)"""
+        self._ensure_started()
+        healthy = [key for key in self.replicas if self._health.get(key, {}).get('healthy')]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        key = random.choice(healthy)
+        self.reads[key] += 1
+        return engines[key]
+
+    def use_primary(self, session):
+        """Дальнейшие чтения сессии - из основной БД (повтор промаха на реплике)"""
+        session.info['primary'] = True
+
+    def mark_write(self, session):
+        session.info['wrote'] = True
+        if has_request_context():
+            g._db_wrote = True
+
+    def _remember_writes(self, response):
+        # Только для браузерных сессий: API-клиентам cookie не выставляем
+        if g.get('_db_wrote') and flask_session:
+            flask_session['_ryw_until'] = time.time() + self._app.config['REPLICA_READ_YOUR_WRITES']
+        return response
+
+    # Проверка отставания
+
+    def check(self):
+        """Обновить состояние всех реплик"""
+        from app import db
+        max_lag = self._app.config['REPLICA_MAX_LAG']
+        with self._app.app_context():
+            engines = db.engines
+            for key in self.replicas:
+                engine = engines[key]
+                state = {'healthy': False, 'lag': None, 'error': None, 'checked_at': time.time()}
+                try:
+                    with engine.connect() as conn:
+                        if engine.dialect.name == 'postgresql':
+                            state['lag'] = float(conn.execute(PG_LAG_QUERY).scalar())
+                        else:
+                            conn.execute(text('SELECT 1'))
+                            state['lag'] = 0.0
+                    state['healthy'] = state['lag'] <= max_lag
+                except Exception as e:
+                    state['error'] = str(e)
+                    self._app.logger.warning('Реплика %s недоступна: %s', key, e)
+                self._health[key] = state
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='replica-check', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                self._app.logger.exception('Ошибка проверки реплик')
+            time.sleep(self._app.config['REPLICA_CHECK_INTERVAL'])
+
+    def stats(self):
+        total = sum(self.reads.values())
+        return {
+            'reads': dict(self.reads),
+            'replica_share': (total - self.reads['primary']) / total if total else 0.0,
+            'fallbacks': self.fallbacks,
+            'replicas': {key: dict(self._health.get(key, {})) for key in self.replicas}
+        }
+
+
+class RoutingSession(Session):
+    """Сессия Flask-SQLAlchemy, отправляющая чтения на реплики"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and router.replicas:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                router.mark_write(self)
+            elif (getattr(clause, 'is_select', False)
+                  and getattr(clause, '_for_update_arg', None) is None
+                  and router.use_replica(self)):
+                engine = router.pick(self._db.engines)
+                if engine is not None:
+                    return engine
+                router.reads['primary'] += 1
+            elif getattr(clause, 'is_select', False):
+                router.reads['primary'] += 1
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Разрешить чтение с реплик в не-GET представлении (до первой записи)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g._read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+router = ReplicaRouter()
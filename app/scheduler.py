@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+class Scheduler:
+    """Простой планировщик периодических задач.
+
+    Задачи регистрируются декоратором job() в app/jobs.py; интервал берется
+    из ключа конфигурации (в секундах, 0 отключает задачу). Запускается
+    отдельным процессом (flask scheduler run, сервис scheduler в
+    docker-compose.yml) или фоновым потоком (start()). Сервер приложения
+    (python -m app.server) планировщик не запускает: задачи должны
+    выполняться ровно в одном процессе.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._jobs = {}
+        self._next_run = {}
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['scheduler'] = self
+        self._app = app
+
+    def job(self, name, interval_key):
+        """Зарегистрировать функцию как периодическую задачу"""
+        def decorator(func):
+            self._jobs[name] = (func, interval_key)
+            return func
+        return decorator
+
+    @property
+    def jobs(self):
+        return sorted(self._jobs)
+
+    def interval(self, name):
+        return self._app.config.get(self._jobs[name][1], 0)
+
+    def run_job(self, name):
+        """Выполнить задачу один раз в контексте приложения"""
+        from app import db
+        func = self._jobs[name][0]
+        with self._app.app_context():
+            started = time.monotonic()
+            try:
+                result = func()
+            except Exception:
+                db.session.rollback()
+                self._app.logger.exception('Задача %s завершилась с ошибкой', name)
+                return None
+            finally:
+                db.session.remove()
+            self._app.logger.info('Задача %s: %s (%.2f с)', name, result, time.monotonic() - started)
+            return result
+
+    def run_pending(self):
+        now = time.monotonic()
+        for name in self.jobs:
+            interval = self.interval(name)
+            if interval <= 0:
+                continue
+            if now >= self._next_run.get(name, 0):
+                self._next_run[name] = now + interval
+                self.run_job(name)
+
+    def run_forever(self, tick=1.0):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(tick)
+
+    def start(self):
+        """Запустить планировщик фоновым потоком текущего процесса"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+scheduler = Scheduler()
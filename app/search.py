@@ -0,0 +1,172 @@
+from sqlalchemy import and_, inspect, or_, select, text
+from app import db
+from app.models import License, User, Device
+
+# Поля поиска: (код, вид результата, модель, колонка).
+# В индексе FTS5 у каждого поля своя колонка с тем же именем,
+# а код входит в rowid: rowid = id * 8 + код
+SEARCH_FIELDS = (
+    (1, 'license', License, 'key'),
+    (2, 'user', User, 'username'),
+    (3, 'user', User, 'email'),
+    (4, 'device', Device, 'ip_address'),
+    (5, 'device', Device, 'installation_id'),
+)
+# Поля с уникальным B-tree индексом: совпадения с начала строки ищутся
+# по нему отдельным запросом, до подстрок
+PREFIX_INDEXED = ('key', 'username', 'email', 'installation_id')
+RESULT_KINDS = ('license', 'user', 'device')
+MIN_QUERY_LENGTH = 3
+FTS_TABLE = 'search_index'
+
+_fts_ready = {}
+
+
+def install():
+    """Создать индексы поиска (идемпотентно; вызывается из flask init-db).
+
+    PostgreSQL: расширение pg_trgm и GIN-индексы gin_trgm_ops, которые
+    используются для ILIKE '%...%'. SQLite: таблица FTS5 с токенизатором
+    trigram, которую поддерживают триггеры на license, user и device.
+    """
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            for _, _, model, column in SEARCH_FIELDS:
+                table = model.__table__.name
+                conn.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm '
+                    f'ON "{table}" USING gin ({column} gin_trgm_ops)'
+                ))
+    elif engine.dialect.name == 'sqlite':
+        created = not inspect(engine).has_table(FTS_TABLE)
+        columns = ', '.join(column for _, _, _, column in SEARCH_FIELDS)
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, tokenize='trigram')"
+            ))
+            for statement in _sqlite_triggers():
+                conn.execute(text(statement))
+        _fts_ready[str(engine.url)] = True
+        if created:
+            rebuild()
+
+
+def rebuild():
+    """Заполнить индекс FTS5 заново из таблиц (SQLite; для PostgreSQL ничего не делает)"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return 0
+    with engine.begin() as conn:
+        conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+        for code, _, model, column in SEARCH_FIELDS:
+            conn.execute(text(
+                f'INSERT INTO {FTS_TABLE}(rowid, {column}) '
+                f'SELECT id * 8 + {code}, {column} FROM "{model.__table__.name}" WHERE {column} IS NOT NULL'
+            ))
+        return conn.execute(text(f'SELECT count(*) FROM {FTS_TABLE}')).scalar()
+
+
+def _sqlite_triggers():
+    tables = {}
+    for code, _, model, column in SEARCH_FIELDS:
+        tables.setdefault(model.__table__.name, []).append((code, column))
+    for table, fields in tables.items():
+        insert = ' '.join(
+            f'INSERT INTO {FTS_TABLE}(rowid, {column}) SELECT new.id * 8 + {code}, new.{column} '
+            f'WHERE new.{column} IS NOT NULL;'
+            for code, column in fields
+        )
+        delete = ' '.join(f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id * 8 + {code};' for code, _ in fields)
+        columns = ', '.join(column for _, column in fields)
+        yield f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ai AFTER INSERT ON "{table}" BEGIN {insert} END'
+        yield (f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_au AFTER UPDATE OF {columns} ON "{table}" '
+               f'BEGIN {delete} {insert} END')
+        yield f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ad AFTER DELETE ON "{table}" BEGIN {delete} END'
+
+
+def _uses_fts(engine):
+    if engine.dialect.name != 'sqlite':
+        return False
+    url = str(engine.url)
+    if url not in _fts_ready:
+        _fts_ready[url] = inspect(engine).has_table(FTS_TABLE)
+    return _fts_ready[url]
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_matches(column, needle, limit):
+    # Фильтр колонки в MATCH отбирает совпадения по индексу, а не перебором
+    match = f'{column} : "' + needle.replace('"', '""') + '"'
+    return db.session.execute(text(
+        f'SELECT rowid / 8, {column} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match LIMIT :limit'
+    ), {'match': match, 'limit': limit}).all()
+
+
+def _prefix_matches(model, column, needle, limit):
+    column = getattr(model, column)
+    if db.engine.dialect.name == 'sqlite':
+        # Диапазон по индексу (BINARY): для исходного, верхнего и нижнего регистра
+        condition = or_(*(
+            and_(column >= variant, column < variant[:-1] + chr(ord(variant[-1]) + 1))
+            for variant in {needle, needle.upper(), needle.lower()}
+        ))
+    else:
+        # PostgreSQL: ILIKE 'needle%' обслуживает тот же триграммный GIN-индекс
+        condition = column.ilike(f'{_escape_like(needle)}%', escape='\\')
+    return db.session.execute(select(model.id, column).where(condition).limit(limit)).all()
+
+
+def _like_matches(model, column, needle, limit):
+    column = getattr(model, column)
+    return db.session.execute(
+        select(model.id, column).where(column.ilike(f'%{_escape_like(needle)}%', escape='\\')).limit(limit)
+    ).all()
+
+
+def search(query, limit=20):
+    """Найти лицензии, пользователей и устройства по подстроке.
+
+    Возвращает {'license': [...], 'user': [...], 'device': [...]}; внутри
+    вида сначала совпадения с начала строки (отдельный запрос по индексу
+    для полей PREFIX_INDEXED), затем остальные подстроки, короткие
+    значения раньше. Из подстрок берутся первые limit совпадений поля без
+    ORDER BY: сортировка всех совпадений частой подстроки (домен почты,
+    подсеть) читала бы их все.
+    Запросы короче MIN_QUERY_LENGTH символов не выполняются: триграммный
+    индекс для них не работает.
+    """
+    needle = (query or '').strip()
+    results = {kind: [] for kind in RESULT_KINDS}
+    if len(needle) < MIN_QUERY_LENGTH:
+        return results
+
+    fts = _uses_fts(db.engine)
+    ranked = {kind: [] for kind in RESULT_KINDS}
+    lowered = needle.lower()
+    for _, kind, model, column in SEARCH_FIELDS:
+        if column in PREFIX_INDEXED:
+            matches = sorted(_prefix_matches(model, column, needle, limit), key=lambda row: len(row[1]))
+            ranked[kind].extend(ident for ident, _ in matches if ident not in ranked[kind])
+    for _, kind, model, column in SEARCH_FIELDS:
+        if len(ranked[kind]) >= limit:
+            continue
+        if fts:
+            matches = _fts_matches(column, needle, limit)
+        else:
+            matches = _like_matches(model, column, needle, limit)
+        matches = sorted(matches, key=lambda row: (not row[1].lower().startswith(lowered), len(row[1])))
+        ranked[kind].extend(ident for ident, _ in matches if ident not in ranked[kind])
+
+    models = {'license': License, 'user': User, 'device': Device}
+    for kind, ids in ranked.items():
+        ids = ids[:limit]
+        if ids:
+            model = models[kind]
+            found = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+            results[kind] = [found[ident] for ident in ids if ident in found]
+    return results
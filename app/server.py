@@ -0,0 +1,177 @@
+"""Production-сервер: python -m app.server [--profile api|admin] [--bind ...]
+
+Приложение создается один раз в мастер-процессе (preload), прогревается
+и наследуется воркерами через fork: шаблоны и другие структуры только
+для чтения разделяются copy-on-write. После fork воркер закрывает
+унаследованные соединения с БД и получает свой идентификатор шины
+инвалидации, а снимок каталога тарифов сбрасывается. HUP перезапускает воркеры плавно; перед выходом воркер
+сбрасывает буфер пульса устройств и останавливает пул хэширования паролей.
+
+В мастере прогреваются шаблоны (и хуки on_preload). Каталог тарифов
+в мастере не загружается: мастер не получает сообщений шины, и воркер,
+пересозданный после max_requests или HUP, унаследовал бы устаревший
+снимок; каждый воркер загружает свой при первом обращении.
+Фильтра ключей и скомпилированных черных списков в приложении нет:
+ключ проверяется по уникальному индексу license.key, а черный список
+хранится CSV в строке лицензии и читается вместе с ней, так что общих
+структур для них не заводится.
+"""
+import argparse
+import os
+
+_preload_hooks = []
+
+
+def on_preload(func):
+    """Зарегистрировать прогрев func(app), выполняемый в мастере до fork"""
+    _preload_hooks.append(func)
+    return func
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count(config):
+    if config['SERVER_WORKERS']:
+        return config['SERVER_WORKERS']
+    return max(1, int(cpu_count() * config['SERVER_WORKERS_PER_CPU']) + 1)
+
+
+def preload(app):
+    """Прогрев в мастере: компиляция шаблонов и зарегистрированные хуки"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        for hook in _preload_hooks:
+            hook(app)
+    # Соединения, открытые при прогреве, не должны достаться воркерам
+    _dispose_engines(app)
+
+
+def _dispose_engines(app):
+    from app import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_fork(app):
+    from app.invalidation import bus
+    from app.catalog import catalog
+    _dispose_engines(app)
+    bus.after_fork()
+    catalog.invalidate()
+
+
+def worker_exit(app):
+    from app.heartbeats import heartbeats
+    from app.hashing import hasher
+    from app.audit import audit
+    from app.ipindex import ipindex
+    heartbeats.flush()
+    ipindex.flush()
+    audit.flush()
+    hasher.shutdown()
+
+
+def gunicorn_options(app, bind):
+    config = app.config
+    return {
+        'bind': bind,
+        'workers': worker_count(config),
+        'worker_class': 'gthread',
+        'threads': config['SERVER_THREADS'],
+        'preload_app': True,
+        'timeout': config['SERVER_TIMEOUT'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+        'keepalive': config['SERVER_KEEPALIVE'],
+        'max_requests': config['SERVER_MAX_REQUESTS'],
+        'max_requests_jitter': config['SERVER_MAX_REQUESTS'] // 10,
+        'accesslog': '-',
+        'post_fork': lambda server, worker: post_fork(app),
+        'worker_exit': lambda server, worker: worker_exit(app),
+    }
+
+
+def run_gunicorn(app, bind):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server(gunicorn_options(app, bind)).run()
+
+
+def wsgi_app():
+    """Фабрика для uvicorn: каждый воркер создает приложение сам"""
+    from app import create_app
+    return create_app()
+
+
+def run_uvicorn(app, bind):
+    # uvicorn запускает воркеры через spawn, preload недоступен
+    import uvicorn
+    host, _, port = bind.rpartition(':')
+    uvicorn.run('app.server:wsgi_app', factory=True, interface='wsgi',
+                host=host or '0.0.0.0', port=int(port),
+                workers=worker_count(app.config),
+                timeout_keep_alive=app.config['SERVER_KEEPALIVE'],
+                timeout_graceful_shutdown=app.config['SERVER_GRACEFUL_TIMEOUT'])
+
+
+def choose_backend(name):
+    if name != 'auto':
+        return name
+    try:
+        import fcntl  # noqa: F401  gunicorn работает только на POSIX
+        import gunicorn  # noqa: F401
+        return 'gunicorn'
+    except ImportError:
+        return 'uvicorn'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Production-сервер LicensePro')
+    parser.add_argument('--profile', help='default, api или admin (по умолчанию APP_PROFILE)')
+    parser.add_argument('--bind', help='адрес:порт (по умолчанию SERVER_BIND)')
+    parser.add_argument('--workers', type=int, help='число воркеров (по умолчанию по CPU)')
+    parser.add_argument('--threads', type=int, help='потоков на воркер')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        # Воркеры uvicorn создают приложение заново и читают профиль из окружения
+        os.environ['APP_PROFILE'] = args.profile
+
+    from app import create_app
+    app = create_app()
+    if args.workers:
+        app.config['SERVER_WORKERS'] = args.workers
+    if args.threads:
+        app.config['SERVER_THREADS'] = args.threads
+    bind = args.bind or app.config['SERVER_BIND']
+
+    backend = choose_backend(app.config['SERVER_BACKEND'])
+    if backend == 'gunicorn':
+        preload(app)
+        run_gunicorn(app, bind)
+    elif backend == 'uvicorn':
+        run_uvicorn(app, bind)
+    else:
+        raise SystemExit(f"Неизвестный SERVER_BACKEND: {backend}")
+
+
+if __name__ == '__main__':
+    main()
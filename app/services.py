@@ -0,0 +1,193 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import db
+from app.models import User, License, Device, Notification
+from app.catalog import catalog
+from app.utils import to_money
+from app.webhooks import webhooks
+
+# Результат операции; message собирается до commit, чтобы после
+# commit не перечитывать истекшие атрибуты из БД
+ServiceResult = namedtuple('ServiceResult', ['obj', 'message'])
+
+
+class ServiceError(Exception):
+    """Ошибка бизнес-операции; code: not_found, forbidden, invalid, invalid_tariff, insufficient_funds"""
+
+    def __init__(self, message, code='invalid'):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+@contextmanager
+def unit_of_work():
+    """Одна транзакция и один commit на всю операцию"""
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _notify(user_id, title, message):
+    db.session.add(Notification(user_id=user_id, title=title, message=message))
+
+
+def _charge(user, amount, description):
+    if not user.charge(amount, description):
+        raise ServiceError('Недостаточно средств на балансе', 'insufficient_funds')
+
+
+def _catalog_tariff(tariff_id, product_id=None):
+    try:
+        tariff = catalog.tariff(int(tariff_id))
+    except (TypeError, ValueError):
+        tariff = None
+    if tariff is None or (product_id is not None and str(tariff.product_id) != str(product_id)):
+        raise ServiceError('Тариф не найден', 'not_found')
+    return tariff
+
+
+def purchase_license(user, product_id, tariff_id, name):
+    """Покупка лицензии: тариф и продукт из снимка каталога, один commit"""
+    tariff = _catalog_tariff(tariff_id, product_id)
+
+    with unit_of_work():
+        license = License(
+            key=License.generate_key(tariff.key_prefix),
+            product_id=tariff.product_id,
+            tariff_id=tariff.id,
+            user_id=user.id,
+            name=name,
+            valid_until=datetime.utcnow() if tariff.period_days <= 0 else
+                        datetime.utcnow() + timedelta(days=tariff.period_days)
+        )
+        _charge(user, tariff.price, f"Покупка лицензии {license.key}")
+        db.session.add(license)
+        webhooks.emit(db.session, 'license.created', license)
+        _notify(user.id, 'Лицензия создана',
+                f'Лицензия "{name}" успешно создана. Ключ: {license.key}')
+        result = ServiceResult(license, f'Лицензия создана успешно! Ключ: {license.key}')
+    return result
+
+
+def _load_license(user, license_id, allow_admin=False):
+    license = License.query.filter(License.id == license_id).first()
+    if license is None:
+        raise ServiceError('Лицензия не найдена', 'not_found')
+    if license.user_id != user.id and not (allow_admin and user.is_admin):
+        raise ServiceError('Доступ запрещен', 'forbidden')
+    return license
+
+
+def extend_license(user, license_id):
+    """Продление лицензии на период текущего тарифа"""
+    license = _load_license(user, license_id)
+    tariff = license.tariff_info
+    if tariff is None:
+        raise ServiceError('Тариф лицензии не найден', 'not_found')
+
+    with unit_of_work():
+        _charge(user, tariff.price, f"Продление лицензии {license.key}")
+        if tariff.period_days > 0:
+            license.add_time(tariff.period_days)
+        webhooks.emit(db.session, 'license.extended', license)
+        _notify(user.id, 'Лицензия продлена', f'Лицензия "{license.name}" успешно продлена')
+        result = ServiceResult(license, 'Лицензия успешно продлена!')
+    return result
+
+
+def change_license_tariff(user, license_id, new_tariff_id):
+    """Смена тарифа: лицензия и число устройств одним запросом, тарифы из каталога"""
+    device_count = db.session.query(func.count(Device.id)).filter(
+        Device.license_id == License.id
+    ).scalar_subquery()
+    row = db.session.query(License, device_count).filter(License.id == license_id).first()
+    if row is None:
+        raise ServiceError('Лицензия не найдена', 'not_found')
+    license, devices = row
+    new_tariff = _catalog_tariff(new_tariff_id)
+    if license.user_id != user.id:
+        raise ServiceError('Доступ запрещен', 'forbidden')
+    if new_tariff.product_id != license.product_id:
+        raise ServiceError('Тариф не относится к продукту лицензии', 'invalid_tariff')
+
+    old_tariff = license.tariff_info
+    if old_tariff is None:
+        raise ServiceError('Тариф лицензии не найден', 'not_found')
+    price_difference = new_tariff.price - old_tariff.price
+
+    # Если новый тариф имеет меньше устройств, проверяем
+    if new_tariff.max_devices < devices:
+        raise ServiceError(f'Новый тариф поддерживает только {new_tariff.max_devices} устройств, '
+                           f'а у вас {devices}. Удалите лишние устройства.')
+
+    with unit_of_work():
+        if price_difference > 0:
+            _charge(user, price_difference, f"Смена тарифа лицензии {license.key}")
+
+        old_tariff_name = old_tariff.name
+        license.tariff_id = new_tariff.id
+        license.clear_expiry('change_tariff')
+
+        # Если новый тариф имеет другой период, обновляем дату окончания
+        if new_tariff.period_days > 0:
+            if license.valid_until and license.valid_until > datetime.utcnow():
+                license.valid_until = license.valid_until + timedelta(days=new_tariff.period_days)
+            else:
+                license.valid_until = datetime.utcnow() + timedelta(days=new_tariff.period_days)
+        else:
+            # Бессрочный тариф
+            license.valid_until = None
+
+        webhooks.emit(db.session, 'license.tariff_changed', license, old_tariff_id=old_tariff.id)
+        _notify(user.id, 'Тариф лицензии изменен',
+                f'Тариф лицензии "{license.name}" изменен с "{old_tariff_name}" на "{new_tariff.name}"')
+        result = ServiceResult(license, f'Тариф лицензии изменен на "{new_tariff.name}"')
+    return result
+
+
+def reset_license_key(user, license_id):
+    """Сброс ключа лицензии с сохранением префикса"""
+    license = License.query.filter(License.id == license_id).first()
+    if license is None:
+        raise ServiceError('Лицензия не найдена', 'not_found')
+    if license.user_id != user.id and not user.is_admin:
+        raise ServiceError('Доступ запрещен', 'forbidden')
+
+    with unit_of_work():
+        old_key = license.key
+        prefix = license.key.split('-')[0]
+        license.key = License.generate_key(prefix)
+        webhooks.emit(db.session, 'license.key_reset', license, old_key=old_key)
+        _notify(license.user_id, 'Ключ лицензии сброшен',
+                f'Ключ лицензии "{license.name}" был сброшен. Старый ключ: {old_key}, новый ключ: {license.key}')
+        result = ServiceResult(license, f'Ключ лицензии сброшен! Новый ключ: {license.key}')
+    return result
+
+
+def update_user_balance(user_id, amount, description=''):
+    """Пополнение (amount > 0) или списание (amount < 0) баланса администратором"""
+    amount = to_money(amount)
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise ServiceError('Пользователь не найден', 'not_found')
+    if amount == 0:
+        return ServiceResult(user, None)
+
+    with unit_of_work():
+        if amount > 0:
+            user.deposit(amount, description)
+            _notify(user.id, 'Пополнение баланса', f'Ваш баланс пополнен на {amount} ₽. {description}')
+            message = f'Баланс пользователя {user.username} пополнен на {amount} ₽'
+        else:
+            if not user.charge(abs(amount), description):
+                raise ServiceError('Недостаточно средств на балансе пользователя', 'insufficient_funds')
+            _notify(user.id, 'Списание с баланса', f'С вашего баланса списано {abs(amount)} ₽. {description}')
+            message = f'С баланса пользователя {user.username} списано {abs(amount)} ₽'
+        result = ServiceResult(user, message)
+    return result
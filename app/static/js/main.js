@@ -160,4 +160,84 @@ document.addEventListener('DOMContentLoaded', function() {
     
     setInterval(updateRelativeTimes, 60000);
     updateRelativeTimes();
+
+    // Живые события (SSE): уведомления и активность устройств
+    const eventsUrl = document.body.getAttribute('data-events-url');
+    if (eventsUrl && window.EventSource) {
+        const source = new EventSource(eventsUrl);
+        // После переподключения сервер дослает уведомления с перекрытием
+        const seenNotifications = new Set();
+
+        source.addEventListener('notification', function(e) {
+            const notification = JSON.parse(e.data);
+            if (seenNotifications.has(notification.id)) return;
+            seenNotifications.add(notification.id);
+
+            const bell = document.getElementById('notificationBell');
+            if (bell) {
+                let badge = document.getElementById('notificationBadge');
+                if (!badge) {
+                    badge = document.createElement('span');
+                    badge.id = 'notificationBadge';
+                    badge.className = 'position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger';
+                    badge.textContent = '0';
+                    bell.appendChild(badge);
+                }
+                badge.textContent = parseInt(badge.textContent || '0', 10) + 1;
+            }
+
+            const list = document.getElementById('notificationList');
+            if (list) {
+                const empty = list.querySelector('.text-center');
+                if (empty) empty.remove();
+
+                const item = document.createElement('div');
+                item.className = 'dropdown-item d-flex align-items-start py-2 bg-light';
+                const body = document.createElement('div');
+                body.className = 'flex-grow-1';
+                const title = document.createElement('div');
+                title.className = 'fw-semibold';
+                title.textContent = notification.title;
+                const message = document.createElement('div');
+                message.className = 'small text-muted';
+                message.textContent = notification.message.length > 50 ?
+                    notification.message.slice(0, 50) + '...' : notification.message;
+                const time = document.createElement('div');
+                time.className = 'small text-muted mt-1 relative-time';
+                time.setAttribute('data-timestamp', notification.created_at);
+                body.append(title, message, time);
+                item.appendChild(body);
+                list.prepend(item);
+                updateRelativeTimes();
+            }
+        });
+
+        source.addEventListener('device', function(e) {
+            const device = JSON.parse(e.data);
+            const deviceList = document.getElementById('deviceList');
+            if (!deviceList || deviceList.getAttribute('data-license-id') !== String(device.license_id)) {
+                return;
+            }
+
+            const row = deviceList.querySelector(`tr[data-device-id="${device.id}"]`);
+            if (!row) {
+                // Новое устройство: перезагружаем таблицу вместе со страницей
+                if (device.is_new) window.location.reload();
+                return;
+            }
+
+            const ipCell = row.querySelector('.device-ip');
+            if (ipCell && device.ip_address) ipCell.textContent = device.ip_address;
+
+            const lastSeenCell = row.querySelector('.device-last-seen');
+            if (lastSeenCell && device.last_seen) {
+                lastSeenCell.innerHTML = '';
+                const span = document.createElement('span');
+                span.className = 'relative-time';
+                span.setAttribute('data-timestamp', device.last_seen);
+                lastSeenCell.appendChild(span);
+                updateRelativeTimes();
+            }
+        });
+    }
 });
\ No newline at end of file
@@ -1,24 +1,33 @@
 import secrets
-import string
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from app.keys import KeyGenerator, verify_checksum
 
-def generate_license_key(prefix, length=20):
-    """Генерация ключа лицензии"""
-    alphabet = string.ascii_uppercase + string.digits
-    random_part = ''.join(secrets.choice(alphabet) for _ in range(length))
-    return f"{prefix}-{random_part}"
+def generate_license_key(prefix, length=20, checksum=False):
+    """Генерация ключа лицензии (без проверки уникальности в БД)"""
+    return KeyGenerator(length, checksum).generate(prefix)[0]
 
 def generate_installation_id():
     """Генерация ID установки"""
     return secrets.token_hex(16)
 
-def validate_license_key_format(key):
+def validate_license_key_format(key, checksum=False):
     """Проверка формата ключа лицензии"""
     if not key or '-' not in key:
         return False
     prefix, rest = key.split('-', 1)
+    if checksum and not verify_checksum(key):
+        return False
     return len(prefix) > 0 and len(rest) >= 10
 
+def to_money(value):
+    """Приведение суммы к Decimal с точностью до копеек"""
+    if value is None:
+        value = 0
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
 def format_datetime(dt):
     """Форматирование даты"""
     if dt:
@@ -0,0 +1,340 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import event, delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+from app import db
+
+SIGNATURE_HEADER = 'X-LicensePro-Signature'
+EVENTS = ('license.created', 'license.extended', 'license.tariff_changed', 'license.key_reset',
+          'license.blacklist_changed', 'device.registered', 'device.removed')
+
+
+def sign(secret, timestamp, body):
+    """Заголовок подписи: t=<unix-время>,v1=<HMAC-SHA256(secret, "t.тело")>"""
+    mac = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={mac}'
+
+
+def verify_signature(secret, header, body, tolerance=300, now=None):
+    """Проверка подписи на стороне получателя; tolerance защищает от повтора"""
+    parts = dict(item.split('=', 1) for item in (header or '').split(',') if '=' in item)
+    try:
+        timestamp = int(parts['t'])
+    except (KeyError, ValueError):
+        return False
+    now = now if now is not None else time.time()
+    if abs(now - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), f"t={timestamp},v1={parts.get('v1', '')}")
+
+
+class Webhooks:
+    """Доставка событий по лицензиям на адреса интеграторов.
+
+    emit() в изменяющем коде только запоминает событие в сессии; перед
+    commit события раскладываются по подходящим WebhookEndpoint и
+    записываются в webhook_delivery в той же транзакции (outbox): событие
+    сохраняется тогда и только тогда, когда сохранено изменение.
+
+    deliver_pending() (задача планировщика deliver_webhooks) захватывает
+    готовые строки арендой, группирует их по адресу пачками до
+    WEBHOOK_BATCH_SIZE и отправляет из пула потоков через keep-alive
+    соединения одной requests.Session. Тело подписывается HMAC секретом
+    адреса. Неудачная пачка повторяется с экспоненциальной задержкой с
+    джиттером (не раньше Retry-After); после WEBHOOK_MAX_ATTEMPTS попыток
+    строки получают статус dead - их можно вернуть в очередь
+    командой flask webhooks retry. Доставка - не менее одного раза и без
+    гарантии порядка: получатель отбрасывает повторы по id события.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._pool = None
+        self._http = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('WEBHOOK_INTERVAL', 5)
+        app.config.setdefault('WEBHOOK_WORKERS', 8)
+        app.config.setdefault('WEBHOOK_BATCH_SIZE', 100)
+        app.config.setdefault('WEBHOOK_CLAIM_SIZE', 1000)
+        app.config.setdefault('WEBHOOK_TIMEOUT', 10)
+        app.config.setdefault('WEBHOOK_LEASE', 60)
+        app.config.setdefault('WEBHOOK_MAX_ATTEMPTS', 10)
+        app.config.setdefault('WEBHOOK_BACKOFF_BASE', 30)
+        app.config.setdefault('WEBHOOK_BACKOFF_MAX', 6 * 3600)
+        app.config.setdefault('WEBHOOK_RETENTION_DAYS', 7)
+        app.extensions['webhooks'] = self
+        self._app = app
+
+        if not getattr(Webhooks, '_events_registered', False):
+            event.listen(Session, 'before_commit', _before_commit)
+            event.listen(Session, 'after_rollback', _after_rollback)
+            Webhooks._events_registered = True
+
+    # Запись событий
+
+    def emit(self, session, name, license, **data):
+        """Запомнить событие name по лицензии; записывается при commit сессии"""
+        session.info.setdefault('webhooks', []).append((name, license, data))
+
+    def enqueue(self, session, pending):
+        """Разложить события по адресам и вставить строки outbox"""
+        session.flush()
+        from app.models import WebhookEndpoint, WebhookDelivery
+        users = {license.user_id for _, license, _ in pending}
+        endpoints = session.execute(
+            select(WebhookEndpoint.id, WebhookEndpoint.user_id, WebhookEndpoint.events)
+            .where(WebhookEndpoint.is_active == True,
+                   or_(WebhookEndpoint.user_id.is_(None), WebhookEndpoint.user_id.in_(users)))
+        ).all()
+        if not endpoints:
+            return 0
+        now = datetime.utcnow()
+        rows = []
+        for name, license, data in pending:
+            targets = [
+                endpoint.id for endpoint in endpoints
+                if endpoint.user_id in (None, license.user_id)
+                and (endpoint.events == '*' or name in endpoint.events.split(','))
+            ]
+            if not targets:
+                continue
+            payload = json.dumps({
+                'id': uuid.uuid4().hex,
+                'type': name,
+                'created_at': now.isoformat(),
+                'data': {'license': _license_data(license),
+                         **{key: _serialize(value) for key, value in data.items()}},
+            }, ensure_ascii=False)
+            rows.extend({'endpoint_id': endpoint_id, 'event': name, 'payload': payload,
+                         'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+                        for endpoint_id in targets)
+        if rows:
+            session.execute(insert(WebhookDelivery), rows)
+        return len(rows)
+
+    # Доставка
+
+    def _executor(self):
+        # Пул и соединения создаются в процессе, который доставляет (после fork)
+        if self._pid != os.getpid():
+            workers = self._app.config['WEBHOOK_WORKERS']
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+            self._http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            self._http.mount('http://', adapter)
+            self._http.mount('https://', adapter)
+            self._http.headers['User-Agent'] = 'LicensePro-Webhooks/1.0'
+            self._pid = os.getpid()
+        return self._pool
+
+    def deliver_pending(self):
+        """Один проход доставки; возвращает число доставленных событий"""
+        from app.models import WebhookEndpoint, WebhookDelivery
+        config = self._app.config
+        now = datetime.utcnow()
+        active = select(WebhookEndpoint.id).where(WebhookEndpoint.is_active == True)
+        ids = db.session.execute(
+            select(WebhookDelivery.id)
+            .where(WebhookDelivery.status == 'pending', WebhookDelivery.next_attempt_at <= now,
+                   WebhookDelivery.endpoint_id.in_(active))
+            .order_by(WebhookDelivery.next_attempt_at)
+            .limit(config['WEBHOOK_CLAIM_SIZE'])
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        # Аренда: параллельный проход (другой процесс) не возьмет те же строки,
+        # а при падении воркера они вернутся в очередь по истечении аренды
+        claimed = db.session.execute(
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(ids), WebhookDelivery.status == 'pending',
+                   WebhookDelivery.next_attempt_at <= now)
+            .values(next_attempt_at=now + timedelta(seconds=config['WEBHOOK_LEASE']))
+            .returning(WebhookDelivery.id, WebhookDelivery.endpoint_id,
+                       WebhookDelivery.payload, WebhookDelivery.attempts),
+            execution_options={'synchronize_session': False}
+        ).all()
+        db.session.commit()
+        if not claimed:
+            return 0
+
+        endpoints = {
+            row.id: row for row in db.session.execute(
+                select(WebhookEndpoint.id, WebhookEndpoint.url, WebhookEndpoint.secret)
+                .where(WebhookEndpoint.id.in_({row.endpoint_id for row in claimed}))
+            )
+        }
+        by_endpoint = {}
+        for row in sorted(claimed, key=lambda row: row.id):
+            by_endpoint.setdefault(row.endpoint_id, []).append(row)
+        size = config['WEBHOOK_BATCH_SIZE']
+        pool = self._executor()
+        futures = [
+            (rows[i:i + size], pool.submit(self._send, endpoints[endpoint_id], rows[i:i + size]))
+            for endpoint_id, rows in by_endpoint.items()
+            for i in range(0, len(rows), size)
+        ]
+
+        delivered, failed = [], []
+        for rows, future in futures:
+            ok, retry_after, error = future.result()
+            if ok:
+                delivered.extend(row.id for row in rows)
+            else:
+                failed.extend(self._retry(row, retry_after, error) for row in rows)
+        done = datetime.utcnow()
+        if delivered:
+            db.session.execute(
+                update(WebhookDelivery).where(WebhookDelivery.id.in_(delivered))
+                .values(status='delivered', delivered_at=done, last_error=None),
+                execution_options={'synchronize_session': False}
+            )
+        if failed:
+            db.session.execute(update(WebhookDelivery), failed)
+        db.session.commit()
+        return len(delivered)
+
+    def _send(self, endpoint, rows):
+        """POST пачки на адрес; (успех, Retry-After, ошибка). Выполняется в пуле"""
+        body = ('{"events":[' + ','.join(row.payload for row in rows) + ']}').encode()
+        headers = {
+            'Content-Type': 'application/json',
+            SIGNATURE_HEADER: sign(endpoint.secret, int(time.time()), body),
+            'X-LicensePro-Batch': f'{rows[0].id}-{rows[-1].id}',
+        }
+        try:
+            response = self._http.post(endpoint.url, data=body, headers=headers,
+                                       timeout=self._app.config['WEBHOOK_TIMEOUT'])
+        except requests.RequestException as e:
+            return False, None, f'{type(e).__name__}: {e}'[:500]
+        if 200 <= response.status_code < 300:
+            return True, None, None
+        retry_after = response.headers.get('Retry-After')
+        retry_after = int(retry_after) if retry_after and retry_after.isdigit() else None
+        return False, retry_after, f'HTTP {response.status_code}'
+
+    def _retry(self, row, retry_after, error):
+        config = self._app.config
+        attempts = row.attempts + 1
+        values = {'id': row.id, 'attempts': attempts, 'last_error': error}
+        if attempts >= config['WEBHOOK_MAX_ATTEMPTS']:
+            values['status'] = 'dead'
+        else:
+            cap = min(config['WEBHOOK_BACKOFF_MAX'], config['WEBHOOK_BACKOFF_BASE'] * 2 ** (attempts - 1))
+            delay = max(random.uniform(cap / 2, cap), retry_after or 0)
+            values['next_attempt_at'] = datetime.utcnow() + timedelta(seconds=delay)
+        return values
+
+    def requeue_dead(self, endpoint_id=None):
+        """Вернуть события из dead-letter в очередь"""
+        from app.models import WebhookDelivery
+        query = update(WebhookDelivery).where(WebhookDelivery.status == 'dead')
+        if endpoint_id is not None:
+            query = query.where(WebhookDelivery.endpoint_id == endpoint_id)
+        result = db.session.execute(
+            query.values(status='pending', attempts=0, next_attempt_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def prune(self):
+        """Удалить доставленные события старше WEBHOOK_RETENTION_DAYS"""
+        from app.models import WebhookDelivery
+        cutoff = datetime.utcnow() - timedelta(days=self._app.config['WEBHOOK_RETENTION_DAYS'])
+        result = db.session.execute(
+            delete(WebhookDelivery)
+            .where(WebhookDelivery.status == 'delivered', WebhookDelivery.delivered_at < cutoff),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+def _license_data(license):
+    return {
+        'id': license.id,
+        'key': license.key,
+        'name': license.name,
+        'product_id': license.product_id,
+        'tariff_id': license.tariff_id,
+        'user_id': license.user_id,
+        'is_active': license.is_active,
+        'valid_until': license.valid_until.isoformat() if license.valid_until else None,
+    }
+
+
+def _serialize(value):
+    from app.models import Device
+    if isinstance(value, Device):
+        return {
+            'id': value.id,
+            'installation_id': value.installation_id,
+            'name': value.name,
+            'ip_address': value.ip_address,
+        }
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _before_commit(session):
+    pending = session.info.pop('webhooks', None)
+    if pending:
+        webhooks.enqueue(session, pending)
+
+
+def _after_rollback(session):
+    session.info.pop('webhooks', None)
+
+
+def make_receiver(host, port, secret=None, fail_rate=0.0, out=print):
+    """Локальный приемник для проверки доставки: печатает события, проверяет подпись.
+
+    fail_rate - доля ответов 503 с Retry-After: 1 для проверки повторов.
+    Возвращает HTTP-сервер; запуск - serve_forever().
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, как у отправителя
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if secret and not verify_signature(secret, self.headers.get(SIGNATURE_HEADER), body):
+                return self._reply(401, 'bad signature')
+            if random.random() < fail_rate:
+                return self._reply(503, 'try later', {'Retry-After': '1'})
+            for item in json.loads(body)['events']:
+                out(f"{item['created_at']} {item['type']} license={item['data']['license']['id']} id={item['id']}")
+            self._reply(200, 'ok')
+
+        def _reply(self, status, text, headers=None):
+            data = text.encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+webhooks = Webhooks()
@@ -0,0 +1,117 @@
+"""Бенчмарк конкурентных списаний с баланса одного пользователя.
+
+Несколько потоков параллельно покупают за счет одного пользователя.
+Сравниваются старый read-modify-write и атомарный User.charge; после
+прогона проверяется, что баланс и история сходятся (нет потерянных
+обновлений).
+
+    python benchmarks/bench_balance.py --threads 8 --purchases 200
+    DATABASE_URL=postgresql://... python benchmarks/bench_balance.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User, BalanceHistory
+
+PRICE = Decimal('1.00')
+
+
+def make_app():
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+            'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}} \
+            if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def legacy_charge(user, amount, description):
+    """Старая реализация: чтение баланса в Python и запись обратно"""
+    amount = float(amount)
+    if float(user.balance) >= amount:
+        user.balance = Decimal(str(float(user.balance) - amount))
+        db.session.add(BalanceHistory(user_id=user.id, amount=-amount,
+                                      description=description,
+                                      balance_after=user.balance))
+        return True
+    return False
+
+
+def run(app, mode, threads, purchases):
+    with app.app_context():
+        user = User(username=f'bench-{mode}', email=f'{mode}@bench.local',
+                    balance=PRICE * threads * purchases)
+        db.session.add(user)
+        db.session.commit()
+        user_id, start_balance = user.id, user.balance
+
+    successes = []
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        done = 0
+        with app.app_context():
+            barrier.wait()
+            for i in range(purchases):
+                user = db.session.get(User, user_id)
+                if mode == 'legacy':
+                    ok = legacy_charge(user, PRICE, 'bench')
+                else:
+                    ok = user.charge(PRICE, 'bench')
+                db.session.commit()
+                done += ok
+                db.session.expire_all()
+        successes.append(done)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        final = db.session.get(User, user_id).balance
+        history = BalanceHistory.query.filter_by(user_id=user_id).count()
+
+    total = sum(successes)
+    expected = start_balance - PRICE * total
+    lost = int((final - expected) / PRICE)
+    print(f"{mode:>7}: {total} покупок за {elapsed:.2f} с = {total / elapsed:8.1f} покупок/с, "
+          f"история {history}, баланс {final} (ожидалось {expected}), потеряно обновлений: {lost}")
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--purchases', type=int, default=100, help='покупок на поток')
+    parser.add_argument('--mode', choices=['legacy', 'atomic', 'both'], default='both')
+    args = parser.parse_args()
+
+    app = make_app()
+    modes = ['legacy', 'atomic'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        lost = run(app, mode, args.threads, args.purchases)
+        if mode == 'atomic' and lost:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
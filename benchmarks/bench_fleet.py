@@ -0,0 +1,107 @@
+"""Симуляция парка клиентов: нагрузка на сервер лицензий по секундам.
+
+Все клиенты перезапускаются одновременно (t=0), затем сервер лежит
+--outage секунд начиная с --outage-at. Сервер обрабатывает не больше
+--capacity запросов в секунду, остальные получают 503. Сравниваются:
+- lockstep: как LicenseClient из test.py - проверка сразу при старте,
+  затем ровно каждые interval секунд, после ошибки повтор через --retry;
+- sdk: licensepro_client.Schedule - случайный сдвиг старта, джиттер
+  интервала, экспоненциальная задержка с полным джиттером.
+
+Время модельное, сеть не используется.
+
+    python benchmarks/bench_fleet.py --clients 20000 --interval 600
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from licensepro_client.schedule import Schedule
+
+
+class Lockstep:
+    def __init__(self, interval, retry):
+        self.interval = interval
+        self.retry = retry
+
+    def first(self):
+        return 0.0
+
+    def next(self):
+        return self.interval
+
+    def backoff(self, failures, retry_after=None):
+        return self.retry
+
+
+def simulate(schedules, duration, capacity, outage):
+    """Вернуть (запросы по секундам, отказы, секунда восстановления)"""
+    events = [(schedule.first(), index, 0) for index, schedule in enumerate(schedules)]
+    heapq.heapify(events)
+    load, served = Counter(), Counter()
+    rejected = 0
+    pending = set()
+    recovered = None
+    outage_start, outage_end = outage
+    while events:
+        at, index, failures = heapq.heappop(events)
+        if at >= duration:
+            break
+        second = int(at)
+        load[second] += 1
+        down = outage_start <= at < outage_end
+        if down or served[second] >= capacity:
+            rejected += 1
+            if at >= outage_start:
+                pending.add(index)
+            failures += 1
+            delay = schedules[index].backoff(failures, 1.0 if not down else None)
+        else:
+            served[second] += 1
+            pending.discard(index)
+            failures = 0
+            delay = schedules[index].next()
+            if recovered is None and at >= outage_end and not pending:
+                recovered = at - outage_end
+        heapq.heappush(events, (at + delay, index, failures))
+    return load, rejected, recovered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--interval', type=float, default=600, help='интервал проверки, с')
+    parser.add_argument('--retry', type=float, default=5, help='повтор после ошибки в lockstep, с')
+    parser.add_argument('--capacity', type=int, default=200, help='запросов в секунду на сервере')
+    parser.add_argument('--outage-at', type=float, default=1800)
+    parser.add_argument('--outage', type=float, default=120, help='длительность простоя, с')
+    parser.add_argument('--duration', type=float, default=3600)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    outage = (args.outage_at, args.outage_at + args.outage)
+    strategies = {
+        'lockstep': lambda rng: Lockstep(args.interval, args.retry),
+        'sdk': lambda rng: Schedule(args.interval, jitter=0.1, backoff_base=1.0,
+                                    backoff_max=args.interval / 2, rng=rng),
+    }
+    print(f"клиентов {args.clients}, интервал {args.interval:.0f} с, "
+          f"сервер {args.capacity} запр/с, простой {outage[0]:.0f}-{outage[1]:.0f} с")
+    print(f"{'стратегия':>10} {'пик/с':>8} {'p99/с':>8} {'всего':>9} {'отказов':>9} {'восстановление':>15}")
+    for name, factory in strategies.items():
+        rng = random.Random(args.seed)
+        schedules = [factory(rng) for _ in range(args.clients)]
+        load, rejected, recovered = simulate(schedules, args.duration, args.capacity, outage)
+        per_second = sorted(load.get(second, 0) for second in range(int(args.duration)))
+        p99 = per_second[int(len(per_second) * 0.99) - 1]
+        recovery = f"{recovered:.0f} с" if recovered is not None else 'нет'
+        print(f"{name:>10} {per_second[-1]:8d} {p99:8d} {sum(load.values()):9d} {rejected:9d} {recovery:>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Бенчмарк шлюза: проверок лицензий в минуту через AsyncLicenseClient.
+
+Поднимает приложение на локальном порту (многопоточный сервер werkzeug,
+временная SQLite) с --licenses лицензиями по одной установке, затем
+проверяет их пачкой; доля --duplicates запросов повторяет уже
+проверяемые установки и должна объединяться клиентом. Печатает
+пропускную способность и перцентили задержки. Для замера против
+настоящего развертывания используйте --url и --installs (CSV:
+product_id,key,installation_id).
+
+    python benchmarks/bench_gateway.py --licenses 2000 --connections 32
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from licensepro_client import AsyncLicenseClient
+
+
+def local_server(licenses):
+    """Запустить приложение с тестовыми данными; вернуть (url, установки)"""
+    from werkzeug.serving import make_server
+    from config import Config
+    from app import create_app, db
+    from app.models import User, Product, Tariff, License, Device
+
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        PASSWORD_HASH_WORKERS = 0
+
+    app = create_app(BenchConfig)
+    installs = []
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@bench.local')
+        user.set_password('bench')
+        product = Product(name='Bench')
+        db.session.add_all([user, product])
+        db.session.flush()
+        tariff = Tariff(product_id=product.id, name='Bench', price=10, period_days=30,
+                        max_devices=1, key_prefix='BEN')
+        db.session.add(tariff)
+        db.session.flush()
+        for i in range(licenses):
+            license = License(key=f'BEN-{i:08d}', name=f'Bench {i}', user_id=user.id,
+                              product_id=product.id, tariff_id=tariff.id)
+            db.session.add(license)
+            db.session.flush()
+            device = Device(license_id=license.id, installation_id=Device.generate_installation_id(),
+                            name=f'host-{i}', ip_address='127.0.0.1')
+            db.session.add(device)
+            installs.append((product.id, license.key, device.installation_id))
+        db.session.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', installs
+
+
+async def run(url, installs, connections, concurrency, timeout):
+    async with AsyncLicenseClient(url, max_connections=connections, concurrency=concurrency,
+                                  timeout=timeout) as client:
+        started = time.perf_counter()
+        verdicts = await client.check_many(installs)
+        elapsed = time.perf_counter() - started
+        return verdicts, elapsed, client.stats.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--licenses', type=int, default=1000)
+    parser.add_argument('--duplicates', type=float, default=0.1, help='доля повторных проверок')
+    parser.add_argument('--connections', type=int, default=32, help='keep-alive соединений')
+    parser.add_argument('--concurrency', type=int, default=256, help='одновременных вызовов')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--url', help='адрес развернутого сервера вместо локального')
+    parser.add_argument('--installs', help='CSV product_id,key,installation_id для --url')
+    args = parser.parse_args()
+
+    if args.url:
+        with open(args.installs, newline='') as f:
+            installs = [(int(row[0]), row[1], row[2]) for row in csv.reader(f)]
+        url = args.url
+    else:
+        url, installs = local_server(args.licenses)
+    rng = random.Random(1)
+    calls = installs + [rng.choice(installs) for _ in range(int(len(installs) * args.duplicates))]
+    rng.shuffle(calls)
+
+    verdicts, elapsed, report = asyncio.run(run(url, calls, args.connections, args.concurrency, args.timeout))
+    valid = sum(1 for verdict in verdicts if verdict.valid)
+    print(f"вызовов {len(calls)} ({valid} действительных) за {elapsed:.2f} с: "
+          f"{len(calls) / elapsed * 60:,.0f} проверок/мин")
+    for operation, row in report.items():
+        print(f"{operation}: запросов {row['calls']}, объединено {row['coalesced']}, ошибок {row['errors']}; "
+              f"p50 {row['p50']:.1f} мс, p95 {row['p95']:.1f} мс, p99 {row['p99']:.1f} мс, max {row['max']:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Бенчмарк проверки паролей: входов в секунду на ядро.
+
+Для каждого набора параметров хэширования измеряется:
+- проверка в потоке запроса (одно ядро);
+- пул процессов PasswordHasher при параллельных входах;
+- всплеск сверх PASSWORD_HASH_QUEUE: сколько входов отклонено сразу
+  и как быстро.
+
+    python benchmarks/bench_hashing.py --seconds 3 --workers 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+from app.hashing import PasswordHasher, HashingOverloaded
+
+
+def make_hasher(method, workers, queue):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=workers,
+                      PASSWORD_HASH_QUEUE=queue, PASSWORD_HASH_TIMEOUT=60)
+    return PasswordHasher(app)
+
+
+def run_for(seconds, threads, func):
+    """Вызывать func в threads потоках seconds секунд; вернуть число вызовов"""
+    done = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def loop(index):
+        while time.perf_counter() < deadline:
+            func()
+            done[index] += 1
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(done)
+
+
+def burst(hasher, pwhash, size):
+    """size одновременных входов; доля отклоненных и задержка отказа"""
+    rejected = []
+    barrier = threading.Barrier(size)
+
+    def login():
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            hasher.verify(pwhash, 'password')
+        except HashingOverloaded:
+            rejected.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login) for _ in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--method', action='append',
+                        help='параметры werkzeug (можно несколько); по умолчанию scrypt и pbkdf2')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='процессов пула')
+    parser.add_argument('--queue', type=int, default=16, help='PASSWORD_HASH_QUEUE')
+    args = parser.parse_args()
+    methods = args.method or ['scrypt:32768:8:1', 'pbkdf2:sha256:600000']
+
+    for method in methods:
+        pwhash = generate_password_hash('password', method)
+        print(f"{method}:")
+
+        inline = make_hasher(method, 0, 1)
+        count = run_for(args.seconds, 1, lambda: inline.verify(pwhash, 'password'))
+        print(f"  в потоке запроса:   {count / args.seconds:8.1f} входов/с (1 ядро)")
+
+        pooled = make_hasher(method, args.workers, args.queue)
+        pooled.verify(pwhash, 'password')  # запуск процессов пула
+        count = run_for(args.seconds, args.workers * 2, lambda: pooled.verify(pwhash, 'password'))
+        rate = count / args.seconds
+        print(f"  пул {args.workers} проц.:        {rate:8.1f} входов/с, "
+              f"{rate / args.workers:.1f} на ядро")
+
+        rejected = burst(pooled, pwhash, args.queue * 4)
+        if rejected:
+            print(f"  всплеск {args.queue * 4}: отклонено {len(rejected)}, "
+                  f"отказ за {statistics.median(rejected) * 1e6:.0f} мкс (медиана)")
+        else:
+            print(f"  всплеск {args.queue * 4}: отклоненных нет")
+        pooled.shutdown()
+
+
+if __name__ == '__main__':
+    main()
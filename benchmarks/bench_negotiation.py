@@ -0,0 +1,100 @@
+"""Бенчмарк форматов ответа API: байты и CPU на ответ.
+
+Для license_status с --devices устройствами перебираются форматы
+(JSON, MessagePack, CBOR - если установлены) и сжатие (нет, gzip,
+brotli). Для каждой пары печатается размер тела, время CPU на весь
+запрос через тестовый клиент и отдельно на кодирование и сжатие -
+для клиентов на тарифицируемых каналах важнее байты, для сервера - CPU.
+
+    python benchmarks/bench_negotiation.py --devices 20 --iterations 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User, Product, Tariff, License, Device
+from app.negotiation import negotiation, brotli, msgpack, cbor2, JSON, MSGPACK, CBOR
+
+ENCODINGS = [('нет', 'identity'), ('gzip', 'gzip')]
+
+
+def setup(app, devices):
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@bench.local')
+        user.set_password('bench')
+        product = Product(name='Bench')
+        db.session.add_all([user, product])
+        db.session.flush()
+        tariff = Tariff(product_id=product.id, name='Bench', price=10, period_days=30,
+                        max_devices=devices, key_prefix='BEN')
+        db.session.add(tariff)
+        db.session.flush()
+        license = License(key='BEN-BENCH', name='Лицензия для замеров', user_id=user.id,
+                          product_id=product.id, tariff_id=tariff.id)
+        db.session.add(license)
+        db.session.flush()
+        for i in range(devices):
+            db.session.add(Device(license_id=license.id, installation_id=Device.generate_installation_id(),
+                                  name=f'workstation-{i:03d}.corp.example.com', ip_address=f'10.0.{i // 250}.{i % 250}'))
+        db.session.commit()
+        return f'/api/v1/license/{product.id}/{license.key}/status'
+
+
+def cpu_per_call(func, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        PASSWORD_HASH_WORKERS = 0
+
+    app = create_app(BenchConfig)
+    url = setup(app, args.devices)
+    client = app.test_client()
+    data = client.get(url).get_json()
+
+    formats = [('JSON', JSON)]
+    if msgpack is not None:
+        formats.append(('MessagePack', MSGPACK))
+    if cbor2 is not None:
+        formats.append(('CBOR', CBOR))
+    encodings = list(ENCODINGS)
+    if brotli is not None:
+        encodings.append(('brotli', 'br'))
+
+    print(f"license_status, устройств: {args.devices}")
+    print(f"{'формат':>12} {'сжатие':>7} {'байт':>7} {'запрос, мкс CPU':>16} {'кодирование, мкс':>17}")
+    for format_name, mimetype in formats:
+        for encoding_name, encoding in encodings:
+            headers = {'Accept': mimetype, 'Accept-Encoding': encoding}
+            size = len(client.get(url, headers=headers).data)
+            request_cpu = cpu_per_call(lambda: client.get(url, headers=headers), args.iterations)
+
+            with app.test_request_context(url, headers=headers):
+                def encode():
+                    response = app.json.response(data)
+                    negotiation.compress(response)
+                encode_cpu = cpu_per_call(encode, args.iterations)
+            print(f"{format_name:>12} {encoding_name:>7} {size:7d} {request_cpu:16.0f} {encode_cpu:17.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Бенчмарк сценария покупки лицензии: число SQL-запросов и задержка.
+
+Сравнивает прежний поток представления create_license (два commit,
+отдельные get_or_404 для продукта и тарифа) с services.purchase_license
+(один запрос на загрузку, одна транзакция). Каждая итерация имитирует
+отдельный запрос: пользователь загружается заново, сессия закрывается.
+
+    python benchmarks/bench_purchase.py --iterations 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from config import Config
+from app import create_app, db, services
+from app.models import User, Product, Tariff, License, Notification
+
+
+def legacy_purchase(user, product_id, tariff_id, name):
+    """Прежняя логика представления create_license"""
+    product = db.session.get(Product, product_id)
+    tariff = db.session.get(Tariff, tariff_id)
+    if not user.can_afford(tariff.price):
+        return False
+    license = License(
+        key=License.generate_key(tariff.key_prefix),
+        product_id=product.id,
+        tariff_id=tariff.id,
+        user_id=user.id,
+        name=name,
+        valid_until=datetime.utcnow() + timedelta(days=tariff.period_days)
+    )
+    if user.charge(tariff.price, f"Покупка лицензии {license.key}"):
+        db.session.add(license)
+        db.session.commit()
+        db.session.add(Notification(user_id=user.id, title='Лицензия создана',
+                                    message=f'Лицензия "{name}" успешно создана. Ключ: {license.key}'))
+        db.session.commit()
+        return f'Лицензия создана успешно! Ключ: {license.key}'
+    return False
+
+
+def service_purchase(user, product_id, tariff_id, name):
+    return services.purchase_license(user, product_id, tariff_id, name).message
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def run(app, label, flow, iterations, ids):
+    user_id, product_id, tariff_id = ids
+    statements = []
+    counter = {'n': 0}
+
+    def count(*args, **kwargs):
+        counter['n'] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    latencies = []
+    try:
+        for i in range(iterations):
+            with app.app_context():
+                user = db.session.get(User, user_id)
+                counter['n'] = 0
+                started = time.perf_counter()
+                flow(user, product_id, tariff_id, f'{label}-{i}')
+                latencies.append((time.perf_counter() - started) * 1000)
+                statements.append(counter['n'])
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    print(f"{label:>8}: {sum(statements) / len(statements):5.1f} SQL/покупку, "
+          f"p50 {percentile(latencies, 50):6.2f} мс, p99 {percentile(latencies, 99):6.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+            'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@bench.local',
+                    balance=Decimal(10) * args.iterations * 2)
+        product = Product(name='Bench')
+        db.session.add_all([user, product])
+        db.session.flush()
+        tariff = Tariff(product_id=product.id, name='Bench', price=Decimal('10.00'),
+                        period_days=30, max_devices=1, key_prefix='BEN')
+        db.session.add(tariff)
+        db.session.commit()
+        ids = (user.id, product.id, tariff.id)
+
+    run(app, 'legacy', legacy_purchase, args.iterations, ids)
+    run(app, 'service', service_purchase, args.iterations, ids)
+
+
+if __name__ == '__main__':
+    main()
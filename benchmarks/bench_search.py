@@ -0,0 +1,113 @@
+"""Бенчмарк поиска в админке: индекс против полного просмотра.
+
+Заполняет базу --rows лицензиями (у каждой - пользователь и устройство),
+создает индексы поиска (flask init-db) и замеряет search.search() по
+случайным подстрокам ключей, email, IP и installation_id. По умолчанию -
+временная SQLite (FTS5 trigram), и для сравнения те же запросы
+выполняются через LIKE '%...%' без индекса; DATABASE_URL=postgresql://...
+замеряет pg_trgm.
+
+    python benchmarks/bench_search.py --rows 200000 --queries 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from config import Config
+from app import create_app, db, search
+from app.models import User, Product, Tariff, License, Device
+
+
+def populate(rows, batch=10000):
+    product = Product(name='Bench')
+    db.session.add(product)
+    db.session.flush()
+    tariff = Tariff(product_id=product.id, name='Bench', price=10, period_days=30,
+                    max_devices=1, key_prefix='BEN')
+    db.session.add(tariff)
+    db.session.commit()
+    rng = random.Random(1)
+    for start in range(0, rows, batch):
+        ids = range(start + 1, min(rows, start + batch) + 1)
+        db.session.execute(insert(User), [
+            {'id': i, 'username': f'user{i}', 'email': f'user{i}@mail{i % 97}.example', 'balance': 0}
+            for i in ids
+        ])
+        db.session.execute(insert(License), [
+            {'id': i, 'key': f'BEN-{rng.getrandbits(64):016X}', 'name': f'L{i}', 'user_id': i,
+             'product_id': product.id, 'tariff_id': tariff.id}
+            for i in ids
+        ])
+        db.session.execute(insert(Device), [
+            {'id': i, 'license_id': i, 'installation_id': f'{rng.getrandbits(128):032x}', 'name': f'h{i}',
+             'ip_address': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'}
+            for i in ids
+        ])
+        db.session.commit()
+
+
+def samples(count, rows):
+    rng = random.Random(2)
+    needles = []
+    for _ in range(count):
+        row = db.session.get(License, rng.randint(1, rows))
+        device = db.session.get(Device, row.id)
+        value = rng.choice([row.key, row.owner.email, device.ip_address, device.installation_id])
+        start = rng.randint(0, len(value) - 6)
+        needles.append(value[start:start + 6])
+    db.session.remove()
+    return needles
+
+
+def measure(needles):
+    latencies = []
+    for needle in needles:
+        started = time.perf_counter()
+        search.search(needle)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+            'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        PASSWORD_HASH_WORKERS = 0
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        search.install()
+        populate(args.rows)
+        print(f"строк {args.rows}: заполнение с индексом {time.perf_counter() - started:.1f} с")
+        needles = samples(args.queries, args.rows)
+
+        p50, p99 = measure(needles)
+        print(f"{'индекс':>8}: p50 {p50:8.2f} мс, p99 {p99:8.2f} мс")
+
+        if db.engine.dialect.name != 'sqlite':
+            return
+        # Тот же поиск через LIKE без индекса
+        search._fts_ready[str(db.engine.url)] = False
+        p50, p99 = measure(needles)
+        print(f"{'LIKE':>8}: p50 {p50:8.2f} мс, p99 {p99:8.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
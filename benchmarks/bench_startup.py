@@ -0,0 +1,92 @@
+"""Бенчмарк холодного старта воркера: импорт пакета и create_app.
+
+Каждый замер выполняется в отдельном процессе интерпретатора, как
+у свежего воркера gunicorn. Считаются SQL-запросы, выполненные при
+создании приложения (должно быть 0), и для сравнения - прежнее
+поведение, когда create_app сам выполнял flask init-db.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(database, legacy):
+    """Один холодный старт; печатает замеры в JSON"""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from config import Config
+    import app as package
+    imported = time.perf_counter()
+
+    statements = []
+    event.listen(Engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database
+
+    application = package.create_app(BenchConfig)
+    if legacy:
+        from app.cli import init_db
+        with application.app_context():
+            init_db()
+    created = time.perf_counter()
+    print(json.dumps({
+        'import': imported - started,
+        'create_app': created - imported,
+        'queries': len(statements)
+    }))
+
+
+def measure(database, runs, legacy):
+    samples = []
+    for _ in range(runs):
+        args = [sys.executable, os.path.abspath(__file__), '--child', '--database', database]
+        if legacy:
+            args.append('--legacy')
+        output = subprocess.run(args, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def report(title, samples):
+    imports = [s['import'] * 1000 for s in samples]
+    creates = [s['create_app'] * 1000 for s in samples]
+    print(f"{title}:")
+    print(f"  импорт app:  медиана {statistics.median(imports):.1f} мс")
+    print(f"  create_app:  медиана {statistics.median(creates):.1f} мс")
+    print(f"  SQL-запросов при старте: {samples[-1]['queries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database', help='URL БД (по умолчанию временная SQLite)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--legacy', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.database, args.legacy)
+        return
+
+    database = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Схема создается один раз, как при деплое
+    measure(database, 1, legacy=True)
+    report('create_app без обращения к БД', measure(database, args.runs, legacy=False))
+    report('create_app + init-db (прежнее поведение)', measure(database, args.runs, legacy=True))
+
+
+if __name__ == '__main__':
+    main()
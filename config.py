@@ -26,10 +26,161 @@ class Config:
         'pool_pre_ping': True,
     }
 
+    # Реплики для чтения (URL через запятую); пусто - все запросы в основную БД
+    SQLALCHEMY_REPLICA_URIS = [uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                               if uri.strip()]
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_CHECK_INTERVAL = int(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+    REPLICA_READ_YOUR_WRITES = int(os.environ.get('REPLICA_READ_YOUR_WRITES', 10))
+
     # Настройки безопасности
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
     # Настройки лицензий
     LICENSE_KEY_LENGTH = int(os.environ.get('LICENSE_KEY_LENGTH', 25))
+    LICENSE_KEY_CHECKSUM = os.environ.get('LICENSE_KEY_CHECKSUM', '').lower() in ('1', 'true', 'yes')
     INSTALLATION_ID_LENGTH = int(os.environ.get('INSTALLATION_ID_LENGTH', 32))
-    MAX_DEVICES_DEFAULT = int(os.environ.get('MAX_DEVICES_DEFAULT', 5))
\ No newline at end of file
+    MAX_DEVICES_DEFAULT = int(os.environ.get('MAX_DEVICES_DEFAULT', 5))
+
+    # Хэширование паролей: параметры werkzeug, процессы пула (0 - в потоке
+    # запроса) и лимит одновременных задач, сверх которого вход получает 503
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
+    # Живые события (SSE)
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 2.0))
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+    EVENTS_KEEPALIVE = int(os.environ.get('EVENTS_KEEPALIVE', 15))
+    # Сколько последних id уведомлений перечитывать (коммиты не по порядку id)
+    EVENTS_BACKFILL_OVERLAP = int(os.environ.get('EVENTS_BACKFILL_OVERLAP', 100))
+    # За сколько секунд last_seen перечитывать активность устройств
+    EVENTS_DEVICE_OVERLAP = int(os.environ.get('EVENTS_DEVICE_OVERLAP', 30))
+    # Потоков SSE на воркер (0 - половина SERVER_THREADS) и пауза до повтора сверх лимита, с
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 0))
+    EVENTS_BUSY_RETRY = int(os.environ.get('EVENTS_BUSY_RETRY', 30))
+
+    # Планировщик истечения лицензий
+    EXPIRY_SCHEDULER_INTERVAL = int(os.environ.get('EXPIRY_SCHEDULER_INTERVAL', 300))
+    EXPIRY_BATCH_SIZE = int(os.environ.get('EXPIRY_BATCH_SIZE', 500))
+    EXPIRY_NOTIFY_DAYS = int(os.environ.get('EXPIRY_NOTIFY_DAYS', 3))
+
+    # Освобождение неактивных устройств
+    DEVICE_REAPER_INTERVAL = int(os.environ.get('DEVICE_REAPER_INTERVAL', 3600))
+    DEVICE_REAPER_BATCH_SIZE = int(os.environ.get('DEVICE_REAPER_BATCH_SIZE', 500))
+
+    # Пульс устройств и свертки активности
+    HEARTBEAT_RESOLUTION = int(os.environ.get('HEARTBEAT_RESOLUTION', 300))
+    HEARTBEAT_FLUSH_INTERVAL = int(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', 10))
+    HEARTBEAT_BUFFER_SIZE = int(os.environ.get('HEARTBEAT_BUFFER_SIZE', 10000))
+    HEARTBEAT_ROLLUP_INTERVAL = int(os.environ.get('HEARTBEAT_ROLLUP_INTERVAL', 600))
+    # Device.last_seen при проверке лицензии обновляется не чаще, секунды
+    DEVICE_LAST_SEEN_RESOLUTION = int(os.environ.get('DEVICE_LAST_SEEN_RESOLUTION', 60))
+    # Не меньше 48 ч: суточная свертка пересчитывается из сырых точек
+    HEARTBEAT_RAW_RETENTION_HOURS = max(int(os.environ.get('HEARTBEAT_RAW_RETENTION_HOURS', 48)), 48)
+    HEARTBEAT_HOURLY_RETENTION_DAYS = int(os.environ.get('HEARTBEAT_HOURLY_RETENTION_DAYS', 30))
+
+    # Индекс адресов лицензий и поиск передачи ключей: лицензия отмечается,
+    # если за IP_SHARING_WINDOW_HOURS у нее адресов больше max_devices тарифа,
+    # умноженного на IP_SHARING_IPS_PER_DEVICE, или новых адресов больше
+    # max_devices * IP_SHARING_CHURN_PER_DEVICE
+    IP_INDEX_FLUSH_INTERVAL = int(os.environ.get('IP_INDEX_FLUSH_INTERVAL', 10))
+    IP_INDEX_BUFFER_SIZE = int(os.environ.get('IP_INDEX_BUFFER_SIZE', 10000))
+    IP_INDEX_RETENTION_DAYS = int(os.environ.get('IP_INDEX_RETENTION_DAYS', 30))
+    IP_SHARING_INTERVAL = int(os.environ.get('IP_SHARING_INTERVAL', 900))
+    IP_SHARING_WINDOW_HOURS = int(os.environ.get('IP_SHARING_WINDOW_HOURS', 24))
+    IP_SHARING_IPS_PER_DEVICE = int(os.environ.get('IP_SHARING_IPS_PER_DEVICE', 3))
+    IP_SHARING_CHURN_PER_DEVICE = int(os.environ.get('IP_SHARING_CHURN_PER_DEVICE', 2))
+    IP_SHARING_LICENSES_PER_IP = int(os.environ.get('IP_SHARING_LICENSES_PER_IP', 5))
+
+    # Кэш: memory (LRU в процессе) или socket (общий демон, flask cache serve)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_SOCKET_PATH = os.environ.get('CACHE_SOCKET_PATH', '/tmp/licensepro-cache.sock')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    CACHE_LOCK_TIMEOUT = int(os.environ.get('CACHE_LOCK_TIMEOUT', 10))
+
+    # Кэш идентичности текущего пользователя (user_loader), секунды
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # Кэш фрагментов шаблонов (dashboard, страницы продукта и лицензии), секунды
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+    # Статика с отпечатками (flask assets build): префикс URL и срок кэша, секунды
+    ASSETS_URL_PREFIX = os.environ.get('ASSETS_URL_PREFIX', '/assets')
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+
+    # Сжатие ответов API (brotli/gzip по Accept-Encoding) от этого размера, байты;
+    # формат ответа (JSON, MessagePack, CBOR) выбирается по Accept
+    API_COMPRESS_MIN_SIZE = int(os.environ.get('API_COMPRESS_MIN_SIZE', 512))
+    API_GZIP_LEVEL = 6
+    API_BROTLI_QUALITY = 5
+
+    # Вебхуки: проход доставки раз в WEBHOOK_INTERVAL секунд, пул потоков,
+    # пачки событий на адрес; после WEBHOOK_MAX_ATTEMPTS попыток - dead-letter
+    WEBHOOK_INTERVAL = int(os.environ.get('WEBHOOK_INTERVAL', 5))
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 8))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 100))
+    WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 10))
+    WEBHOOK_BACKOFF_BASE = int(os.environ.get('WEBHOOK_BACKOFF_BASE', 30))
+    WEBHOOK_RETENTION_DAYS = int(os.environ.get('WEBHOOK_RETENTION_DAYS', 7))
+
+    # Журнал аудита: записи копятся в памяти и пишутся пачкой раз в
+    # AUDIT_FLUSH_INTERVAL секунд или при заполнении буфера
+    AUDIT_FLUSH_INTERVAL = int(os.environ.get('AUDIT_FLUSH_INTERVAL', 2))
+    AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', 1000))
+
+    # Шина инвалидации кэша между воркерами: auto, postgres, socket, none
+    INVALIDATION_TRANSPORT = os.environ.get('INVALIDATION_TRANSPORT', 'auto')
+    INVALIDATION_SOCKET_DIR = os.environ.get('INVALIDATION_SOCKET_DIR', '/tmp/licensepro-invalidation')
+    INVALIDATION_COALESCE_MS = int(os.environ.get('INVALIDATION_COALESCE_MS', 50))
+    INVALIDATION_MAX_IDS = int(os.environ.get('INVALIDATION_MAX_IDS', 500))
+
+    # Сервер (python -m app.server): gunicorn, при его отсутствии uvicorn;
+    # SERVER_WORKERS = 0 - по числу CPU и SERVER_WORKERS_PER_CPU
+    SERVER_BACKEND = os.environ.get('SERVER_BACKEND', 'auto')
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0))
+    SERVER_WORKERS_PER_CPU = 2
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 30))
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 0))
+
+    # Разделы приложения, подключаемые на узле
+    BLUEPRINTS = ('auth', 'main', 'api', 'admin')
+
+
+class ApiNodeConfig(Config):
+    """Узел только для клиентского API: короткие запросы, много воркеров"""
+    BLUEPRINTS = ('api',)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 15))
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 30))
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 20000))
+
+
+class AdminNodeConfig(Config):
+    """Узел веб-интерфейса и админки: потоки SSE живут долго"""
+    BLUEPRINTS = ('auth', 'main', 'admin')
+    SERVER_WORKERS_PER_CPU = 0.5
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 32))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 60))
+
+
+PROFILES = {
+    'default': Config,
+    'api': ApiNodeConfig,
+    'admin': AdminNodeConfig,
+}
+
+
+def get_config(profile=None):
+    """Класс конфигурации по имени профиля (по умолчанию APP_PROFILE)"""
+    profile = profile or os.environ.get('APP_PROFILE') or 'default'
+    if profile not in PROFILES:
+        raise ValueError(f"Неизвестный профиль {profile}. Доступны: {', '.join(PROFILES)}")
+    return PROFILES[profile]
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""Клиент API LicensePro: проверка лицензии из продукта.
+
+Синхронный LicenseClient на requests для продукта и AsyncLicenseClient
+на aiohttp для шлюзов, проверяющих много установок; кэш вердикта на
+диске и расписание проверок общие для клиентов пакета.
+"""
+from licensepro_client.aio import AsyncLicenseClient, LatencyStats
+from licensepro_client.cache import Verdict, VerdictCache
+from licensepro_client.client import LicenseClient, LicenseClientError, LEAN_FIELDS
+from licensepro_client.schedule import Schedule
+
+__all__ = ['LicenseClient', 'AsyncLicenseClient', 'LatencyStats', 'LicenseClientError',
+           'Verdict', 'VerdictCache', 'Schedule', 'LEAN_FIELDS']
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import socket
+import time
+from collections import deque
+from licensepro_client.cache import Verdict
+from licensepro_client.client import (LEAN_FIELDS, RETRY_STATUSES, DEFINITIVE_STATUSES, USER_AGENT,
+                                      LicenseClientError)
+from licensepro_client.schedule import Schedule, parse_retry_after
+
+try:
+    import aiohttp
+except ImportError:  # нужен только для AsyncLicenseClient: pip install aiohttp
+    aiohttp = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class LatencyStats:
+    """Задержки вызовов по операциям: последние samples значений на операцию"""
+
+    def __init__(self, samples=10000):
+        self.samples = samples
+        self._latencies = {}
+        self._counts = {}
+
+    def record(self, operation, seconds, ok):
+        self._latencies.setdefault(operation, deque(maxlen=self.samples)).append(seconds)
+        counts = self._counts.setdefault(operation, {'calls': 0, 'errors': 0, 'coalesced': 0})
+        counts['calls'] += 1
+        if not ok:
+            counts['errors'] += 1
+
+    def coalesced(self, operation):
+        self._counts.setdefault(operation, {'calls': 0, 'errors': 0, 'coalesced': 0})['coalesced'] += 1
+
+    def report(self):
+        """{операция: calls, errors, coalesced, p50/p95/p99/max в мс}"""
+        result = {}
+        for operation, counts in self._counts.items():
+            values = sorted(self._latencies.get(operation, ()))
+            row = dict(counts)
+            for name, pct in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+                row[name] = values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000 if values else None
+            result[operation] = row
+        return result
+
+
+class AsyncLicenseClient:
+    """Асинхронный клиент для шлюзов, проверяющих лицензии многих установок.
+
+    Все вызовы идут через одну aiohttp-сессию с пулом из max_connections
+    keep-alive соединений; одновременно выполняется не больше concurrency
+    вызовов. Одинаковые вызовы (тот же ключ и installation_id), пришедшие,
+    пока первый еще выполняется, получают его результат без нового
+    запроса. У каждого вызова - общий таймаут timeout секунд, включая
+    повторы временных ошибок. Задержки - в stats.report().
+
+        async with AsyncLicenseClient('https://licenses.example.com') as client:
+            verdicts = await client.check_many([(1, 'PRO-...', 'installation-id'), ...])
+    """
+
+    def __init__(self, base_url, max_connections=64, concurrency=256, timeout=10, max_retries=2,
+                 backoff_base=0.2, backoff_max=5.0, fields=LEAN_FIELDS, session=None, schedule=None):
+        if aiohttp is None and session is None:
+            raise RuntimeError('Для AsyncLicenseClient нужен aiohttp: pip install aiohttp')
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.fields = list(fields) if fields else None
+        self.schedule = schedule or Schedule(backoff_base=backoff_base, backoff_max=backoff_max)
+        self.stats = LatencyStats()
+        self._session = session
+        # Создается в первом вызове: в Python 3.8-3.9 семафор привязывается
+        # к циклу событий при создании, а клиент могут собрать вне цикла
+        self._semaphore = None
+        self._inflight = {}
+        self._etags = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            accept = 'application/msgpack, application/json;q=0.9' if msgpack else 'application/json'
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers={'Accept': accept, 'User-Agent': USER_AGENT}
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # Общая часть вызовов
+
+    def _url(self, product_id, key, suffix=''):
+        return f"{self.base_url}/api/v1/license/{product_id}/{key}{suffix}"
+
+    async def _call(self, operation, coalesce_key, func, on_timeout=None):
+        """Выполнить func() с объединением дубликатов, лимитом и таймаутом"""
+        future = self._inflight.get(coalesce_key)
+        if future is not None:
+            self.stats.coalesced(operation)
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(self._timed(operation, func, on_timeout))
+        self._inflight[coalesce_key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(coalesce_key, None))
+        return await asyncio.shield(future)
+
+    async def _timed(self, operation, func, on_timeout):
+        ok = False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            # Задержка считается от получения слота: ожидание в очереди не входит
+            started = time.perf_counter()
+            try:
+                try:
+                    result = await asyncio.wait_for(func(), self.timeout)
+                except asyncio.TimeoutError:
+                    if on_timeout is None:
+                        raise LicenseClientError(f'Таймаут {self.timeout} с')
+                    return on_timeout()
+                ok = not isinstance(result, Verdict) or not result.offline
+                return result
+            finally:
+                self.stats.record(operation, time.perf_counter() - started, ok)
+
+    async def _request(self, method, url, **kwargs):
+        """(статус, заголовки, данные) с повторами; (None, {}, {}), если ответа нет"""
+        result = (None, {}, {})
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.schedule.backoff(attempt, retry_after))
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    body = await response.read()
+                    result = (response.status, response.headers, _decode(response, body))
+            except aiohttp.ClientError:
+                result = (None, {}, {})
+                continue
+            retry_after = parse_retry_after(result[1].get('Retry-After'))
+            if result[0] not in RETRY_STATUSES:
+                break
+        return result
+
+    # API
+
+    async def register(self, product_id, key, hostname=None):
+        """Зарегистрировать установку; возвращает installation_id"""
+        hostname = hostname or socket.gethostname()
+        url = f"{self.base_url}/api/v1/device/{product_id}/{key}/register"
+
+        async def register():
+            status, _, data = await self._request('POST', url, json={'hostname': hostname})
+            if status != 200:
+                raise LicenseClientError(data.get('error') or 'Сервер лицензий недоступен', status)
+            return data['installation_id']
+
+        return await self._call('register', ('register', product_id, key, hostname), register)
+
+    async def check(self, product_id, key, installation_id):
+        """Вердикт по установке; при недоступности сервера - Verdict(offline=True)"""
+        payload = {'installation_id': installation_id}
+        if self.fields:
+            payload['fields'] = self.fields
+
+        async def check():
+            status, _, data = await self._request('POST', self._url(product_id, key), json=payload)
+            now = time.time()
+            if status == 200:
+                return Verdict(True, (data.get('license') or {}).get('valid_until'), None, now, False)
+            if status in DEFINITIVE_STATUSES:
+                return Verdict(False, None, data.get('error') or f'HTTP {status}', now, False)
+            return unavailable()
+
+        def unavailable():
+            return Verdict(False, None, 'Сервер лицензий недоступен', None, True)
+
+        return await self._call('check', ('check', product_id, key, installation_id), check, unavailable)
+
+    async def status(self, product_id, key):
+        """Полный статус лицензии; неизменившийся ответ берется из памяти по ETag"""
+        cache_key = (product_id, key)
+
+        async def status():
+            cached = self._etags.get(cache_key)
+            headers = {'If-None-Match': cached[0]} if cached else {}
+            code, response_headers, data = await self._request(
+                'GET', self._url(product_id, key, '/status'), headers=headers
+            )
+            if code == 304 and cached:
+                return cached[1]
+            if code != 200:
+                raise LicenseClientError(data.get('error') or 'Сервер лицензий недоступен', code)
+            if response_headers.get('ETag'):
+                self._etags[cache_key] = (response_headers['ETag'], data)
+            return data
+
+        return await self._call('status', ('status', product_id, key), status)
+
+    async def check_many(self, installs):
+        """Проверить [(product_id, key, installation_id), ...]; вердикты в том же порядке"""
+        return await asyncio.gather(*(self.check(*install) for install in installs))
+
+
+def _decode(response, body):
+    if not body:
+        return {}
+    try:
+        if response.content_type == 'application/msgpack' and msgpack:
+            return msgpack.unpackb(body)
+        return json.loads(body)
+    except ValueError:
+        return {}
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# Вердикт проверки лицензии; checked_at - Unix-время ответа сервера,
+# offline - вердикт взят из кэша, потому что сервер недоступен
+Verdict = namedtuple('Verdict', ('valid', 'valid_until', 'error', 'checked_at', 'offline'))
+
+
+class VerdictCache:
+    """Последний ответ сервера и installation_id на диске.
+
+    Файл пишется атомарно (временный файл + rename), поэтому сбой
+    посреди записи не оставляет поврежденного кэша. Кэш - удобство для
+    работы без сети, а не защита: содержимое файла не подписано.
+    """
+
+    def __init__(self, directory, product_id, license_key):
+        self.directory = directory
+        digest = hashlib.sha256(f'{product_id}:{license_key}'.encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, f'licensepro-{digest}.json') if directory else None
+
+    def load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, **values):
+        if self.path is None:
+            return
+        state = self.load()
+        state.update(values)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.licensepro-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def verdict(self):
+        data = self.load().get('verdict')
+        if not data:
+            return None
+        return Verdict(data['valid'], data.get('valid_until'), data.get('error'), data['checked_at'], False)
+
+    def store_verdict(self, verdict):
+        self.save(verdict={
+            'valid': verdict.valid,
+            'valid_until': verdict.valid_until,
+            'error': verdict.error,
+            'checked_at': verdict.checked_at,
+        })
+
+    def offline_verdict(self, grace_period, now=None):
+        """Последний положительный вердикт, если он моложе grace_period секунд"""
+        verdict = self.verdict()
+        now = now if now is not None else time.time()
+        if verdict is None or not verdict.valid or now - verdict.checked_at > grace_period:
+            return None
+        # Срок лицензии мог закончиться, пока сервер недоступен
+        # (valid_until от сервера - UTC без часового пояса)
+        expired = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        if verdict.valid_until and datetime.fromisoformat(verdict.valid_until) < expired:
+            return None
+        return verdict._replace(offline=True)
@@ -0,0 +1,200 @@
+import os
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from licensepro_client.cache import Verdict, VerdictCache
+from licensepro_client.schedule import Schedule, parse_retry_after
+
+try:
+    import msgpack
+except ImportError:  # без msgpack клиент работает с JSON
+    msgpack = None
+
+# Поля, достаточные для решения о запуске: сервер не считает устройства
+# и не ищет владельца (см. fields в API проверки лицензии)
+LEAN_FIELDS = ('valid', 'license.valid_until')
+# Временные ответы: повторяем с задержкой, вердикт не меняется
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Окончательные ответы сервера о лицензии или устройстве
+DEFINITIVE_STATUSES = (400, 403, 404)
+USER_AGENT = 'licensepro-client/1.0'
+
+
+class LicenseClientError(Exception):
+    """Сервер отклонил запрос (регистрация, статус) или недоступен"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LicenseClient:
+    """Клиент API лицензий для встраивания в продукт.
+
+    Одна requests.Session с пулом соединений на все запросы. Последний
+    вердикт сервера хранится на диске (cache_dir): если сервер недоступен,
+    check() возвращает сохраненный положительный вердикт в пределах
+    grace_period секунд. run() проверяет лицензию по Schedule - со
+    случайным сдвигом старта, джиттером и экспоненциальной задержкой
+    после ошибок с учетом Retry-After.
+
+        client = LicenseClient('https://licenses.example.com', 1, 'PRO-...', cache_dir='~/.myapp')
+        client.register()
+        if not client.check().valid:
+            ...
+    """
+
+    def __init__(self, base_url, product_id, license_key, installation_id=None, cache_dir=None,
+                 grace_period=72 * 3600, interval=3600, jitter=0.1, timeout=10, max_retries=2,
+                 backoff_base=1.0, backoff_max=300.0, fields=LEAN_FIELDS, pool_size=4,
+                 session=None, schedule=None):
+        self.base_url = base_url.rstrip('/')
+        self.product_id = product_id
+        self.license_key = license_key
+        self.grace_period = grace_period
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.fields = list(fields) if fields else None
+        self.schedule = schedule or Schedule(interval, jitter, backoff_base, backoff_max)
+        if cache_dir:
+            cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.cache = VerdictCache(cache_dir, product_id, license_key)
+        self.installation_id = installation_id or self.cache.load().get('installation_id')
+        self.retry_after = None
+        self._status = None
+        self._etag = None
+        self._stop = threading.Event()
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        accept = 'application/msgpack, application/json;q=0.9' if msgpack else 'application/json'
+        self.session.headers.update({'Accept': accept, 'User-Agent': USER_AGENT})
+
+    # HTTP
+
+    def _url(self, suffix=''):
+        return f"{self.base_url}/api/v1/license/{self.product_id}/{self.license_key}{suffix}"
+
+    def _request(self, method, url, **kwargs):
+        """Запрос с повторами временных ошибок; None, если сервер так и не ответил"""
+        kwargs.setdefault('timeout', self.timeout)
+        response = None
+        self.retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._stop.wait(self.schedule.backoff(attempt, self.retry_after))
+                if self._stop.is_set():
+                    break
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                response = None
+                continue
+            self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+        return response
+
+    def _decode(self, response):
+        if response is None or response.status_code == 304 or not response.content:
+            return {}
+        try:
+            if response.headers.get('Content-Type', '').startswith('application/msgpack') and msgpack:
+                return msgpack.unpackb(response.content)
+            return response.json()
+        except ValueError:  # в т.ч. ошибки разбора msgpack
+            return {}
+
+    # API
+
+    def register(self, hostname=None):
+        """Зарегистрировать устройство; installation_id сохраняется в кэше"""
+        url = f"{self.base_url}/api/v1/device/{self.product_id}/{self.license_key}/register"
+        response = self._request('POST', url, json={'hostname': hostname or socket.gethostname()})
+        data = self._decode(response)
+        if response is None or response.status_code != 200:
+            raise LicenseClientError(data.get('error') or 'Сервер лицензий недоступен',
+                                     response.status_code if response is not None else None)
+        self.installation_id = data['installation_id']
+        self.cache.save(installation_id=self.installation_id)
+        return self.installation_id
+
+    def check(self):
+        """Проверить лицензию; при недоступности сервера - вердикт из кэша"""
+        if not self.installation_id:
+            raise LicenseClientError('Устройство не зарегистрировано')
+        payload = {'installation_id': self.installation_id}
+        if self.fields:
+            payload['fields'] = self.fields
+        response = self._request('POST', self._url(), json=payload)
+        data = self._decode(response)
+        now = time.time()
+
+        if response is not None and response.status_code == 200:
+            verdict = Verdict(True, (data.get('license') or {}).get('valid_until'), None, now, False)
+        elif response is not None and response.status_code in DEFINITIVE_STATUSES:
+            verdict = Verdict(False, None, data.get('error') or f'HTTP {response.status_code}', now, False)
+        else:
+            cached = self.cache.offline_verdict(self.grace_period, now)
+            if cached is not None:
+                return cached
+            return Verdict(False, None, 'Сервер лицензий недоступен', None, True)
+        self.cache.store_verdict(verdict)
+        return verdict
+
+    def status(self):
+        """Полный статус лицензии; неизменившийся ответ сервер отдает как 304"""
+        headers = {'If-None-Match': self._etag} if self._etag else {}
+        response = self._request('GET', self._url('/status'), headers=headers)
+        if response is not None and response.status_code == 304 and self._status is not None:
+            return self._status
+        data = self._decode(response)
+        if response is None or response.status_code != 200:
+            raise LicenseClientError(data.get('error') or 'Сервер лицензий недоступен',
+                                     response.status_code if response is not None else None)
+        self._status, self._etag = data, response.headers.get('ETag')
+        return data
+
+    # Фоновая проверка
+
+    def run(self, callback=None):
+        """Проверять лицензию по расписанию до stop() или окончательного отказа.
+
+        callback(verdict) вызывается после каждой проверки; возвращается
+        последний вердикт.
+        """
+        self._stop.clear()
+        failures = 0
+        verdict = None
+        delay = self.schedule.first()
+        while not self._stop.wait(delay):
+            verdict = self.check()
+            if callback is not None:
+                callback(verdict)
+            if not verdict.valid and not verdict.offline:
+                break
+            if verdict.offline:
+                failures += 1
+                delay = self.schedule.backoff(failures, self.retry_after)
+            else:
+                failures = 0
+                delay = self.schedule.next()
+        return verdict
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.stop()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
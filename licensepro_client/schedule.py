@@ -0,0 +1,56 @@
+import random
+
+
+class Schedule:
+    """Расписание проверок лицензии для парка клиентов.
+
+    - первая проверка откладывается на случайную долю интервала, чтобы
+      клиенты, запущенные одновременно, не шли на сервер в одну секунду;
+    - следующие - через interval ± jitter (доля интервала);
+    - после ошибок - экспоненциальная задержка с полным джиттером
+      (random(0, min(backoff_max, backoff_base * 2^n))), но не меньше
+      Retry-After сервера.
+    """
+
+    def __init__(self, interval=3600, jitter=0.1, backoff_base=1.0, backoff_max=300.0,
+                 splay=True, rng=None):
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.splay = splay
+        self.rng = rng or random.Random()
+
+    def first(self):
+        """Задержка перед первой проверкой после запуска"""
+        return self.rng.uniform(0, self.interval) if self.splay else 0.0
+
+    def next(self):
+        """Задержка до следующей плановой проверки"""
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + self.rng.uniform(-spread, spread))
+
+    def backoff(self, failures, retry_after=None):
+        """Задержка перед повтором после failures неудач подряд (failures >= 1)"""
+        cap = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+        delay = self.rng.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def parse_retry_after(value):
+    """Retry-After в секундах (число или HTTP-дата); None, если нет или не разобран"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    from datetime import datetime, timezone
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
@@ -3,4 +3,9 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # Локальный запуск: схема и администратор создаются сразу
+    # (в production - командой flask init-db)
+    from app.cli import init_db
+    with app.app_context():
+        init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file